@@ -144,6 +144,14 @@ function [files_in,files_out,opt] = niak_brick_stability_tseries(files_in,files_
 %           of options depends on CLUSTERING.TYPE:
 %              'hierarchical' : see NIAK_HIERARCHICAL_CLUSTERING
 %
+%   ENGINE
+%       (string, default 'octave') where the samples are clustered, 
+%       'octave' or 'python'. See OPT.ENGINE in NIAK_STABILITY_TSERIES.
+%
+%   NB_WORKERS
+%       (integer, default 1) the number of processes of the 'python' 
+%       engine.
+%
 %   FLAG_TEST
 %       (boolean, default 0) if the flag is 1, then the function does not
 %       do anything but update the defaults of FILES_IN, FILES_OUT and OPT.
@@ -221,8 +229,8 @@ if ~ischar(files_out)
 end
 
 %% Options
-list_fields   = { 'name_data' , 'rand_seed' , 'normalize' , 'nb_samps' , 'scale_grid' , 'nb_classes' , 'clustering' , 'consensus' , 'sampling' , 'flag_verbose' , 'flag_test'  };
-list_defaults = { 'tseries'   , []          , struct()    , 100        , []           , []           , struct()     , struct()    , struct()   , true           , false        };
+list_fields   = { 'name_data' , 'rand_seed' , 'normalize' , 'nb_samps' , 'scale_grid' , 'nb_classes' , 'clustering' , 'consensus' , 'sampling' , 'engine' , 'nb_workers' , 'flag_verbose' , 'flag_test'  };
+list_defaults = { 'tseries'   , []          , struct()    , 100        , []           , []           , struct()     , struct()    , struct()   , 'octave' , 1            , true           , false        };
 opt = psom_struct_defaults(opt,list_fields,list_defaults);
 
 if isempty(opt.scale_grid) && isempty(opt.nb_classes)
@@ -203,8 +203,8 @@ for num_f = 1:nb_fmri
         fprintf('Reading fMRI dataset %s ...\n',files_in.fmri{num_f});
     end
     [hdr,vol] = niak_read_vol(files_in.fmri{num_f});
-    if isfield(hdr,'extra')&&isfield(hdr.extra,'mask_scubbing')
-        vol = vol(:,:,:,~hdr.extra.mask_scubbing);
+    if isfield(hdr,'extra')&&isfield(hdr.extra,'mask_scrubbing')
+        vol = vol(:,:,:,~hdr.extra.mask_scrubbing);
     end
     [nx,ny,nz,nt] = size(vol);
     for num_m = 1:nb_mask
@@ -0,0 +1,170 @@
+function [files_in,files_out,opt] = niak_brick_connectome_batch(files_in,files_out,opt)
+% Generate the connectomes of many subjects in one pass, with pyniak.connectome
+%
+% SYNTAX:
+% [FILES_IN,FILES_OUT,OPT] = NIAK_BRICK_CONNECTOME_BATCH(FILES_IN,FILES_OUT,OPT)
+%
+% _________________________________________________________________________
+% INPUTS:
+%
+% FILES_IN
+%   (structure) with the following fields :
+%
+%   FMRI.(SUBJECT)
+%      (string, cell of strings or structure) the fMRI datasets of a subject.
+%      A structure is organized by session and run, FMRI.(SUBJECT).(SESSION).(RUN).
+%
+%   MASK
+%      (string) a brain parcellation, in the same space and spatial grid as
+%      the fMRI datasets.
+%
+% FILES_OUT
+%   (string) a HDF5 file with the following datasets:
+%
+%   CONN
+%      (array subjects x connections) the vectorized connectome of each subject,
+%      averaged over its datasets, like CONN in NIAK_BRICK_CONNECTOME.
+%
+%   SUBJECTS
+%      (strings) the subject of each row of CONN.
+%
+%   IND_ROI
+%      (vector) the regions of the mask, see NIAK_BRICK_CONNECTOME.
+%
+%   FAILED
+%      (strings) the subjects whose connectome could not be computed. Their
+%      row in CONN is NaN, and the brick fails once the other subjects are
+%      written.
+%
+%   and the attributes TYPE and CODE, see NIAK_BRICK_CONNECTOME.
+%
+% OPT
+%   (structure) with the following fields:
+%
+%   TYPE
+%      (string, default 'AZ') the type of connectome, see OPT.TYPE in
+%      NIAK_BRICK_CONNECTOME.
+%
+%   NB_THREADS
+%      (integer, default 4) the number of subjects computed at once.
+%
+%   FLAG_TEST
+%      (boolean, default: 0) if FLAG_TEST equals 1, the brick does not do
+%      anything but update the default values in FILES_IN, FILES_OUT and
+%      OPT.
+%
+%   FLAG_VERBOSE
+%      (boolean, default: 1) If FLAG_VERBOSE == 1, write messages
+%      indicating progress.
+%
+% _________________________________________________________________________
+% OUTPUTS:
+%
+% The structures FILES_IN, FILES_OUT and OPT are updated with default
+% values. If OPT.FLAG_TEST == 0, the specified outputs are written.
+%
+% _________________________________________________________________________
+% SEE ALSO:
+% NIAK_BRICK_CONNECTOME, NIAK_PIPELINE_CONNECTOME
+%
+% _________________________________________________________________________
+% COMMENTS:
+%
+% The connectomes are the same as NIAK_BRICK_CONNECTOME, and the scrubbed
+% volumes are removed in the same way. The mask is read once, and the
+% subjects are computed by util/pyniak/connectome.py, with the command
+% GB_NIAK.CMD_PYTHON (see NIAK_GB_VARS).
+%
+% The fMRI datasets can be nifti (.nii, .nii.gz) or MINC2 (.mnc, .mnc.gz)
+% files. MINC1 files are not supported: the brick fails instead of writing
+% NaN rows. They can be converted with mincconvert -2.
+%
+% _________________________________________________________________________
+% Copyright (c) The NIAK contributors, 2026.
+% Maintainer : pierre.bellec@criugm.qc.ca
+% See licensing information in the code.
+% Keywords : medical imaging, connectome, fMRI
+%
+% Permission is hereby granted, free of charge, to any person obtaining a copy
+% of this software and associated documentation files (the "Software"), to deal
+% in the Software without restriction, including without limitation the rights
+% to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+% copies of the Software, and to permit persons to whom the Software is
+% furnished to do so, subject to the following conditions:
+%
+% The above copyright notice and this permission notice shall be included in
+% all copies or substantial portions of the Software.
+%
+% THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+% IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+% FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+% AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+% LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+% OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+% THE SOFTWARE.
+
+niak_gb_vars
+
+%% Defaults
+
+% FILES_IN
+list_fields    = { 'fmri' , 'mask' };
+list_defaults  = { NaN    , NaN    };
+files_in = psom_struct_defaults(files_in,list_fields,list_defaults);
+
+if ~isstruct(files_in.fmri)
+    error('FILES_IN.FMRI should be a structure')
+end
+
+if ~ischar(files_in.mask)
+    error('FILES_IN.MASK should be a string')
+end
+
+% FILES_OUT
+if ~ischar(files_out)
+    error('FILES_OUT should be a string')
+end
+
+% OPTIONS
+list_fields      = { 'type' , 'nb_threads' , 'flag_test' , 'flag_verbose' };
+list_defaults    = { 'AZ'   , 4            , false       , true           };
+if nargin<3
+    opt = struct();
+end
+opt = psom_struct_defaults(opt,list_fields,list_defaults);
+
+if ~ismember(opt.type,{'S','R','Z','U','P','A','AZ'})
+    error('%s is an unknown type of connectome',opt.type)
+end
+
+if opt.flag_test == 1
+    return
+end
+
+%% The brick starts here
+
+% The subjects and their runs, one per line
+list_subject = fieldnames(files_in.fmri);
+file_subjects = niak_file_tmp('_subjects.tsv');
+hf = fopen(file_subjects,'w');
+for num_s = 1:length(list_subject)
+    subject = list_subject{num_s};
+    files_fmri = psom_files2cell(files_in.fmri.(subject));
+    for num_f = 1:length(files_fmri)
+        fprintf(hf,'%s\t%s\n',subject,files_fmri{num_f});
+    end
+end
+fclose(hf);
+
+if opt.flag_verbose
+    fprintf('Generating ''%s'' connectomes of %i subjects with pyniak.connectome ...\n',opt.type,length(list_subject));
+end
+[status,msg] = system(sprintf('%s -m pyniak.connectome "%s" "%s" "%s" --type %s -n %i', ...
+                              GB_NIAK.cmd_python,file_subjects,files_in.mask,files_out,opt.type,opt.nb_threads));
+delete(file_subjects);
+if opt.flag_verbose
+    fprintf('%s',msg);
+end
+if status ~= 0
+    error('pyniak.connectome failed:\n%s',msg);
+end
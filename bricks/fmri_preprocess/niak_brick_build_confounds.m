@@ -64,6 +64,8 @@ function [files_in,files_out,opt]=niak_brick_build_confounds(files_in,files_out,
 %   COMPCOR
 %      (structure) the options of the COMPCOR method. See the OPT argument
 %      of NIAK_COMPCOR.
+%      Use OPT.COMPCOR.SVD.FLAG_RAND = true to estimate the components with
+%      a randomized truncated SVD (faster on long runs).
 %
 %   THRE_FD
 %      (scalar, default 0.5) the maximal acceptable framewise displacement 
@@ -11,7 +11,8 @@ function [files_in,files_out,opt]=niak_brick_regress_confounds(files_in,files_ou
 %   (structure) with the following fields:
 %
 %   FMRI 
-%      (string) the fmri time-series
+%      (string) the fmri time-series, either a 3D+t volume or the folder
+%      of a store of time series (.tss extension, see NIAK_VOL2STORE).
 %
 %   CONFOUNDS
 %      (string) the name of a file with (compressed) tab-separated values. 
@@ -21,6 +22,7 @@ function [files_in,files_out,opt]=niak_brick_regress_confounds(files_in,files_ou
 % FILES_OUT 
 %      (string, default FOLDER_OUT/<base FMRI>_cor.<ext FMRI>) the name 
 %      of a 3D+t file. Same as FMRI with the confounds regressed out.
+%      If FMRI is a store, FILES_OUT can be a store (.tss) or a volume.
 %
 % OPT 
 %
@@ -94,6 +96,12 @@ function [files_in,files_out,opt]=niak_brick_regress_confounds(files_in,files_ou
 %   Note that the scrubbing is based solely on the FD index, and that DVARS is not
 %   derived. The paper of Power et al. included both indices.
 %
+% If FMRI is a store of time series, the confounds are regressed from one
+% block of voxels at a time. The regression is done voxel by voxel, so the
+% results are the same as with the volume the store was built from. Only
+% a store in FILTERED_DATA keeps the memory bounded: a volume is assembled
+% in memory, in single precision, before it is written.
+%
 % For a description of the COMPCOR method:
 %
 %   Behzadi, Y., Restom, K., Liau, J., Liu, T. T., Aug. 2007. A component based 
@@ -149,6 +157,7 @@ list_defaults  = { false          , 40           , true             , 0.5
 opt = psom_struct_defaults(opt,list_fields,list_defaults);
 
 [path_f,name_f,ext_f] = niak_fileparts(files_in.fmri);
+flag_store = strcmp(ext_f,'.tss');
 
 if isempty(opt.folder_out)
     opt.folder_out = path_f;
@@ -170,8 +179,13 @@ end
 if opt.flag_verbose
     fprintf('Reading the fMRI dataset ...\n%s\n',files_in.fmri);
 end
-[hdr_vol,vol] = niak_read_vol(files_in.fmri); % fMRI dataset
-y = reshape(vol,[size(vol,1)*size(vol,2)*size(vol,3) size(vol,4)])'; % organize the fMRI dataset as a time x space array
+if flag_store
+    store = niak_read_store(files_in.fmri); % the time series are read block by block when regressing the confounds
+    hdr_vol = store.hdr;
+else
+    [hdr_vol,vol] = niak_read_vol(files_in.fmri); % fMRI dataset
+    y = reshape(vol,[size(vol,1)*size(vol,2)*size(vol,3) size(vol,4)])'; % organize the fMRI dataset as a time x space array
+end
 
 %% Read the confounds
 if opt.flag_verbose
@@ -313,27 +327,23 @@ if ~isempty(x2)
         fprintf('Regressing the confounds...\n    Total number of confounds: %i\n    Total number of time points for regression: %i\n',size(x,2),sum(~mask_scrubbing))
     end
     
-    %% Normalize data
-    y_mean = mean(y(~mask_scrubbing,:),1); % Exclude time points with excessive motion to estimate mean/std
-    y_std  =  std(y(~mask_scrubbing,:),[],1);
-    y = (y-repmat(y_mean,[size(y,1),1]))./repmat(y_std,[size(y,1) 1]);
+    %% Normalize confounds
     x2_mean = mean(x2(~mask_scrubbing,:),1); % Exclude time points with excessive motion to estimate mean/std
     x2_std = std(x2(~mask_scrubbing,:),[],1);
     x2 = (x2-repmat(x2_mean,[size(x2,1),1]))./repmat(x2_std,[size(x2,1) 1]);
 
-    %% Run the regression
-    model.y = y(~mask_scrubbing,:);
-    model.x = x2(~mask_scrubbing,:);
-    opt_glm.flag_beta = true;
-    res = niak_glm(model,opt_glm); % Run the regression excluding time points with excessive motion
-    y = y - x2*res.beta; % Generate the residuals for all time points combined
-    y = y + repmat(y_mean,[size(y,1) 1]); % put the mean back in the time series
-    vol_denoised = reshape(y',size(vol));
+    %% Run the regression (a store is processed when it is saved)
+    if ~flag_store
+        y = sub_regress(y,x2,mask_scrubbing);
+        vol_denoised = reshape(y',size(vol));
+    end
     
 else
 
     warning('Found no confounds to regress! Leaving the dataset as is')
-    vol_denoised = vol;
+    if ~flag_store
+        vol_denoised = vol;
+    end
 
 end
     
@@ -348,10 +358,62 @@ if ~strcmp(files_out.filtered_data,'gb_niak_omitted')
         hdr_vol.extra.confounds = x2;
         hdr_vol.extra.labels_confounds = labels(:);
     end
-    niak_write_vol(hdr_vol,vol_denoised);
+    if flag_store
+        sub_regress_store(files_in.fmri,files_out.filtered_data,hdr_vol,x2,mask_scrubbing,opt.flag_verbose);
+    else
+        niak_write_vol(hdr_vol,vol_denoised);
+    end
 end
 
 %% Save the scrubbing parameters
 if ~strcmp(files_out.scrubbing,'gb_niak_omitted')
     save(files_out.scrubbing,'mask_scrubbing','fd');
-end
\ No newline at end of file
+end
+
+%%%%%%%%%%%%%%%%%%
+%% SUBFUNCTIONS %%
+%%%%%%%%%%%%%%%%%%
+
+function y = sub_regress(y,x2,mask_scrubbing)
+%% Regress the (normalized) confounds X2 from the time series Y
+y_mean = mean(y(~mask_scrubbing,:),1); % Exclude time points with excessive motion to estimate mean/std
+y_std  =  std(y(~mask_scrubbing,:),[],1);
+y = (y-repmat(y_mean,[size(y,1),1]))./repmat(y_std,[size(y,1) 1]);
+model.y = y(~mask_scrubbing,:);
+model.x = x2(~mask_scrubbing,:);
+opt_glm.flag_beta = true;
+res = niak_glm(model,opt_glm); % Run the regression excluding time points with excessive motion
+y = y - x2*res.beta; % Generate the residuals for all time points combined
+y = y + repmat(y_mean,[size(y,1) 1]); % put the mean back in the time series
+
+function [] = sub_regress_store(file_store,file_out,hdr,x2,mask_scrubbing,flag_verbose)
+%% Regress the confounds from the time series of a store, one block of voxels at a time
+%% The results go in a store, or in a volume
+store = niak_read_store(file_store);
+nb_b = size(store.blocks,1);
+[path_o,name_o,ext_o] = niak_fileparts(file_out);
+flag_store_out = strcmp(ext_o,'.tss');
+if flag_store_out
+    store_out = store;
+    store_out.hdr = hdr;
+    store_out.file_name = file_out;
+else
+    vol = zeros([prod(store.dim(1:3)) store.dim(4)],'single');
+end
+for num_b = 1:nb_b
+    if flag_verbose
+        fprintf('    Block %i/%i\n',num_b,nb_b);
+    end
+    [store,y] = niak_read_store(file_store,num_b);
+    if ~isempty(x2)
+        y = sub_regress(y,x2,mask_scrubbing);
+    end
+    if flag_store_out
+        niak_write_store(store_out,y,num_b);
+    else
+        vol(store.blocks(num_b,1):store.blocks(num_b,2),:) = y';
+    end
+end
+if ~flag_store_out
+    niak_write_vol(hdr,reshape(vol,store.dim));
+end
@@ -461,7 +461,10 @@ if nt1 == 1
     end
     
     if flag_zip
-        system([GB_NIAK.zip ' ' files_out]);
+        [status,msg] = system([GB_NIAK.zip ' "' files_out '"']);
+        if status~=0
+            error(msg);
+        end
     end
 
 else
@@ -11,7 +11,8 @@ function [files_in,files_out,opt] = niak_brick_time_filter(files_in,files_out,op
 % FILES_IN        
 %    (string OR array of strings) a file name of a 3D+t dataset OR an 
 %    array of strings where each line is a file name of 3D data, all in 
-%    the same space.
+%    the same space OR the folder of a store of time series (.tss 
+%    extension, see NIAK_VOL2STORE).
 %
 % FILES_OUT
 %    (structure) with the following fields.  Note that if a field is an 
@@ -22,7 +23,9 @@ function [files_in,files_out,opt] = niak_brick_time_filter(files_in,files_out,op
 %              
 %    FILTERED_DATA 
 %        (string or array of strings, default <FILES_IN>_F.<EXT>) 
-%        File names for outputs. 
+%        File names for outputs. If FILES_IN is a store, the default is
+%        a store too, <FILES_IN>_F.TSS, and the other volumes are saved 
+%        with a .NII.GZ extension.
 %
 %    BETA_HIGH 
 %        (string or array of strings, default <FILES_IN>_BETA_HIGH.<EXT>) 
@@ -113,11 +116,18 @@ function [files_in,files_out,opt] = niak_brick_time_filter(files_in,files_out,op
 %
 % _________________________________________________________________________
 % SEE ALSO:
-% NIAK_FILTER_TSERIES, NIAK_DEMO_FILTER
+% NIAK_FILTER_TSERIES, NIAK_DEMO_FILTER, NIAK_VOL2STORE
 %
 % _________________________________________________________________________
 % COMMENTS:
 %
+% If FILES_IN is a store of time series, the time series are read and
+% filtered one block of voxels at a time, and the memory is set by the 
+% size of the blocks (see the option MEMORY of NIAK_VOL2STORE). The 
+% filtered data are written block by block if FILTERED_DATA is a store 
+% as well, and in a volume otherwise. The outputs are the same as with
+% the volume the store was built from.
+%
 % Copyright (c) Pierre Bellec, McConnell Brain Imaging Center, 
 % Montreal Neurological Institute, McGill University, 2008.
 % Maintainer : pbellec@bic.mni.mcgill.ca
@@ -176,6 +186,13 @@ if strcmp(ext_f,GB_NIAK.zip_ext)
     ext_f = cat(2,ext_f,GB_NIAK.zip_ext);
 end
 
+%% A store of time series is filtered block by block
+flag_store = strcmp(ext_f,'.tss');
+if flag_store
+    ext_store = ext_f;
+    ext_f = cat(2,'.nii',GB_NIAK.zip_ext);
+end
+
 if strcmp(opt.folder_out,'')
     opt.folder_out = path_f;
 end
@@ -185,7 +202,11 @@ if isempty(files_out.filtered_data)
 
     if size(files_in,1) == 1
 
-        files_out.filtered_data = cat(2,opt.folder_out,filesep,name_f,'_f',ext_f);
+        if flag_store
+            files_out.filtered_data = cat(2,opt.folder_out,filesep,name_f,'_f',ext_store);
+        else
+            files_out.filtered_data = cat(2,opt.folder_out,filesep,name_f,'_f',ext_f);
+        end
 
     else
 
@@ -255,7 +276,12 @@ end
 if flag_verbose
     fprintf('Reading source data %s ...\n',files_in);
 end
-[hdr,vol] = niak_read_vol(files_in);
+if flag_store
+    store = niak_read_store(files_in);
+    hdr = store.hdr;
+else
+    [hdr,vol] = niak_read_vol(files_in);
+end
 
 if (opt.tr == -Inf)
     
@@ -271,64 +297,65 @@ end
 opt_f.lp = opt.lp;
 opt_f.hp = opt.hp;
 
-%% We restrict the filtering in a mask of the brain to save time
-%% The data are converted into a array of time series
-if flag_verbose
-    fprintf('Masking the brain ...\n');
-end
-mask = mean(abs(vol),4);
-mask = niak_mask_brain(mask);
-
-if ndims(vol)==3
-    [nx,ny,nz] = size(vol); nt = 1;
+if flag_store
+    [mask,extras,var_vol,vol_f] = sub_filter_store(files_in,files_out,opt,flag_verbose);
+    [nx,ny,nz] = size(mask);
 else
-    [nx,ny,nz,nt] = size(vol);
-end
 
-vol = reshape(vol,[nx*ny*nz nt])';
-vol_f = vol';
-vol = vol(:,mask>0);
+    %% We restrict the filtering in a mask of the brain to save time
+    %% The data are converted into a array of time series
+    if flag_verbose
+        fprintf('Masking the brain ...\n');
+    end
+    mask = mean(abs(vol),4);
+    mask = niak_mask_brain(mask);
 
+    if ndims(vol)==3
+        [nx,ny,nz] = size(vol); nt = 1;
+    else
+        [nx,ny,nz,nt] = size(vol);
+    end
 
-%% Filtering the data
-if flag_verbose
-    fprintf('Filtering the time series ...\n');
-end
-opt_f.tr = opt.tr;
-opt_f.hp = opt.hp;
-opt_f.lp = opt.lp;
-opt_f.flag_mean = opt.flag_mean;
-[tseries_f,extras] = niak_filter_tseries(vol,opt_f);
+    vol = reshape(vol,[nx*ny*nz nt])';
+    vol_f = vol';
+    vol = vol(:,mask>0);
 
-if flag_verbose
-    fprintf('   Number of low frequencies cosines : %i\n',length(extras.freq_dc_low));
-    fprintf('   Number of high frequencies cosines : %i\n',length(extras.freq_dc_high));
-end
 
-%% If relative variance maps have been requested, compute total variance of
-%% the time series
-if ~strcmp(files_out.var_high,'gb_niak_omitted')||~strcmp(files_out.var_low,'gb_niak_omitted')
-    var_vol = var(vol);
-end
+    %% Filtering the data
+    if flag_verbose
+        fprintf('Filtering the time series ...\n');
+    end
+    opt_f.tr = opt.tr;
+    opt_f.hp = opt.hp;
+    opt_f.lp = opt.lp;
+    opt_f.flag_mean = opt.flag_mean;
+    [tseries_f,extras] = niak_filter_tseries(vol,opt_f);
 
-%% Reshaping the filtered time series into a 3D+t volume
-vol_f(mask>0,:) = tseries_f';
-clear tseries_f
-vol_f = reshape(vol_f,[nx ny nz nt]);
+    if flag_verbose
+        fprintf('   Number of low frequencies cosines : %i\n',length(extras.freq_dc_low));
+        fprintf('   Number of high frequencies cosines : %i\n',length(extras.freq_dc_high));
+    end
+
+    %% If relative variance maps have been requested, compute total variance of
+    %% the time series
+    if ~strcmp(files_out.var_high,'gb_niak_omitted')||~strcmp(files_out.var_low,'gb_niak_omitted')
+        var_vol = var(vol);
+    end
 
-%% Writting the filtered data
-if ~strcmp(files_out.filtered_data,'gb_niak_omitted')
+    %% Reshaping the filtered time series into a 3D+t volume
+    vol_f(mask>0,:) = tseries_f';
+    clear tseries_f
+    vol_f = reshape(vol_f,[nx ny nz nt]);
+
+end
+
+%% Writting the filtered data (a store has already been written block by block)
+if ~strcmp(files_out.filtered_data,'gb_niak_omitted')&&~isempty(vol_f)
     if flag_verbose
         fprintf('Writting the filtered data in %s ...\n',files_out.filtered_data);
     end
     hdr = hdr(1);
-    hdr_out = hdr;
-    hdr_out.file_name = files_out.filtered_data;
-    opt_hist.command = 'niak_brick_time_filter';
-    opt_hist.files_in = files_in;
-    opt_hist.files_out = files_out.filtered_data;
-    opt_hist.comment = sprintf('Filtered data, high-pass filter cut-off= %1.2f Hz, low pass filter cut-off=%1.2f Hz, TR=%1.2f',opt.hp,opt.lp,opt.tr);
-    hdr_out = niak_set_history(hdr_out,opt_hist);
+    hdr_out = sub_hdr_filtered(hdr,files_in,files_out,opt);
     niak_write_vol(hdr_out,vol_f);
     clear vol_f
 end
@@ -452,4 +479,83 @@ if ~strcmp(files_out.var_high,'gb_niak_omitted')
     hdr_out = niak_set_history(hdr_out,opt_hist);
     niak_write_vol(hdr_out,vol_var_high);
     clear vol_val_high
-end
\ No newline at end of file
+end
+
+%%%%%%%%%%%%%%%%%%
+%% SUBFUNCTIONS %%
+%%%%%%%%%%%%%%%%%%
+function hdr_out = sub_hdr_filtered(hdr,files_in,files_out,opt)
+hdr_out = hdr;
+hdr_out.file_name = files_out.filtered_data;
+opt_hist.command = 'niak_brick_time_filter';
+opt_hist.files_in = files_in;
+opt_hist.files_out = files_out.filtered_data;
+opt_hist.comment = sprintf('Filtered data, high-pass filter cut-off= %1.2f Hz, low pass filter cut-off=%1.2f Hz, TR=%1.2f',opt.hp,opt.lp,opt.tr);
+hdr_out = niak_set_history(hdr_out,opt_hist);
+
+function [mask,extras,var_vol,vol_f] = sub_filter_store(files_in,files_out,opt,flag_verbose)
+%% Filter the time series of a store, one block of voxels at a time
+%% VOL_F is the filtered volume if it has to be written, empty otherwise
+store = niak_read_store(files_in);
+nb_b = size(store.blocks,1);
+nb_vox = prod(store.dim(1:3));
+
+if flag_verbose
+    fprintf('Masking the brain ...\n');
+end
+mask = zeros([nb_vox 1],'single');
+for num_b = 1:nb_b
+    [store,tseries] = niak_read_store(files_in,num_b);
+    mask(store.blocks(num_b,1):store.blocks(num_b,2)) = mean(abs(tseries),1);
+end
+mask = niak_mask_brain(reshape(mask,store.dim(1:3)));
+
+%% The filtered data go in a store, or in a volume
+[path_o,name_o,ext_o] = fileparts(files_out.filtered_data);
+flag_store_out = strcmp(ext_o,'.tss');
+flag_vol = ~flag_store_out&&~strcmp(files_out.filtered_data,'gb_niak_omitted');
+if flag_store_out
+    store_out = store;
+    store_out.hdr = sub_hdr_filtered(store.hdr,files_in,files_out,opt);
+    store_out.file_name = files_out.filtered_data;
+elseif flag_vol
+    vol_f = zeros([nb_vox store.dim(4)],'single');
+end
+
+if flag_verbose
+    fprintf('Filtering the time series, %i blocks of voxels ...\n',nb_b);
+end
+opt_f.tr = opt.tr;
+opt_f.hp = opt.hp;
+opt_f.lp = opt.lp;
+opt_f.flag_mean = opt.flag_mean;
+beta_dc_low = [];
+beta_dc_high = [];
+var_vol = [];
+for num_b = 1:nb_b
+    [store,tseries] = niak_read_store(files_in,num_b);
+    mask_b = mask(store.blocks(num_b,1):store.blocks(num_b,2))>0;
+    [tseries_f,extras] = niak_filter_tseries(tseries(:,mask_b),opt_f);
+    beta_dc_low = [beta_dc_low extras.beta_dc_low];
+    beta_dc_high = [beta_dc_high extras.beta_dc_high];
+    var_vol = [var_vol var(tseries(:,mask_b))];
+    tseries(:,mask_b) = tseries_f;
+    if flag_store_out
+        niak_write_store(store_out,tseries,num_b);
+    elseif flag_vol
+        vol_f(store.blocks(num_b,1):store.blocks(num_b,2),:) = tseries';
+    end
+end
+extras.beta_dc_low = beta_dc_low;
+extras.beta_dc_high = beta_dc_high;
+
+if flag_verbose
+    fprintf('   Number of low frequencies cosines : %i\n',length(extras.freq_dc_low));
+    fprintf('   Number of high frequencies cosines : %i\n',length(extras.freq_dc_high));
+end
+
+if flag_vol
+    vol_f = reshape(vol_f,store.dim);
+else
+    vol_f = [];
+end
@@ -80,6 +80,11 @@ function  [files_in,files_out,opt] = niak_brick_region_growing(files_in,files_ou
 %           (integer, default 100) Size of vector chunks. See the 
 %           "comments" section below.
 %
+%       FLAG_SPARSE
+%           (boolean, default false) grow the regions on a sparse 
+%           adjacency matrix, which bounds the memory on large areas. 
+%           See NIAK_REGION_GROWING.
+%
 %       FLAG_VERBOSE
 %           (boolean, default 1) if FLAG_VERBOSE == 1, print some
 %          information on the advance of computation
@@ -166,8 +171,8 @@ files_in = psom_struct_defaults(files_in,list_fields,list_defaults);
 %% Default options
 opt_norm_ind.type   = 'mean';
 opt_norm_group.type = 'mean_var';
-list_fields      = {'correction_ind' , 'correction_group' , 'var_tseries' , 'var_neig' , 'thre_size' , 'thre_sim' , 'thre_nb_rois' , 'sim_measure'   , 'flag_size' , 'flag_sieve' , 'flag_verbose' , 'flag_test' , 'size_chunks' };
-list_defaults    = {opt_norm_ind     , opt_norm_group     , 'tseries'     , 'neig'     , 1000        , []         , 0              , 'afc'           , true        , false        , 1              , false       , 100           };
+list_fields      = {'correction_ind' , 'correction_group' , 'var_tseries' , 'var_neig' , 'thre_size' , 'thre_sim' , 'thre_nb_rois' , 'sim_measure'   , 'flag_size' , 'flag_sieve' , 'flag_verbose' , 'flag_test' , 'size_chunks' , 'flag_sparse' };
+list_defaults    = {opt_norm_ind     , opt_norm_group     , 'tseries'     , 'neig'     , 1000        , []         , 0              , 'afc'           , true        , false        , 1              , false       , 100           , false         };
 if nargin < 3
     opt = psom_struct_defaults(struct(),list_fields,list_defaults);
 else
@@ -268,6 +273,7 @@ else
     opt_grow.thre_nb_rois     = opt.thre_nb_rois;
     opt_grow.sim_measure      = opt.sim_measure;
     opt_grow.flag_size        = opt.flag_size;
+    opt_grow.flag_sparse      = opt.flag_sparse;
     opt_grow.flag_verbose     = opt.flag_verbose;
     
     %% Perform region growing
@@ -48,6 +48,14 @@ function [files_in,files_out,opt] = niak_brick_sica(files_in,files_out,opt)
 %      number of components to compute (for default : T is the number
 %      of time samples).
 %
+%   SVD
+%      (structure, default struct()) the options of the PCA reduction that
+%      precedes the ICA, see the OPT.SVD argument of NIAK_SICA. With
+%      SVD.FLAG_RAND = true, the components are estimated with a randomized 
+%      truncated SVD (see NIAK_SVD_RAND), which is faster and uses less
+%      memory on long runs. SVD.OVERSAMPLING and SVD.NB_ITER tune the 
+%      accuracy, and SVD.FLAG_CHECK compares the result with the exact PCA.
+%
 %   RAND_SEED
 %      (scalar, default []) The specified value is used to seed the random
 %      number generator with PSOM_SET_RAND_SEED for each job. If left empty,
@@ -154,8 +162,8 @@ niak_set_defaults
 
 %% Options
 gb_name_structure = 'opt';
-gb_list_fields    = { 'rand_seed' , 'norm' , 'algo'    , 'nb_comp' , 'flag_verbose' , 'flag_test' , 'folder_out' };
-gb_list_defaults  = { []          , 'mean' , 'Infomax' , 60        , 1              , 0           , ''           };
+gb_list_fields    = { 'rand_seed' , 'norm' , 'algo'    , 'nb_comp' , 'svd'    , 'flag_verbose' , 'flag_test' , 'folder_out' };
+gb_list_defaults  = { []          , 'mean' , 'Infomax' , 60        , struct() , 1              , 0           , ''           };
 niak_set_defaults
 
 [path_f,name_f,ext_f] = niak_fileparts(files_in.fmri);
@@ -235,6 +243,7 @@ opt_sica.algo = opt.algo;
 opt_sica.param_nb_comp = min(nb_comp,floor(0.95*nt));
 opt_sica.type_nb_comp = 0;
 opt_sica.verbose = 'off';
+opt_sica.svd = opt.svd;
 res_ica = niak_sica(vol,opt_sica);
 opt_sica.param_nb_comp = res_ica.nbcomp;
 
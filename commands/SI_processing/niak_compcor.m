@@ -17,6 +17,10 @@ function [x,mask] = niak_compcor(vol,opt,mask_a);
 %      "significant" components. 
 %   OPT.NB_SAMPS (integer, default 100) the number of samples for the MC simulation
 %   OPT.P (scalar, default 0.05) the significance level to accept a principal component
+%   OPT.SVD (structure, default struct()) the options of the PCA, see NIAK_PCA. With 
+%      OPT.SVD.FLAG_RAND = true, the components are estimated with a randomized 
+%      truncated SVD, which is faster for long time series. This is only used with 
+%      a fixed OPT.NB_COMP, as the test needs all the eigen values.
 %   OPT.FLAG_VERBOSE (boolean, default 1) print progress
 %   MASK_A (3D array) if OPT.TYPE is 'a' or 'at', mask of white matter+ventricles (necessary)
 %
@@ -66,8 +70,8 @@ if nargin < 2
     opt = struct();
 end
 
-lfields = { 'nb_comp' , 'flag_verbose' , 'perc' , 'type' , 'nb_samps' , 'p'  };
-ldefs   = { 5         , true           , 0.02   , 'a'    , 100        , 0.05 };
+lfields = { 'nb_comp' , 'flag_verbose' , 'perc' , 'type' , 'nb_samps' , 'p'  , 'svd'    };
+ldefs   = { 5         , true           , 0.02   , 'a'    , 100        , 0.05 , struct() };
 opt = psom_struct_defaults(opt,lfields,ldefs);
 
 %% Check the presence of OPT.MASK if needed
@@ -97,12 +101,11 @@ end
 %% Now run the pca
 y = niak_vol2tseries(vol,mask);
 y = niak_normalize_tseries(y);
-[val,x] = niak_pca(y');
-
 if ~isempty(opt.nb_comp)
-    x = x(:,1:opt.nb_comp);
+    [val,x] = niak_pca(y',opt.nb_comp,opt.svd);
     return
 end
+[val,x] = niak_pca(y');
 
 %% Run a Monte-Carlo simulation of expected eigen values for i.i.d. Gaussian noise
 valg = zeros([opt.nb_samps length(val)]);
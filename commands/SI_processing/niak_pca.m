@@ -1,8 +1,8 @@
-function [eig_val,eig_vec,weights] = niak_pca(data,nb_comp)
+function [eig_val,eig_vec,weights] = niak_pca(data,nb_comp,opt)
 % Perform a principal component analysis on a 2D data array.
 %
 % SYNTAX:
-% [EIG_VAL,EIG_VEC,WEIGHTS] = NIAK_PCA(DATA)
+% [EIG_VAL,EIG_VEC,WEIGHTS] = NIAK_PCA(DATA,NB_COMP,OPT)
 %
 % _________________________________________________________________________
 % INPUTS
@@ -20,6 +20,15 @@ function [eig_val,eig_vec,weights] = niak_pca(data,nb_comp)
 %   an integer, greater than 1, NB_COMP is the number of components that 
 %   will be generated (the procedure always consider the principal 
 %   components ranked according to the energy they explain in the data). 
+%
+% OPT
+%   (structure, optional) with the following fields:
+%
+%   FLAG_RAND
+%       (boolean, default false) if the flag is true and NB_COMP is an
+%       integer, the components are estimated with a randomized truncated
+%       SVD, see NIAK_SVD_RAND. The other fields of OPT are passed to
+%       NIAK_SVD_RAND (OVERSAMPLING, NB_ITER, FLAG_CHECK, TOL).
 %           
 % _________________________________________________________________________
 % OUTPUTS
@@ -46,7 +55,9 @@ function [eig_val,eig_vec,weights] = niak_pca(data,nb_comp)
 % COMMENTS:
 %
 % The PCA is done on the matrix of scalar products in the second
-% dimension, i.e. DATA'*DATA.
+% dimension, i.e. DATA'*DATA. With OPT.FLAG_RAND, neither DATA'*DATA nor
+% the rank of DATA are computed, which is much faster when NB_COMP is small
+% compared to the dimensions of DATA.
 %
 % Copyright (c) Pierre Bellec, Montreal Neurological Institute, 2008.
 % Maintainer : pbellec@bic.mni.mcgill.ca
@@ -71,6 +82,19 @@ function [eig_val,eig_vec,weights] = niak_pca(data,nb_comp)
 % OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 % THE SOFTWARE.
 
+if nargin < 3
+    opt = struct();
+end
+opt = psom_struct_defaults(opt,{'flag_rand'},{false},false);
+
+%% Randomized truncated SVD
+if opt.flag_rand && (nargin >= 2) && (nb_comp >= 1)
+    [U,S,eig_vec] = niak_svd_rand(data,ceil(nb_comp),rmfield(opt,'flag_rand'));
+    eig_val = S.^2;
+    weights = data*eig_vec;
+    return
+end
+
 %% Setting default value for the number of components
 nb_comp_init = rank(data);
 
@@ -0,0 +1,143 @@
+function [U,S,V,check] = niak_svd_rand(data,nb_comp,opt)
+% Truncated singular value decomposition of a 2D array, by random projections.
+%
+% SYNTAX:
+% [U,S,V,CHECK] = NIAK_SVD_RAND(DATA,NB_COMP,OPT)
+%
+% _________________________________________________________________________
+% INPUTS:
+%
+% DATA
+%   (2D array, size N*T) the data.
+%
+% NB_COMP
+%   (integer) the number of singular vectors to estimate.
+%
+% OPT
+%   (structure, optional) with the following fields:
+%
+%   OVERSAMPLING
+%       (integer, default 10) the number of random projections in addition
+%       to NB_COMP.
+%
+%   NB_ITER
+%       (integer, default 2) the number of power iterations. Each iteration
+%       costs two products with DATA, and improves the accuracy when the
+%       singular values decay slowly.
+%
+%   FLAG_CHECK
+%       (boolean, default false) if the flag is true, the exact singular
+%       value decomposition is also computed, and compared with the
+%       approximation, see CHECK below.
+%
+%   TOL
+%       (scalar, default 0.01) if FLAG_CHECK is true, a warning is issued
+%       when the relative error on one of the singular values exceeds TOL.
+%
+% _________________________________________________________________________
+% OUTPUTS:
+%
+% U
+%   (array, size N*NB_COMP) the left singular vectors (in columns).
+%
+% S
+%   (vector, size NB_COMP*1) the singular values, in descending order.
+%
+% V
+%   (array, size T*NB_COMP) the right singular vectors (in columns), such
+%   that U*diag(S)*V' approximates DATA.
+%
+% CHECK
+%   (structure) if OPT.FLAG_CHECK is true, with the following fields:
+%
+%   ERR_VAL
+%       (vector, size NB_COMP*1) the relative error on the singular values.
+%
+%   ERR_SPACE
+%       (scalar) the sine of the largest principal angle between the
+%       space of U and the space of the exact left singular vectors.
+%   
+%   Otherwise CHECK is empty.
+%
+% _________________________________________________________________________
+% SEE ALSO:
+% NIAK_PCA, NIAK_COMPCOR, NIAK_SICA
+%
+% _________________________________________________________________________
+% COMMENTS:
+%
+% The range of DATA is sampled with NB_COMP+OPT.OVERSAMPLING random 
+% Gaussian vectors, refined with OPT.NB_ITER power iterations, and the 
+% decomposition is the exact SVD of the projection of DATA on that range.
+% The cost is a few products of DATA with thin matrices, instead of a 
+% decomposition of the N*N or T*T matrix of scalar products. 
+%
+% The random vectors are drawn with RANDN, set the seed of the generator 
+% beforehand for reproducible results (see PSOM_SET_RAND_SEED).
+%
+% Halko, N., Martinsson, P. G., Tropp, J. A., 2011. Finding structure with 
+% randomness: probabilistic algorithms for constructing approximate matrix 
+% decompositions. SIAM Review 53 (2), 217-288.
+%
+% Copyright (c) The NIAK contributors, 2026.
+% See licensing information in the code.
+% Keywords : SVD, PCA, random projections
+
+% Permission is hereby granted, free of charge, to any person obtaining a copy
+% of this software and associated documentation files (the "Software"), to deal
+% in the Software without restriction, including without limitation the rights
+% to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+% copies of the Software, and to permit persons to whom the Software is
+% furnished to do so, subject to the following conditions:
+%
+% The above copyright notice and this permission notice shall be included in
+% all copies or substantial portions of the Software.
+%
+% THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+% IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+% FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+% AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+% LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+% OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+% THE SOFTWARE.
+
+if nargin < 2
+    error('Syntax: [U,S,V,CHECK] = NIAK_SVD_RAND(DATA,NB_COMP,OPT)')
+end
+if nargin < 3
+    opt = struct();
+end
+opt = psom_struct_defaults(opt, ...
+    { 'oversampling' , 'nb_iter' , 'flag_check' , 'tol' }, ...
+    { 10             , 2         , false        , 0.01  }, false);
+
+[n,t] = size(data);
+nb_comp = min(nb_comp,min(n,t));
+nb_proj = min(nb_comp+opt.oversampling,min(n,t));
+
+%% An orthonormal basis of the range of DATA
+[Q,R] = qr(data*randn([t nb_proj]),0);
+for num_i = 1:opt.nb_iter
+    [Q,R] = qr(data'*Q,0);
+    [Q,R] = qr(data*Q,0);
+end
+
+%% Exact SVD of the projection of DATA on that range
+[Vb,Sb,Ub] = svd(data'*Q,0);
+U = Q*Ub(:,1:nb_comp);
+S = diag(Sb);
+S = S(1:nb_comp);
+V = Vb(:,1:nb_comp);
+
+%% Compare with the exact SVD
+check = [];
+if opt.flag_check
+    [U0,S0] = svd(data,'econ');
+    S0 = diag(S0);
+    S0 = S0(1:nb_comp);
+    check.err_val = abs(S-S0)./max(S0,eps);
+    check.err_space = sqrt(max(1-min(svd(U0(:,1:nb_comp)'*U))^2,0));
+    if max(check.err_val) > opt.tol
+        warning('The relative error of the randomized SVD on the singular values (%1.3f) exceeds %1.3f. Increase OPT.NB_ITER or OPT.OVERSAMPLING.',max(check.err_val),opt.tol);
+    end
+end
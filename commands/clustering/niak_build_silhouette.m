@@ -26,7 +26,8 @@ function [sil,a,b] = niak_build_silhouette(mat,part,flag_normalize)
 % PART
 %       (vector, size N*1) PART(I) is the number of the cluster unit I
 %       belongs to, ie the elements of cluster K are defined by
-%       FIND(PART==K).
+%       FIND(PART==K). PART can also be an array N*K, where each column is
+%       a partition, e.g. a grid of scales.
 %
 % FLAG_NORMALIZE
 %       (boolean, default true) If FLAG_NORMALIZE is true, the
@@ -37,7 +38,8 @@ function [sil,a,b] = niak_build_silhouette(mat,part,flag_normalize)
 % OUTPUTS :
 %
 % SIL
-%   (vector, size N*1) SIL(I) is the silhouette of unit I.
+%   (vector, size N*1) SIL(I) is the silhouette of unit I. If PART has 
+%   several columns, so do SIL, A and B, one per partition.
 %
 % A
 %   (vector, size N*1) A(I) is the average stability of I with other
@@ -58,6 +60,11 @@ function [sil,a,b] = niak_build_silhouette(mat,part,flag_normalize)
 % If 0s are found in part, the silhouette will be derived after excluding
 % the corresponding regions from the analysis.
 %
+% The average similarity of each unit with each cluster is the product of
+% the similarity matrix with the (sparse) indicator matrix of the clusters, 
+% computed for blocks of units, so that the memory stays bounded
+% whatever the number of units and clusters.
+%
 % _________________________________________________________________________
 % REFERENCES:
 %
@@ -97,6 +104,22 @@ end
 if nargin < 3
     flag_normalize = true;
 end
+
+if size(part,1) == 1
+    part = part(:);
+end
+
+%% One silhouette per partition
+if size(part,2) > 1
+    sil = zeros(size(part));
+    a = zeros(size(part));
+    b = zeros(size(part));
+    for num_k = 1:size(part,2)
+        [sil(:,num_k),a(:,num_k),b(:,num_k)] = niak_build_silhouette(mat,part(:,num_k),flag_normalize);
+    end
+    return
+end
+
 if any(part==0)
     mask_include = part~=0;
     mat = mat(mask_include,mask_include);
@@ -114,41 +137,44 @@ end
 
 nb_clust = max(part);
 
-size_part = zeros([nb_clust 1]);
-for num_p = 1:nb_clust
-    size_part(num_p) = sum(part == num_p);
-end
-
 sil = zeros([N 1]);
 a = zeros([N 1]);
 b = zeros([N 1]);
 
 if nb_clust > 1
 
-    for num_u = 1:N
-
-        b(num_u) = -Inf;
-        for num_p = 1:nb_clust
-            if num_p ~= part(num_u)
-                b(num_u) = max(b(num_u),mean(mat(part==num_p,num_u)));
-            end
-        end
-
-        if size_part(part(num_u)) == 1
-            a(num_u) = 0; % Singleton cluster : the within-cluster similarity is set to zero to favour non-trivial clusters
-        else
-            a(num_u) = sum(mat(part==part(num_u),num_u));
-            a(num_u) = a(num_u) - mat(num_u,num_u);
-            a(num_u) = a(num_u) / (size_part(part(num_u)) - 1);
-        end
-
-        if flag_normalize
-            sil(num_u) = (a(num_u) -b(num_u)) / max(a(num_u),b(num_u));
-        else
-            sil(num_u) = (a(num_u) -b(num_u));
-        end
+    % The indicator matrix of the clusters
+    ind_part = sparse(1:N,part,1,N,nb_clust);
+    size_part = full(sum(ind_part,1))';
+
+    % The blocks of units hold about 2^23 similarities, both unit-to-unit
+    % (the columns of MAT) and unit-to-cluster
+    size_block = max(floor(2^23/max(N,nb_clust)),1);
+    for num_b = 1:size_block:N
+        list_u = num_b:min(num_b+size_block-1,N);
+        nb_u = length(list_u);
+
+        % The total similarity of each unit with each cluster
+        avg = full(ind_part'*double(mat(:,list_u)));
+        ind_own = sub2ind([nb_clust nb_u],part(list_u)',1:nb_u);
+        sum_own = avg(ind_own)';
+
+        % b: the maximal average similarity with another cluster
+        avg = avg./repmat(size_part,[1 nb_u]);
+        avg(ind_own) = -Inf;
+        b(list_u) = max(avg,[],1)';
+
+        % a: the average similarity with the other units of the cluster
+        size_own = size_part(part(list_u));
+        a(list_u) = (sum_own - double(mat(sub2ind([N N],list_u,list_u)))')./(size_own-1);
+        a(list_u(size_own==1)) = 0; % Singleton cluster : the within-cluster similarity is set to zero to favour non-trivial clusters
     end
 
+    if flag_normalize
+        sil = (a-b)./max(a,b);
+    else
+        sil = a-b;
+    end
 end
 
 if flag_include
@@ -156,8 +182,8 @@ if flag_include
     a_tmp   = repmat(NaN,size(mask_include));
     b_tmp   = repmat(NaN,size(mask_include));
     sil_tmp(mask_include) = sil;
-    a_tmp(mask_include)   = sil;
-    b_tmp(mask_include)   = sil;
+    a_tmp(mask_include)   = a;
+    b_tmp(mask_include)   = b;
     sil = sil_tmp;
     a   = a_tmp;
     b   = b_tmp;
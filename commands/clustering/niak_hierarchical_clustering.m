@@ -40,6 +40,10 @@ function hier = niak_hierarchical_clustering(S,opt)
 %           (integer, default 1) if non-empty, the clustering will stop
 %           when the specified number of clusters is reached.    
 %
+%       FLAG_NN_CHAIN
+%           (boolean, default false) if true, the hierarchy is built with
+%           the nearest-neighbour chain algorithm (see COMMENTS below).
+%
 %       FLAG_VERBOSE
 %           (boolean, default 1) print an advancement information
 %
@@ -85,6 +89,18 @@ function hier = niak_hierarchical_clustering(S,opt)
 %
 % If symmetric, the matrix can be "vectorized" using NIAK_VEC2MAT.
 %
+% By default, each merge looks for the maximal similarity in the whole
+% matrix, which takes a time cubic in N. With FLAG_NN_CHAIN, a chain of 
+% nearest neighbours is followed until two clusters are their mutual 
+% nearest neighbours, and these are merged. Each step only scans one row,
+% so the whole hierarchy takes a time quadratic in N, and no more memory 
+% than S. This gives the same hierarchy for all the similarity types, 
+% which are reducible, up to the order of merges with identical levels 
+% (ties are broken at random in the default algorithm). See:
+%
+% F. Murtagh, P. Contreras. Algorithms for hierarchical clustering: an
+% overview. WIREs Data Mining and Knowledge Discovery 2 (2012), pp. 86-97.
+%
 % Copyright (c) Pierre Bellec, 
 % Centre de recherche de l'institut de Gériatrie de Montréal
 % Département d'informatique et de recherche opérationnelle
@@ -118,10 +134,15 @@ N = size(S,1);
 
 %% Options
 gb_name_structure = 'opt';
-gb_list_fields    = {'p'         , 'type_sim' , 'flag_verbose' , 'nb_classes' };
-gb_list_defaults  = {ones([N,1]) , 'ward'     , true           , 1            };
+gb_list_fields    = {'p'         , 'type_sim' , 'flag_verbose' , 'nb_classes' , 'flag_nn_chain' };
+gb_list_defaults  = {ones([N,1]) , 'ward'     , true           , 1            , false           };
 niak_set_defaults
 
+if flag_nn_chain
+    hier = sub_nn_chain(S,p,type_sim,N-nb_classes,flag_verbose);
+    return
+end
+
 perc_verb = 0.05;
 list_objects = 1:N;             % Initialization of the object list
 S(eye(size(S))==1) = -Inf; 
@@ -217,4 +238,81 @@ if flag_verbose
     fprintf(' Done ! \n');
 end
 
-        
+%%%%%%%%%%%%%%%%%%
+%% SUBFUNCTIONS %%
+%%%%%%%%%%%%%%%%%%
+
+function hier = sub_nn_chain(S,p,type_sim,nb_iter,flag_verbose)
+%% The nearest-neighbour chain algorithm
+N = size(S,1);
+p = p(:);
+S(eye(size(S))==1) = -Inf;
+merges = zeros([N-1 3]);
+chain = zeros([N 1]);
+len_chain = 0;
+active = true([N 1]);
+if flag_verbose
+    fprintf('     Nearest-neighbour chain ...');
+end
+
+for num_i = 1:(N-1)
+    
+    % Grow the chain until its last two clusters are mutual nearest neighbours
+    if len_chain == 0
+        len_chain = 1;
+        chain(1) = find(active,1);
+    end
+    while true
+        cx = chain(len_chain);
+        [max_s,cy] = max(S(cx,:));
+        % The previous cluster of the chain wins ties, so the chain never loops
+        if (len_chain>1)&&(S(cx,chain(len_chain-1))==max_s)
+            cy = chain(len_chain-1);
+            break
+        end
+        len_chain = len_chain+1;
+        chain(len_chain) = cy;
+    end
+    len_chain = len_chain-2;
+    tmp = [cx cy];
+    cx = min(tmp);
+    cy = max(tmp);
+    merges(num_i,:) = [S(cx,cy) cx cy];
+    
+    % Update the similarity matrix, as in the default algorithm
+    switch type_sim
+        case 'complete'
+            S(cx,:) = min(S(cx,:),S(cy,:));
+        case 'single'
+            S(cx,:) = max(S(cx,:),S(cy,:));
+        case 'average'
+            S(cx,:) = (p(cx)./(p(cy)+p(cx))).*S(cx,:) + (p(cy)./(p(cx)+p(cy)).*S(cy,:));
+        case 'ward'
+            S(cx,:) = ((p+p(cx))'.*S(cx,:) + (p+p(cy))'.*S(cy,:) - p'*S(cx,cy))./(p+p(cy)+p(cx))';
+        otherwise
+            error('%s is an unknown type of cluster-level similarity',type_sim);
+    end
+    S(:,cx) = S(cx,:)';
+    S(:,cy) = -Inf;
+    S(cy,:) = -Inf;
+    S(cx,cx) = -Inf;
+    p(cx) = p(cx)+p(cy);
+    active(cy) = false;
+end
+
+% The merges are found out of order, sort them by decreasing similarity
+% (the sort is stable, so a cluster is formed before it is merged) and 
+% number the new clusters in that order
+[tmp,order] = sort(-merges(:,1));
+merges = merges(order,:);
+list_objects = 1:N;
+hier = zeros([nb_iter 4]);
+for num_i = 1:nb_iter
+    cx = merges(num_i,2);
+    cy = merges(num_i,3);
+    hier(num_i,:) = [merges(num_i,1) list_objects(cx) list_objects(cy) N+num_i];
+    list_objects(cx) = N+num_i;
+end
+if flag_verbose
+    fprintf(' Done ! \n');
+end
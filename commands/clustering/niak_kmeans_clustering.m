@@ -97,6 +97,17 @@ function [part,gi,i_intra,i_inter] = niak_kmeans_clustering(data,opt,flag_opt);
 %           regions whose associated cluster changed between two
 %           iterations.
 %
+%       TYPE_ALGO
+%           (string, default 'lloyd') the algorithm used for the k-means
+%           iterations: 'lloyd', 'hamerly' or 'elkan' (same iterations,
+%           with bounds that skip most distance computations) or
+%           'minibatch' (approximate k-means with random batches of regions,
+%           for large N). See NIAK_KMEANS_MAT.
+%
+%       SIZE_BATCH
+%           (integer, default 1000) the number of regions per batch, if 
+%           OPT.TYPE_ALGO is 'minibatch'.
+%
 %       NB_ITER
 %           (integer, default 1) number of iterations of the kmeans (the 
 %           best clustering, i.e. with lowest I_INTRA, will be selected).
@@ -176,8 +187,8 @@ function [part,gi,i_intra,i_inter] = niak_kmeans_clustering(data,opt,flag_opt);
 
 %% Options
 if (nargin < 3)||(flag_opt)
-    list_fields    = {'hierarchical' , 'type_similarity' , 'convergence_rate' , 'nb_attempts_max' , 'flag_bisecting' , 'init' , 'type_init'        , 'type_death' , 'nb_classes' , 'p' , 'nb_iter' , 'flag_verbose' , 'nb_iter_max' , 'nb_tests_cycle' , 'flag_mex' };
-    list_defaults  = {struct()       , 'product'         , 0.01               , 5                 , false            , []     , 'random_partition' , 'none'       , NaN          , []  , 1         , 0              , 50            , 5                , false      };
+    list_fields    = {'hierarchical' , 'type_similarity' , 'convergence_rate' , 'nb_attempts_max' , 'flag_bisecting' , 'init' , 'type_init'        , 'type_death' , 'type_algo' , 'size_batch' , 'nb_classes' , 'p' , 'nb_iter' , 'flag_verbose' , 'nb_iter_max' , 'nb_tests_cycle' , 'flag_mex' };
+    list_defaults  = {struct()       , 'product'         , 0.01               , 5                 , false            , []     , 'random_partition' , 'none'       , 'lloyd'     , 1000         , NaN          , []  , 1         , 0              , 50            , 5                , false      };
     opt = psom_struct_defaults(opt,list_fields,list_defaults);
 end
 K = opt.nb_classes;
@@ -91,9 +91,35 @@ function [part,gi,i_intra,i_inter] = niak_kmeans_mat(data,opt,flag_opt);
 %           are identical between two steps of the algorithm (in the sense of DICE), then 
 %           the algorithm stops.
 %
+%       TYPE_ALGO
+%           (string, default 'lloyd') the algorithm used to iterate the 
+%           k-means :
+%           'lloyd' the standard algorithm, all the distances between the 
+%               regions and the centroids are computed at each iteration.
+%           'hamerly' same iterations as 'lloyd', but the distances are
+%               only computed for regions whose cluster may change, based on 
+%               one upper and one lower bound per region, see Hamerly (2010).
+%               Best for a small number of classes.
+%           'elkan' same as 'hamerly', with one lower bound per region and
+%               class, see Elkan (2003). Less distances are computed than
+%               with 'hamerly', but the bounds use an N*K array.
+%           'minibatch' the centroids are updated with random batches of
+%               OPT.SIZE_BATCH regions, see Sculley (2010). This is an 
+%               approximation of k-means, meant for a large number of 
+%               regions (e.g. voxels). 
+%           The 'hamerly', 'elkan' and 'minibatch' algorithms stop when the 
+%           proportion of regions whose cluster changed during one iteration 
+%           is below OPT.CONVERGENCE_RATE, and do not use OPT.TYPE_DEATH and
+%           OPT.NB_TESTS_CYCLE.
+%
+%       SIZE_BATCH
+%           (integer, default 1000) the number of regions per batch, if 
+%           OPT.TYPE_ALGO is 'minibatch'.
+%
 %       NB_ITER_MAX
 %           (integer, default 50) Maximal number of iterations of the
-%           k-means algorithm.
+%           k-means algorithm. With OPT.TYPE_ALGO 'minibatch', an iteration
+%           is a pass over all regions.
 %
 %       NB_TESTS_CYCLE
 %           (integer, default 5) the number of partitions kept in memory to
@@ -122,6 +148,16 @@ function [part,gi,i_intra,i_inter] = niak_kmeans_mat(data,opt,flag_opt);
 % _________________________________________________________________________
 % COMMENTS:
 %
+% Hamerly, G., 2010. Making k-means even faster. Proceedings of the 2010 
+% SIAM international conference on data mining, pp. 130-140.
+%
+% Elkan, C., 2003. Using the triangle inequality to accelerate k-means.
+% Proceedings of the twentieth international conference on machine 
+% learning, pp. 147-153.
+%
+% Sculley, D., 2010. Web-scale k-means clustering. Proceedings of the 19th
+% international conference on World Wide Web, pp. 1177-1178.
+%
 % Copyright (c) Pierre Bellec
 % Centre de recherche de l'institut de Gériatrie de Montréal
 % Département d'informatique et de recherche opérationnelle
@@ -150,11 +186,14 @@ function [part,gi,i_intra,i_inter] = niak_kmeans_mat(data,opt,flag_opt);
 
 %% Options
 if (nargin < 3)||(flag_opt)
-    list_fields    = {'hierarchical' , 'type_similarity' , 'convergence_rate' , 'init' , 'type_init'        , 'type_death' , 'nb_classes' , 'p' , 'flag_verbose' , 'nb_iter_max' , 'nb_tests_cycle' };
-    list_defaults  = {struct()       , 'product'         , 0.01               , []     , 'random_partition' , 'none'       , NaN          , []  , 0              , 50            , 5                };
+    list_fields    = {'hierarchical' , 'type_similarity' , 'convergence_rate' , 'init' , 'type_init'        , 'type_death' , 'type_algo' , 'size_batch' , 'nb_classes' , 'p' , 'flag_verbose' , 'nb_iter_max' , 'nb_tests_cycle' };
+    list_defaults  = {struct()       , 'product'         , 0.01               , []     , 'random_partition' , 'none'       , 'lloyd'     , 1000         , NaN          , []  , 0              , 50            , 5                };
     opt = psom_struct_defaults(opt,list_fields,list_defaults);
 end
 K = opt.nb_classes;
+if ~ismember(opt.type_algo,{'lloyd','hamerly','elkan','minibatch'})
+    error('%s is an unknown type of algorithm. Please check the value of OPT.TYPE_ALGO',opt.type_algo);
+end
 
 if isempty(opt.p)
     opt.p = ones([size(data,2) 1]);
@@ -248,76 +287,91 @@ switch opt.type_init
         error('%s is an unknwon type of initialisation. Please check the value of OPT.TYPE_INIT',opt.type_init);
 end
 
-%%%%%%%%%%%%%%%%%%
-%% The big loop %%
-%%%%%%%%%%%%%%%%%%
-if opt.flag_verbose
-    fprintf('Average DICE with previous iterations: ');
-end
+switch opt.type_algo
+
+    case 'lloyd'
+
+        %% The big loop
+        if opt.flag_verbose
+            fprintf('Average DICE with previous iterations: ');
+        end
 
-while ( changement == 1 ) && ( N_iter < opt.nb_iter_max )    
+        while ( changement == 1 ) && ( N_iter < opt.nb_iter_max )    
     
-    %% Build the centers and the attraction to the centers 
-    if N_iter ~= 1
-        gi = centre_gravite(data,part(:,part_curr),opt.p,K,ind_change,gi);
-    end
-    if (N_iter>1)||~strcmp(opt.type_init,'kmeans++')
-        A = attraction(data,gi,opt.p,ind_change,A);
-    end
+            %% Build the centers and the attraction to the centers 
+            if N_iter ~= 1
+                gi = centre_gravite(data,part(:,part_curr),opt.p,K,ind_change,gi);
+            end
+            if (N_iter>1)||~strcmp(opt.type_init,'kmeans++')
+                A = attraction(data,gi,opt.p,ind_change,A);
+            end
     
-    %% Update partition
-    [A_min,part_bis] = min(A,[],2);     
-    part_old = part_curr;
-    part_curr = mod(part_curr,opt.nb_tests_cycle)+1;
-    part(:,part_curr) = part_bis;    
+            %% Update partition
+            [A_min,part_bis] = min(A,[],2);     
+            part_old = part_curr;
+            part_curr = mod(part_curr,opt.nb_tests_cycle)+1;
+            part(:,part_curr) = part_bis;    
     
-    %% Deal with empty clusters    
-    if ~strcmp(opt.type_death,'none')&&(length(unique(part(:,part_curr)))~=K)
-        switch opt.type_death            
-            case 'singleton'
+            %% Deal with empty clusters    
+            if ~strcmp(opt.type_death,'none')&&(length(unique(part(:,part_curr)))~=K)
+                switch opt.type_death            
+                    case 'singleton'
                 
-                part(:,part_curr) = sub_singleton(A_min,part(:,part_curr),K);
+                        part(:,part_curr) = sub_singleton(A_min,part(:,part_curr),K);
                 
-            case 'split'
+                    case 'split'
                 
-                part(:,part_curr) = sub_split(A,part(:,part_curr),K,opt.p);
+                        part(:,part_curr) = sub_split(A,part(:,part_curr),K,opt.p);
                                  
-            case 'bisect'
+                    case 'bisect'
                 
-                part(:,part_curr) = sub_bisect(data,A,part(:,part_curr),K,opt.p,opt_rep);                              
-        end    
-    end
+                        part(:,part_curr) = sub_bisect(data,A,part(:,part_curr),K,opt.p,opt_rep);                              
+                end    
+            end
     
-    %% Check for cycles and list the clusters that have changed    
-    list_test = 1:size(part,2);
-    list_test = list_test(list_test~=part_curr);
-    mdice_all = 0;
-    for num_t = 1:length(list_test)
-        if any(part(:,list_test(num_t)))
-            mdice = sub_dice(part(:,part_curr),part(:,list_test(num_t)));
-            mdice_all = max(mdice_all,mean(max(mdice,[],2)));
-            if num_t == part_old
-                ind_change = find(max(mdice,[],2)~=1);
+            %% Check for cycles and list the clusters that have changed    
+            list_test = 1:size(part,2);
+            list_test = list_test(list_test~=part_curr);
+            mdice_all = 0;
+            for num_t = 1:length(list_test)
+                if any(part(:,list_test(num_t)))
+                    mdice = sub_dice(part(:,part_curr),part(:,list_test(num_t)));
+                    mdice_all = max(mdice_all,mean(max(mdice,[],2)));
+                    if num_t == part_old
+                        ind_change = find(max(mdice,[],2)~=1);
+                    end
+                end
+            end
+            deplacements = (1-mdice_all);
+            changement = deplacements>opt.convergence_rate;        
+            N_iter = N_iter + 1;
+            if opt.flag_verbose
+                fprintf(' %1.2f -',deplacements);        
             end
         end
-    end
-    deplacements = (1-mdice_all);
-    changement = deplacements>opt.convergence_rate;        
-    N_iter = N_iter + 1;
-    if opt.flag_verbose
-        fprintf(' %1.2f -',deplacements);        
-    end
-end
 
-if opt.flag_verbose
-    fprintf('\n')
-end
-if (N_iter == opt.nb_iter_max)&&opt.flag_verbose
-    fprintf('The maximal number of iterations was reached.\n')
+        if opt.flag_verbose
+            fprintf('\n')
+        end
+        if (N_iter == opt.nb_iter_max)&&opt.flag_verbose
+            fprintf('The maximal number of iterations was reached.\n')
+        end
+        part = part(:,part_curr);
+
+    case 'hamerly'
+
+        part = sub_hamerly(double(data),double(gi),opt);
+
+    case 'elkan'
+
+        part = sub_elkan(double(data),double(gi),opt);
+
+    case 'minibatch'
+
+        part = sub_minibatch(double(data),double(gi),opt);
 end
 
 % save the final results
-part = part(:,part_curr);
 gi = centre_gravite(data,part,opt.p,K);
 
 if nargout>2
@@ -485,3 +539,185 @@ while (num_r>0)&&(num_target>0)
     end    
     num_target = num_target-1;    
 end
+
+%% k-means with one upper and one lower bound per region, Hamerly (2010)
+function part = sub_hamerly(data,gi,opt)
+
+[N,T] = size(data);
+K = size(gi,1);
+D = sub_sqdist(data,gi);
+[u,part] = min(D,[],2);
+D(sub2ind([N K],(1:N)',part)) = Inf;
+l = sqrt(min(D,[],2));
+u = sqrt(u);
+clear D
+if opt.flag_verbose
+    fprintf('Proportion of regions that changed cluster: ');
+end
+for num_iter = 2:opt.nb_iter_max
+
+    %% Move the centers and update the bounds
+    gi_new = sub_centroids(data,part,opt.p,K);
+    move = sqrt(sum((gi_new-gi).^2,2));
+    gi = gi_new;
+    u = u + move(part);
+    [move_max,ind_max] = max(move);
+    move_2 = max([move(1:(ind_max-1)) ; move((ind_max+1):end) ; 0]);
+    l = l - move_max;
+    l(part==ind_max) = l(part==ind_max) + move_max - move_2;
+
+    %% The regions that may change cluster
+    dc = sqrt(sub_sqdist(gi,gi));
+    dc(1:(K+1):end) = Inf;
+    s = min(dc,[],2)/2;
+    m = max(s(part),l);
+    ind = find(u>m);
+    u(ind) = sqrt(sum((data(ind,:)-gi(part(ind),:)).^2,2));
+    ind = ind(u(ind)>m(ind));
+
+    %% Update their cluster and bounds
+    nb_change = 0;
+    if ~isempty(ind)
+        D = sub_sqdist(data(ind,:),gi);
+        [val,part_ind] = min(D,[],2);
+        D(sub2ind(size(D),(1:length(ind))',part_ind)) = Inf;
+        nb_change = sum(part_ind~=part(ind));
+        part(ind) = part_ind;
+        u(ind) = sqrt(val);
+        l(ind) = sqrt(min(D,[],2));
+    end
+    if opt.flag_verbose
+        fprintf(' %1.2f -',nb_change/N);
+    end
+    if nb_change <= opt.convergence_rate*N
+        break
+    end
+end
+if opt.flag_verbose
+    fprintf('\n')
+end
+
+%% k-means with one upper bound per region and one lower bound per region and class, Elkan (2003)
+function part = sub_elkan(data,gi,opt)
+
+[N,T] = size(data);
+K = size(gi,1);
+L = sqrt(sub_sqdist(data,gi));
+[u,part] = min(L,[],2);
+if opt.flag_verbose
+    fprintf('Proportion of regions that changed cluster: ');
+end
+for num_iter = 2:opt.nb_iter_max
+
+    %% Move the centers and update the bounds
+    gi_new = sub_centroids(data,part,opt.p,K);
+    move = sqrt(sum((gi_new-gi).^2,2));
+    gi = gi_new;
+    L = max(L-repmat(move',[N 1]),0);
+    u = u + move(part);
+
+    %% The regions that may change cluster
+    dc = sqrt(sub_sqdist(gi,gi));
+    dc(1:(K+1):end) = Inf;
+    s = min(dc,[],2)/2;
+    ind = find(u>s(part));
+    u(ind) = sqrt(sum((data(ind,:)-gi(part(ind),:)).^2,2));
+    L(sub2ind([N K],ind,part(ind))) = u(ind);
+
+    %% The classes that may be closer than the current one
+    u_ind = repmat(u(ind),[1 K]);
+    [ii,jj] = find((u_ind>L(ind,:))&(u_ind>dc(part(ind),:)/2));
+    nb_change = 0;
+    if ~isempty(ii)
+        d = sub_dist_pairs(data,gi,ind(ii),jj);
+        L(sub2ind([N K],ind(ii),jj)) = d;
+        D = Inf([length(ind) K]);
+        D(sub2ind(size(D),ii,jj)) = d;
+        D(sub2ind(size(D),(1:length(ind))',part(ind))) = u(ind);
+        [val,part_ind] = min(D,[],2);
+        nb_change = sum(part_ind~=part(ind));
+        part(ind) = part_ind;
+        u(ind) = val;
+    end
+    if opt.flag_verbose
+        fprintf(' %1.2f -',nb_change/N);
+    end
+    if nb_change <= opt.convergence_rate*N
+        break
+    end
+end
+if opt.flag_verbose
+    fprintf('\n')
+end
+
+%% Mini-batch k-means, Sculley (2010)
+function part = sub_minibatch(data,gi,opt)
+
+[N,T] = size(data);
+K = size(gi,1);
+p = opt.p(:);
+part = zeros([N 1]);
+w = zeros([K 1]);
+if opt.flag_verbose
+    fprintf('Proportion of regions that changed cluster: ');
+end
+for num_iter = 1:opt.nb_iter_max
+    order = randperm(N);
+    nb_change = 0;
+    for num_b = 1:opt.size_batch:N
+
+        %% Assign the batch to the closest centroids
+        ind = order(num_b:min(num_b+opt.size_batch-1,N))';
+        [val,part_b] = min(sub_sqdist(data(ind,:),gi),[],2);
+        nb_change = nb_change + sum(part_b~=part(ind));
+        part(ind) = part_b;
+
+        %% Move the centroids towards the weighted average of their regions in the batch
+        mat_b = sparse(part_b,(1:length(ind))',p(ind),K,length(ind));
+        w_b = full(sum(mat_b,2));
+        mask = w_b>0;
+        w_new = w(mask)+w_b(mask);
+        gi(mask,:) = (repmat(w(mask),[1 T]).*gi(mask,:) + full(mat_b(mask,:)*data(ind,:)))./repmat(w_new,[1 T]);
+        w(mask) = w_new;
+    end
+    if opt.flag_verbose
+        fprintf(' %1.2f -',nb_change/N);
+    end
+    if nb_change <= opt.convergence_rate*N
+        break
+    end
+end
+if opt.flag_verbose
+    fprintf('\n')
+end
+
+%% Final partition, by batches
+for num_b = 1:opt.size_batch:N
+    ind = num_b:min(num_b+opt.size_batch-1,N);
+    [val,part_b] = min(sub_sqdist(data(ind,:),gi),[],2);
+    part(ind) = part_b;
+end
+
+%% Weighted centers of gravity of the classes, zero for empty classes
+function gi = sub_centroids(data,part,p,nb_classes)
+
+mat = sparse(part(:),(1:length(part))',p(:),nb_classes,length(part));
+w = full(sum(mat,2));
+w(w==0) = 1;
+gi = full(mat*data)./repmat(w,[1 size(data,2)]);
+
+%% Squared euclidian distance between the rows of X and the rows of Y
+function D = sub_sqdist(x,y)
+
+D = repmat(sum(x.^2,2),[1 size(y,1)]) + repmat(sum(y.^2,2)',[size(x,1) 1]) - 2*x*y';
+D = max(D,0);
+
+%% Euclidian distance between the rows DATA(II,:) and GI(JJ,:), by blocks
+function d = sub_dist_pairs(data,gi,ii,jj)
+
+d = zeros([length(ii) 1]);
+size_b = max(floor(2^22/size(data,2)),1);
+for num_b = 1:size_b:length(ii)
+    ind_b = num_b:min(num_b+size_b-1,length(ii));
+    d(ind_b) = sqrt(sum((data(ii(ind_b),:)-gi(jj(ind_b),:)).^2,2));
+end
@@ -55,6 +55,11 @@ function part = niak_region_growing(tseries,neig,opt)
 %           (boolean, default false) if FLAG_SIEVE is true, all the regions
 %           smaller than THRE_SIZE are removed from the final parcelation.
 %
+%       FLAG_SPARSE
+%           (boolean, default false) if FLAG_SPARSE is true, the regions
+%           are grown on a sparse adjacency matrix rather than on NEIG.
+%           See the "comments" section below.
+%
 %       FLAG_VERBOSE
 %           (boolean, default 1) if FLAG_VERBOSE == 1, print some
 %          information on the advance of computation
@@ -92,6 +97,17 @@ function part = niak_region_growing(tseries,neig,opt)
 % At the end of the day, matlab works in such a weird way that it is still 
 % much faster this way than with a clever loop-based implementation ...
 %
+% The NEIG array and the similarity matrix are as wide as the largest 
+% neighbourhood, which grows with the regions, and their rows are only 
+% removed once regions are merged. With FLAG_SPARSE, the neighbourhoods 
+% are a sparse adjacency matrix, updated at each iteration by a sparse 
+% product with the merging of regions. The nearest neighbour of a region 
+% is only searched again when its neighbourhood changed, among its 
+% neighbours, and the similarity between neighbours is not stored. The 
+% memory thus scales with the number of adjacent pairs, and the regions 
+% merged at each iteration are the same mutual nearest neighbours, so the 
+% partition is the same up to ties in similarity.
+%
 % Copyright (c) Pierre Bellec, McConnell Brain Imaging Center,Montreal
 %               Neurological Institute, McGill University, 2008.
 % Maintainer : pbellec@bic.mni.mcgill.ca
@@ -118,8 +134,8 @@ function part = niak_region_growing(tseries,neig,opt)
 
 %%% Default options
 gb_name_structure = 'opt';
-gb_list_fields    = {'size_chunks' , 'thre_size' , 'thre_sim' , 'thre_nb_rois' , 'sim_measure'   , 'flag_size' , 'flag_sieve' , 'flag_verbose' , 'flag_fast_init' };
-gb_list_defaults  = {100           , Inf         , []         , 0              , 'afc'           , 1           , false        , 1              , false            };
+gb_list_fields    = {'size_chunks' , 'thre_size' , 'thre_sim' , 'thre_nb_rois' , 'sim_measure'   , 'flag_size' , 'flag_sieve' , 'flag_verbose' , 'flag_fast_init' , 'flag_sparse' };
+gb_list_defaults  = {100           , Inf         , []         , 0              , 'afc'           , 1           , false        , 1              , false            , false         };
 niak_set_defaults
 
 if isempty(thre_sim)
@@ -177,7 +193,11 @@ switch sim_measure
         tseries = tseries/(max(tseries(:))*size(tseries,1));
         flag_sim = false;
 end
-sim_mat = sub_measure(neig,tseries,sim_measure,nogo,size_chunks,list_size);
+if flag_sparse
+    nb_mnn = 0; % The regions are grown by SUB_GROW_SPARSE, after the loop below
+else
+    sim_mat = sub_measure(neig,tseries,sim_measure,nogo,size_chunks,list_size);
+end
 
 %%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
 % Competitive region growing %
@@ -280,6 +300,10 @@ while (nb_rois>thre_nb_rois)&&(nb_mnn>0)
     end
 end
 
+if flag_sparse
+    [part,tseries,list_size,list_ind_roi,list_roi_ind] = sub_grow_sparse(tseries,neig,part,list_size,sim_measure,nogo,flag_sim,thre_sim,thre_size,thre_nb_rois,size_chunks,flag_verbose);
+end
+
 if flag_verbose
     fprintf('     Done ! \n')
 end
@@ -457,3 +481,125 @@ neig2(mask2(~mask12,:)) = num_roi1; % Roi 2 only is neighbour of this guy. Repla
 neig0(mask12,:) = neig1; % Update the values in the full neighbourhood matrix
 neig0(~mask12,:) = neig2; % Update the values in the full neighbourhood matrix
 neig(ind_new,:) = neig0; % Update the values in the full neighbourhood matrix
+
+function [part,tseries,list_size,list_ind_roi,list_roi_ind] = sub_grow_sparse(tseries,neig,part,list_size,sim_measure,nogo,flag_sim,thre_sim,thre_size,thre_nb_rois,size_chunks,flag_verbose)
+
+%% Competitive region growing on a sparse adjacency matrix. 
+%% Regions keep the row of their label, merged regions are not alive anymore
+n = size(neig,1);
+[ind_x,tmp] = find(neig);
+adj = sparse(ind_x,double(neig(neig~=0)),1,n,n);
+alive = true([n 1]);
+val_sim = zeros([n 1]);
+nneig = zeros([n 1]);
+list_update = (1:n)';
+nb_rois = n;
+nb_mnn = Inf;
+
+while (nb_rois>thre_nb_rois)&&(nb_mnn>0)
+
+    %% Seek mutual nearest neighbours (MNN) that fulfill the merging
+    %% condition
+    [val_sim(list_update),nneig(list_update)] = sub_nneig_sparse(adj,tseries,list_update,sim_measure,nogo,flag_sim,size_chunks,list_size);
+    is_mnn = false([n 1]);
+    list_todo = find(alive&(nneig>0));
+    is_mnn(list_todo) = nneig(nneig(list_todo)) == list_todo;
+    if ~isnan(thre_sim)
+        if flag_sim
+            is_mnn = is_mnn & (val_sim > thre_sim);
+        else
+            is_mnn = is_mnn & (val_sim < thre_sim);
+        end
+    end
+    list_mnn1 = find(is_mnn&((1:n)'<nneig));
+    list_mnn2 = nneig(list_mnn1);
+
+    %% Number of merging, number of rois
+    nb_mnn = length(list_mnn1);
+    nb_rois = nb_rois-nb_mnn;
+    if flag_verbose
+        fprintf(' %i',nb_mnn);
+    end
+
+    if (nb_rois>=thre_nb_rois)&&(nb_mnn>0)
+
+        %% Update tseries, size and partition
+        tseries = sub_update_tseries(tseries,list_size,list_mnn1,list_mnn2,size_chunks);
+        list_size(list_mnn1) = list_size(list_mnn1)+list_size(list_mnn2);
+        merge_with = (1:n)';
+        merge_with(list_mnn2) = list_mnn1;
+        part = merge_with(part);
+        alive(list_mnn2) = false;
+
+        %% The neighbours of merged regions need a new nearest neighbour
+        mask_merge = false([n 1]);
+        mask_merge([list_mnn1 ; list_mnn2]) = true;
+        mask_change = mask_merge|((adj*double(mask_merge))>0);
+
+        %% Update the adjacency: merged regions share their neighbours,
+        %% and adults (regions larger than THRE_SIZE) lose all of them
+        mask_adult = false([n 1]);
+        mask_adult(list_mnn1(list_size(list_mnn1)>thre_size)) = true;
+        list_keep = find(~mask_adult(merge_with));
+        merge_mat = sparse(list_keep,merge_with(list_keep),1,n,n);
+        adj = merge_mat'*adj*merge_mat;
+        adj = spones(adj-spdiags(diag(adj),0,n,n));
+        list_update = find(mask_change&alive);
+    end
+end
+
+%% Rows of the regions left, as expected by the rest of NIAK_REGION_GROWING
+list_ind_roi = find(alive)';
+list_roi_ind = NaN([1 n]);
+list_roi_ind(list_ind_roi) = 1:length(list_ind_roi);
+tseries = tseries(:,alive);
+list_size = list_size(alive);
+
+function [val_sim,nneig] = sub_nneig_sparse(adj,tseries,list_update,sim_measure,nogo,flag_sim,size_chunks,list_size)
+
+%% The nearest neighbour of each region of LIST_UPDATE, 0 if it has no neighbour
+val_sim = nogo*ones([length(list_update) 1]);
+nneig = zeros([length(list_update) 1]);
+[yi,ci] = find(adj(:,list_update));
+if isempty(yi)
+    return
+end
+yi = yi(:);
+ci = ci(:);
+xi = list_update(ci);
+sim = sub_measure_pairs(tseries,xi(:),yi,sim_measure,size_chunks,list_size);
+if flag_sim
+    [tmp,order] = sortrows([ci -sim yi]);
+else
+    [tmp,order] = sortrows([ci sim yi]);
+end
+ci = ci(order);
+mask_first = [true ; diff(ci)~=0];
+val_sim(ci(mask_first)) = sim(order(mask_first));
+nneig(ci(mask_first)) = yi(order(mask_first));
+
+function sim = sub_measure_pairs(tseries,xi,yi,sim_measure,size_chunks,list_size)
+
+%% The similarity measure between the pairs of regions XI and YI
+sim = zeros([length(xi) 1]);
+if length(xi)>size_chunks;
+    list_chunk = 1:size_chunks:length(xi);
+    list_chunk(end) = length(xi);
+else
+    list_chunk = [1 length(xi)];
+end
+for num_c = 1:(length(list_chunk)-1)
+    chunk = list_chunk(num_c):list_chunk(num_c+1);
+    x = xi(chunk);
+    y = yi(chunk);
+    switch sim_measure
+        case 'afc'
+            sim(chunk) = (1/(size(tseries,1)-1))*sum(tseries(:,x).*tseries(:,y),1);
+        case 'afc_penalized'
+            sim(chunk) = (1/(size(tseries,1)-1))*sum(tseries(:,x).*tseries(:,y),1) + abs((list_size(x)-list_size(y))./max([list_size(x) list_size(y)],[],2))';
+        case 'square_diff'
+            sim(chunk) = sqrt(sum((tseries(:,x)-tseries(:,y)).^2,1));
+        case 'square_diff_penalized'
+            sim(chunk) = sqrt(sum((tseries(:,x)-tseries(:,y)).^2,1)) - abs((list_size(x)-list_size(y))./max([list_size(x) list_size(y)],[],2))';
+    end
+end
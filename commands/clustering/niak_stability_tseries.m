@@ -84,6 +84,25 @@ function stab = niak_stability_tseries(tseries,opt)
 %                          requested in OPT.NB_CLASSES. If kcores is
 %                          selected, this has to be set
 %
+%   ENGINE
+%       (string, default 'octave') where the samples are clustered :
+%           'octave' : in this function, one sample after the other.
+%           'python' : in the pyniak.stability module, with numpy, in 
+%               OPT.NB_WORKERS processes. Only 'bootstrap' (CBB) and 
+%               'jacknife' samplings, the default normalization, the 
+%               'hierarchical' clustering with default options and the 
+%               'kmeans' clustering with OPT.CLUSTERING.OPT.TYPE_INIT = 
+%               'random_point' and TYPE_SIMILARITY = 'euclidian' (other 
+%               options by default, the stopping criteria are ignored) 
+%               are available. Other options are run with the 'octave' 
+%               engine, as well as any option if GB_NIAK.CMD_PYTHON fails 
+%               (see NIAK_GB_VARS). The samples are seeded from the current 
+%               state of RAND.
+%
+%   NB_WORKERS
+%       (integer, default 1) the number of processes of the 'python' 
+%       engine.
+%
 %   FLAG_VERBOSE
 %       (boolean, default 1) if the flag is 1, then the function prints
 %       some infos during the processing.
@@ -137,8 +156,8 @@ function stab = niak_stability_tseries(tseries,opt)
 % THE SOFTWARE.
 
 %% Options
-list_fields   = { 'nb_classes' , 'nb_samps' , 'normalize'   , 'clustering' , 'sampling' , 'flag_verbose' };
-list_defaults = { NaN          , 100        , struct()      , struct()     , struct()   , true           };
+list_fields   = { 'nb_classes' , 'nb_samps' , 'normalize'   , 'clustering' , 'sampling' , 'engine' , 'nb_workers' , 'flag_verbose' };
+list_defaults = { NaN          , 100        , struct()      , struct()     , struct()   , 'octave' , 1            , true           };
 opt = psom_struct_defaults(opt,list_fields,list_defaults);
 
 % Setup Normalize Defaults
@@ -162,6 +181,14 @@ opt.sampling = psom_struct_defaults(opt.sampling,...
                { 'type'      , 'opt'        },...
                { 'bootstrap' , sampling_opt });
 
+%% The python engine
+if strcmp(opt.engine,'python')
+    [stab,flag_ok] = sub_stability_python(tseries,opt);
+    if flag_ok
+        return
+    end
+end
+
 %%%%%%%%%%%%%%%%%%%%%%
 %% Stability matrix %%
 %%%%%%%%%%%%%%%%%%%%%%
@@ -260,4 +287,108 @@ end
 stab = stab / opt.nb_samps;
 if opt.flag_verbose
     fprintf('\n');
-end
\ No newline at end of file
+end
+
+%%%%%%%%%%%%%%%%%%
+%% SUBFUNCTIONS %%
+%%%%%%%%%%%%%%%%%%
+
+function [stab,flag_ok] = sub_stability_python(tseries,opt)
+%% Estimate the stability with pyniak.stability
+niak_gb_vars
+stab = [];
+flag_ok = false;
+opt_s = opt.sampling.opt;
+switch opt.sampling.type
+    case 'bootstrap'
+        flag_sampling = (~isfield(opt_s,'dgp')||strcmp(opt_s.dgp,'CBB')) ...
+                        &&(~isfield(opt_s,'independence')||~opt_s.independence) ...
+                        &&(~isfield(opt_s,'t_boot')||isempty(opt_s.t_boot)||(opt_s.t_boot==size(tseries,1)));
+    case 'jacknife'
+        flag_sampling = true;
+    otherwise
+        flag_sampling = false;
+end
+% The options of the normalization and clustering implemented in python,
+% other values of these options are only available in octave
+flag_normalize = sub_is_python(opt.normalize,{'type','ind_time'},{'mean_var',[]},{'mean_var',[]},{});
+switch opt.clustering.type
+    case 'hierarchical'
+        flag_clustering = sub_is_python(opt.clustering.opt,{'type_sim','flag_nn_chain'},{'ward',false},{'ward',false}, ...
+                                        {'flag_verbose','nb_classes'});
+    case 'kmeans'
+        list_fields = { 'type_algo' , 'nb_iter' , 'type_init'        , 'type_similarity' , 'type_death' , 'flag_bisecting' , 'init' , 'hierarchical' , 'p' };
+        list_def    = { 'lloyd'     , 1         , 'random_partition' , 'product'         , 'none'       , false            , []     , struct()       , []  };
+        list_python = { 'lloyd'     , 1         , 'random_point'     , 'euclidian'       , 'none'       , false            , []     , struct()       , []  };
+        flag_clustering = sub_is_python(opt.clustering.opt,list_fields,list_def,list_python, ...
+            {'flag_verbose','nb_classes','convergence_rate','nb_iter_max','nb_tests_cycle','nb_attempts_max','size_batch','flag_mex'});
+    otherwise
+        flag_clustering = false;
+end
+if ~flag_sampling||~flag_normalize||~flag_clustering
+    warning('The python engine does not support this sampling, normalization or clustering, using the octave engine')
+    return
+end
+
+args = sprintf(' --nb_classes %s --nb_samps %i --sampling %s --clustering %s --nb_workers %i --rand_seed %i', ...
+               sub_list(opt.nb_classes),opt.nb_samps,opt.sampling.type,opt.clustering.type,opt.nb_workers,floor(rand(1)*2^31));
+if isfield(opt_s,'block_length')&&~isempty(opt_s.block_length)
+    args = [args ' --block_length ' sub_list(opt_s.block_length)];
+end
+if isfield(opt_s,'perc')
+    args = [args sprintf(' --perc %g',opt_s.perc)];
+end
+
+file_in = niak_file_tmp('_tseries.mat');
+file_out = niak_file_tmp('_stab.mat');
+if strcmp(GB_NIAK.language,'octave')
+    save('-mat7-binary',file_in,'tseries');
+else
+    save(file_in,'tseries','-v7');
+end
+if opt.flag_verbose
+    fprintf('Estimate the stability matrix with pyniak.stability ...\n');
+end
+[status,msg] = system([GB_NIAK.cmd_python ' -m pyniak.stability "' file_in '" "' file_out '"' args]);
+delete(file_in);
+if status ~= 0
+    % e.g. the interpreter or numpy are missing, the octave engine gives the same stability
+    if exist(file_out,'file')
+        delete(file_out);
+    end
+    warning('pyniak.stability failed, using the octave engine:\n%s',msg);
+    return
+end
+data = load(file_out);
+delete(file_out);
+stab = data.stab;
+flag_ok = true;
+
+function flag = sub_is_python(opt_f,list_fields,list_defaults,list_python,list_free)
+%% True if the fields of OPT_F, or their defaults LIST_DEFAULTS when they are
+%% missing, have the values LIST_PYTHON implemented by pyniak.stability.
+%% The fields of LIST_FREE can take any value, other fields are not supported
+flag = true;
+list_opt = fieldnames(opt_f);
+for num_f = 1:length(list_opt)
+    if ~ismember(list_opt{num_f},[list_fields list_free])
+        flag = false;
+        return
+    end
+end
+for num_f = 1:length(list_fields)
+    if isfield(opt_f,list_fields{num_f})
+        val = opt_f.(list_fields{num_f});
+    else
+        val = list_defaults{num_f};
+    end
+    if ~isequal(val,list_python{num_f})
+        flag = false;
+        return
+    end
+end
+
+function str = sub_list(vec)
+%% A list of integers separated by commas
+str = sprintf('%i,',vec);
+str = str(1:end-1);
@@ -0,0 +1,250 @@
+function [] = niak_cache_job(files_in,files_out,opt)
+% Run a PSOM job, or copy its outputs from a cache of previous results.
+%
+% SYNTAX:
+% [] = NIAK_CACHE_JOB(FILES_IN,FILES_OUT,OPT)
+%
+% _________________________________________________________________________
+% INPUTS:
+%
+% FILES_IN
+%   (structure) the inputs of the job.
+%
+% FILES_OUT
+%   (structure) the outputs of the job.
+%
+% OPT
+%   (structure) with the following fields:
+%
+%   COMMAND
+%       (string) the command of the job, evaluated with FILES_IN, FILES_OUT
+%       and OPT.OPT as OPT.
+%
+%   OPT
+%       (structure) the options of the job.
+%
+%   PATH_CACHE
+%       (string) the folder of the cache.
+%
+%   FOLDER_OUT
+%       (string, default '') paths in this folder are not part of the key.
+%
+% _________________________________________________________________________
+% COMMENTS:
+%
+% The key of a job is the MD5 of the NIAK version, the command, the options
+% and outputs of the job (with FOLDER_OUT replaced by a fixed string) and
+% the content of all its inputs. The MD5 of an input is kept in
+% PATH_CACHE/digests, under the name, size and modification time of the
+% file, so unchanged inputs are not read again by the next jobs.
+%
+% The outputs of a job are copied in PATH_CACHE/<2 first characters of the
+% key>/<key>, along with their _extra.mat files, and made read-only. On a
+% hit, the stored files are copied on FILES_OUT, and the entry is touched.
+% Copies share their blocks with the cache on file systems that support
+% it (cp --reflink=auto), and a job writing in its outputs never changes
+% the cache. The least recently used entries are removed by
+% pyniak.brick_cache.
+%
+% See NIAK_PIPELINE_CACHE.
+%
+% Copyright (c) The NIAK contributors, 2026.
+% Maintainer : pierre.bellec@criugm.qc.ca
+% See licensing information in the code.
+% Keywords : pipeline, psom, cache
+
+% Permission is hereby granted, free of charge, to any person obtaining a copy
+% of this software and associated documentation files (the "Software"), to deal
+% in the Software without restriction, including without limitation the rights
+% to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+% copies of the Software, and to permit persons to whom the Software is
+% furnished to do so, subject to the following conditions:
+%
+% The above copyright notice and this permission notice shall be included in
+% all copies or substantial portions of the Software.
+%
+% THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+% IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+% FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+% AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+% LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+% OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+% THE SOFTWARE.
+
+niak_gb_vars
+
+list_fields    = { 'command' , 'opt'    , 'path_cache' , 'folder_out' };
+list_defaults  = { NaN       , struct() , NaN          , ''           };
+opt_cache = psom_struct_defaults(opt,list_fields,list_defaults);
+path_cache = niak_full_path(opt_cache.path_cache);
+
+%% The key of the job
+list_out = sub_files(files_out);
+key = sub_key(files_in,list_out,opt_cache,GB_NIAK.version,path_cache);
+path_entry = [path_cache key(1:2) filesep key filesep];
+file_manifest = [path_entry 'manifest.mat'];
+
+%% A hit: copy the stored outputs
+if psom_exist(file_manifest)
+    manifest = load(file_manifest);
+    try
+        for num_f = 1:length(manifest.files)
+            target = list_out{manifest.index(num_f)};
+            if manifest.flag_extra(num_f)
+                target = sub_extra(target);
+            end
+            sub_copy([path_entry manifest.files{num_f}],target);
+        end
+        system(['touch "' path_entry(1:end-1) '"']);
+        fprintf('The outputs of this job were found in the cache %s\n',path_entry);
+        return
+    catch
+        fprintf('Could not use the cache entry %s, running the job\n%s\n',path_entry,lasterr);
+    end
+end
+
+%% A miss: run the job
+% Outputs left by a previous attempt are removed, older versions of the
+% cache hard linked them on its entries
+for num_f = 1:length(list_out)
+    if psom_exist(list_out{num_f})&&~exist(list_out{num_f},'dir')
+        delete(list_out{num_f});
+    end
+end
+opt = opt_cache.opt;
+eval(opt_cache.command);
+
+%% Store the outputs
+targets = {};
+index = [];
+flag_extra = [];
+for num_f = 1:length(list_out)
+    if exist(list_out{num_f},'dir')||~psom_exist(list_out{num_f})
+        % folders or missing outputs, the job can not be cached
+        return
+    end
+    targets{end+1} = list_out{num_f};
+    index(end+1) = num_f;
+    flag_extra(end+1) = false;
+    file_extra = sub_extra(list_out{num_f});
+    if psom_exist(file_extra)
+        targets{end+1} = file_extra;
+        index(end+1) = num_f;
+        flag_extra(end+1) = true;
+    end
+end
+
+path_tmp = sprintf('%s.tmp%i',path_entry(1:end-1),getpid);
+try
+    psom_mkdir(path_tmp);
+    files = cell(size(targets));
+    for num_f = 1:length(targets)
+        [tmp,name_f,ext_f] = fileparts(targets{num_f});
+        files{num_f} = sprintf('%i_%s%s',num_f,name_f,ext_f);
+        sub_copy(targets{num_f},[path_tmp filesep files{num_f}]);
+        sub_system(['chmod a-w "' path_tmp filesep files{num_f} '"']);
+    end
+    save([path_tmp filesep 'manifest.mat'],'files','index','flag_extra');
+    if rename(path_tmp,path_entry(1:end-1)) == 0
+        return
+    end
+catch
+    fprintf('Could not store the outputs in the cache %s\n%s\n',path_entry,lasterr);
+end
+% Another job stored the same key first
+if exist(path_tmp,'dir')
+    rmdir(path_tmp,'s');
+end
+
+%%%%%%%%%%%%%%%%%%
+%% SUBFUNCTIONS %%
+%%%%%%%%%%%%%%%%%%
+
+function list_files = sub_files(files)
+%% The file names of a files_in / files_out structure
+list_files = psom_files2cell(files);
+mask = ~ismember(list_files,{'gb_niak_omitted','gb_psom_omitted'});
+list_files = list_files(mask);
+
+function key = sub_key(files_in,list_out,opt_cache,version,path_cache)
+%% The hash of the job
+list_in = sub_files(files_in);
+hash_in = cell(size(list_in));
+for num_f = 1:length(list_in)
+    if psom_exist(list_in{num_f})&&~exist(list_in{num_f},'dir')
+        hash_in{num_f} = sub_hash_input(list_in{num_f},path_cache);
+    else
+        hash_in{num_f} = list_in{num_f};
+    end
+end
+str_job = [version char(10) opt_cache.command char(10) savejson('',opt_cache.opt) char(10) ...
+           sprintf('%s\n',list_out{:}) sprintf('%s\n',hash_in{:})];
+if ~isempty(opt_cache.folder_out)
+    str_job = strrep(str_job,opt_cache.folder_out,'<folder_out>');
+end
+key = niak_datahash(str_job);
+key = lower(key);
+
+function hash = sub_hash_input(file_name,path_cache)
+%% The md5 of an input, read in the digests of the cache if the file did not change
+file_name = niak_full_path(file_name);
+file_name = file_name(1:end-1);
+info = dir(file_name);
+stamp = lower(niak_datahash(sprintf('%s\n%i\n%.6f',file_name,info.bytes,info.datenum)));
+file_digest = [path_cache 'digests' filesep stamp(1:2) filesep stamp];
+if psom_exist(file_digest)
+    hash = strtrim(fileread(file_digest));
+    if length(hash) == 32
+        return
+    end
+end
+hash = sub_hash_file(file_name);
+% A file modified within the same second as its mtime could change again
+% without changing its stamp, its digest is not kept
+if (now - info.datenum)*86400 < 2
+    return
+end
+try
+    psom_mkdir(fileparts(file_digest));
+    file_tmp = sprintf('%s.part%i',file_digest,getpid);
+    hf = fopen(file_tmp,'w');
+    fprintf(hf,'%s\n',hash);
+    fclose(hf);
+    rename(file_tmp,file_digest);
+catch
+    % The digest is only a shortcut
+end
+
+function hash = sub_hash_file(file_name)
+%% The md5 of a file, without loading it in memory
+[status,msg] = system(['md5sum "' file_name '"']);
+if status ~= 0
+    error('Could not hash %s: %s',file_name,msg);
+end
+hash = strtok(msg);
+
+function file_extra = sub_extra(file_name)
+%% The file of extra information written by niak_write_vol along a volume
+[path_f,name_f] = niak_fileparts(file_name);
+file_extra = [path_f filesep name_f '_extra.mat'];
+
+function [] = sub_copy(source,target)
+%% Copy source on target, sharing their blocks when the file system supports it.
+%% The copy is writable, even if source is a read-only entry of the cache
+path_t = fileparts(target);
+if ~isempty(path_t)&&~exist(path_t,'dir')
+    psom_mkdir(path_t);
+end
+[status,msg] = system(['cp -f --reflink=auto "' source '" "' target '"']);
+if status ~= 0
+    % cp without --reflink, as on BSD and macOS
+    sub_system(['cp -f "' source '" "' target '"']);
+end
+sub_system(['chmod u+w "' target '"']);
+
+function [] = sub_system(cmd)
+%% Run a shell command, raise an error if it fails
+[status,msg] = system(cmd);
+if status ~= 0
+    error('Command %s failed: %s',cmd,msg);
+end
@@ -106,6 +106,21 @@ GB_NIAK.zip = 'gzip -f';
 % The command to unzip files
 GB_NIAK.unzip = 'gunzip -f';
 
+% Use pigz if available, it compresses with all cores and writes standard gzip files
+% The PATH is searched directly, without starting a shell, and only once
+% per session as GB_NIAK is then loaded
+if strcmp(GB_NIAK.OS,'unix')
+    list_path = niak_string2words(getenv('PATH'),{pathsep});
+    for num_p = 1:length(list_path)
+        if exist([list_path{num_p} filesep 'pigz'],'file')
+            GB_NIAK.zip = 'pigz -f';
+            GB_NIAK.unzip = 'pigz -d -f';
+            break
+        end
+    end
+    clear list_path num_p
+end
+
 % The extension of zipped files
 GB_NIAK.zip_ext = '.gz';
 
@@ -128,6 +143,10 @@ GB_NIAK.viewersvg ='eog';
 % The command to convert ps or eps documents into the pdf file format
 GB_NIAK.ps2pdf = 'ps2pdf';
 
+% The python interpreter, with numpy, scipy and h5py. The folder util of
+% NIAK is added to its PYTHONPATH in GB_NIAK.CMD_PYTHON
+GB_NIAK.python = 'python3';
+
 %%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
 %% The following variables should not be changed %%
 %%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
@@ -173,3 +192,6 @@ end
 if exist('niak_gb_vars_local.m','file')
     niak_gb_vars_local
 end
+
+%% The command to run the modules of util/pyniak, e.g. [GB_NIAK.cmd_python ' -m pyniak.stability']
+GB_NIAK.cmd_python = ['PYTHONPATH="' GB_NIAK.path_niak 'util' pathsep '$PYTHONPATH" ' GB_NIAK.python];
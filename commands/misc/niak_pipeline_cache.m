@@ -0,0 +1,107 @@
+function pipeline = niak_pipeline_cache(pipeline,path_cache,folder_out)
+% Run the jobs of a pipeline through a shared cache of brick results.
+%
+% SYNTAX:
+% PIPELINE = NIAK_PIPELINE_CACHE(PIPELINE,PATH_CACHE,FOLDER_OUT)
+%
+% _________________________________________________________________________
+% INPUTS:
+%
+% PIPELINE
+%   (structure) a PSOM pipeline.
+%
+% PATH_CACHE
+%   (string) the folder of the cache, shared between runs.
+%
+% FOLDER_OUT
+%   (string, default '') the output folder of the pipeline. Paths in this
+%   folder are not part of the cache keys, so runs in different output
+%   folders share their results.
+%
+% _________________________________________________________________________
+% OUTPUTS:
+%
+% PIPELINE
+%   (structure) the same pipeline, where the jobs with outputs run
+%   NIAK_CACHE_JOB. The command and options of the job are moved in the
+%   fields COMMAND and OPT of OPT.
+%
+% _________________________________________________________________________
+% COMMENTS:
+%
+% Jobs without outputs (e.g. cleanup) and jobs with outputs named by
+% default (empty strings in FILES_OUT) are not cached.
+%
+% Copyright (c) The NIAK contributors, 2026.
+% Maintainer : pierre.bellec@criugm.qc.ca
+% See licensing information in the code.
+% Keywords : pipeline, psom, cache
+
+% Permission is hereby granted, free of charge, to any person obtaining a copy
+% of this software and associated documentation files (the "Software"), to deal
+% in the Software without restriction, including without limitation the rights
+% to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+% copies of the Software, and to permit persons to whom the Software is
+% furnished to do so, subject to the following conditions:
+%
+% The above copyright notice and this permission notice shall be included in
+% all copies or substantial portions of the Software.
+%
+% THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+% IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+% FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+% AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+% LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+% OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+% THE SOFTWARE.
+
+if nargin < 3
+    folder_out = '';
+end
+
+path_cache = niak_full_path(path_cache);
+if ~isempty(folder_out)
+    folder_out = niak_full_path(folder_out);
+end
+
+list_jobs = fieldnames(pipeline);
+for num_j = 1:length(list_jobs)
+    job = pipeline.(list_jobs{num_j});
+    if ~isfield(job,'command')||~isfield(job,'files_out')||isempty(job.files_out)
+        continue
+    end
+    if (isfield(job,'files_clean')&&~isempty(job.files_clean))||sub_has_empty(job.files_out)
+        continue
+    end
+    if isfield(job,'opt')
+        opt_job = job.opt;
+    else
+        opt_job = struct();
+    end
+    if ~isfield(job,'files_in')
+        job.files_in = struct();
+    end
+    job.opt = struct();
+    job.opt.command = job.command;
+    job.opt.opt = opt_job;
+    job.opt.path_cache = path_cache;
+    job.opt.folder_out = folder_out;
+    job.command = 'niak_cache_job(files_in,files_out,opt)';
+    pipeline.(list_jobs{num_j}) = job;
+end
+
+%%%%%%%%%%%%%%%%%%
+%% SUBFUNCTIONS %%
+%%%%%%%%%%%%%%%%%%
+
+function flag = sub_has_empty(files)
+%% True if one of the file names is an empty string
+if ischar(files)
+    flag = isempty(files);
+elseif iscell(files)
+    flag = any(cellfun(@sub_has_empty,files(:)));
+elseif isstruct(files)
+    flag = any(cellfun(@sub_has_empty,struct2cell(files(:))));
+else
+    flag = false;
+end
@@ -0,0 +1,163 @@
+function plan = niak_plan_pipeline(pipeline,file_plan,path_history)
+% Describe the jobs of a pipeline, without running it.
+%
+% SYNTAX:
+% PLAN = NIAK_PLAN_PIPELINE(PIPELINE,FILE_PLAN,PATH_HISTORY)
+%
+% _________________________________________________________________________
+% INPUTS:
+%
+% PIPELINE
+%   (structure) a PSOM pipeline, for example the output of a NIAK_PIPELINE_*
+%   command invoked with OPT.FLAG_TEST = true.
+%
+% FILE_PLAN
+%   (string, default '') if not empty, PLAN is saved in this json file.
+%
+% PATH_HISTORY
+%   (string, default '') the output folder of a previous run of a similar
+%   pipeline. The elapsed time and outputs of its jobs are added to PLAN,
+%   to estimate the cost of PIPELINE. The jobs are read in the logs of the
+%   folder, and in the logs left by participant runs in logs/status.d that
+%   the group run did not merge yet.
+%
+% _________________________________________________________________________
+% OUTPUTS:
+%
+% PLAN
+%   (structure) with the following fields:
+%
+%   JOBS
+%       (cell of structures) one entry per job of PIPELINE, with fields:
+%       NAME (string) the name of the job.
+%       COMMAND (string) the command of the job.
+%       FILES_IN (cell of strings) the inputs of the job.
+%       FILES_OUT (cell of strings) the outputs of the job.
+%
+%   HISTORY
+%       (cell of structures) one entry per job of PATH_HISTORY, with fields:
+%       NAME (string) the name of the job.
+%       ELAPSED_TIME (scalar) the run time of the job, in seconds, -1 if
+%          unknown.
+%       BYTES_OUT (scalar) the size of the outputs of the job when it
+%          finished, -1 if unknown.
+%       FILES_OUT (cell of strings) the outputs of the job.
+%
+% _________________________________________________________________________
+% COMMENTS:
+%
+% Dependencies between jobs are not listed, they follow from FILES_IN and
+% FILES_OUT: a job depends on all the jobs producing one of its inputs.
+%
+% BYTES_OUT is read in logs/PIPE_sizes.mat, written for participant runs
+% whose working folder is removed once the outputs are shipped.
+%
+% Copyright (c) The NIAK contributors, 2026.
+% Maintainer : pierre.bellec@criugm.qc.ca
+% See licensing information in the code.
+% Keywords : pipeline, psom, test
+
+% Permission is hereby granted, free of charge, to any person obtaining a copy
+% of this software and associated documentation files (the "Software"), to deal
+% in the Software without restriction, including without limitation the rights
+% to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+% copies of the Software, and to permit persons to whom the Software is
+% furnished to do so, subject to the following conditions:
+%
+% The above copyright notice and this permission notice shall be included in
+% all copies or substantial portions of the Software.
+%
+% THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+% IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+% FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+% AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+% LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+% OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+% THE SOFTWARE.
+
+if nargin < 2
+    file_plan = '';
+end
+
+if nargin < 3
+    path_history = '';
+end
+
+%% The jobs of the pipeline
+list_jobs = fieldnames(pipeline);
+plan.jobs = cell(length(list_jobs),1);
+for num_j = 1:length(list_jobs)
+    job = pipeline.(list_jobs{num_j});
+    plan.jobs{num_j}.name = list_jobs{num_j};
+    if isfield(job,'command')
+        plan.jobs{num_j}.command = job.command;
+    else
+        plan.jobs{num_j}.command = '';
+    end
+    plan.jobs{num_j}.files_in = sub_files(job,'files_in');
+    plan.jobs{num_j}.files_out = sub_files(job,'files_out');
+end
+
+%% The jobs of a previous run
+plan.history = {};
+if ~isempty(path_history)
+    path_logs = [niak_full_path(path_history) 'logs' filesep];
+    plan.history = sub_history([path_logs 'PIPE_jobs.mat'],[path_logs 'PIPE_profile.mat'],[path_logs 'PIPE_sizes.mat']);
+    %% The logs of participant runs, see util/pyniak/psom_status.py
+    path_shards = [path_logs 'status.d' filesep];
+    list_shards = dir([path_shards '*_jobs.mat']);
+    for num_s = 1:length(list_shards)
+        name_shard = list_shards(num_s).name(1:end-length('_jobs.mat'));
+        plan.history = [plan.history ; sub_history([path_shards name_shard '_jobs.mat'],[path_shards name_shard '_profile.mat'],[path_shards name_shard '_sizes.mat'])];
+    end
+end
+
+if ~isempty(file_plan)
+    savejson('',plan,file_plan);
+end
+
+%%%%%%%%%%%%%%%%%%
+%% SUBFUNCTIONS %%
+%%%%%%%%%%%%%%%%%%
+
+function history = sub_history(file_jobs,file_profile,file_sizes)
+%% The name, elapsed time, outputs and size of the outputs of the jobs of a PSOM log
+history = {};
+if ~psom_exist(file_jobs)
+    return
+end
+jobs = load(file_jobs);
+if psom_exist(file_profile)
+    profile = load(file_profile);
+else
+    profile = struct();
+end
+if psom_exist(file_sizes)
+    sizes = load(file_sizes);
+else
+    sizes = struct();
+end
+list_hist = fieldnames(jobs);
+history = cell(length(list_hist),1);
+for num_j = 1:length(list_hist)
+    name_job = list_hist{num_j};
+    history{num_j}.name = name_job;
+    history{num_j}.elapsed_time = -1;
+    if isfield(profile,name_job) && isfield(profile.(name_job),'elapsed_time') ...
+       && ~isempty(profile.(name_job).elapsed_time)
+        history{num_j}.elapsed_time = profile.(name_job).elapsed_time;
+    end
+    history{num_j}.bytes_out = -1;
+    if isfield(sizes,name_job)
+        history{num_j}.bytes_out = sizes.(name_job);
+    end
+    history{num_j}.files_out = sub_files(jobs.(name_job),'files_out');
+end
+
+function files = sub_files(job,field)
+%% The input or output files of a job, as a cell of strings
+if isfield(job,field)
+    files = psom_files2cell(job.(field));
+else
+    files = {};
+end
@@ -30,7 +30,8 @@ function [hdr,vol] = niak_read_minc(file_name,precision_data)
 % COMMENTS: 
 %
 % Use shell commands MINCINFO (for minc1), MINCHEADER and MINCTORAW which 
-% requires a proper install of minc tools. This function is
+% requires a proper install of minc tools. In Octave, the output of 
+% MINCTORAW is read through a pipe. In Matlab, this function is
 % creating temporary files. If it does not work, try to change the location 
 % of temporary files using the GB_NIAK_TMP variable defined in 
 % the NIAK_GB_VARS function.
@@ -69,27 +70,44 @@ hdr.info.precision = precision_data;
 [path_tmp,name_tmp,ext_tmp] = fileparts(file_name);
 
 if nargout == 2
-    %% Generating a name for a temporary file
-    file_tmp = niak_file_tmp([name_tmp '.dat']);
+    niak_gb_vars
+    instr_raw = cat(2,'minctoraw -',precision_data,' -normalize "',file_name,'"');
+    nb_vox = prod(hdr.info.dimensions);
+    
+    if strcmp(GB_NIAK.language,'octave')
+        %% Reading the data straight from minctoraw, without temporary file
+        hf = popen(instr_raw,'r');
+        if hf < 0
+            error('niak:read : could not run %s',instr_raw)
+        end
+        vol = fread(hf,nb_vox,['*' precision_data]);
+        pclose(hf);
+        if numel(vol) ~= nb_vox
+            error('niak:read : %s returned %i values instead of %i',instr_raw,numel(vol),nb_vox)
+        end
+    else
+        %% Generating a name for a temporary file
+        file_tmp = niak_file_tmp([name_tmp '.dat']);
 
-    %% extracting the data in float precision in the temporary file
-    [flag,str_info] = system(cat(2,'minctoraw -',precision_data,' -normalize ',file_name,' > ',file_tmp));
+        %% extracting the data in float precision in the temporary file
+        [flag,str_info] = system(cat(2,instr_raw,' > ',file_tmp));
     
-    if flag>0
-        error(sprintf('niak:read : %s',str_info))
-    end
+        if flag>0
+            error(sprintf('niak:read : %s',str_info))
+        end
     
-    %% reading information
-    hf = fopen(file_tmp,'r');
-    try
-        vol = fread(hf,prod(hdr.info.dimensions),['*' precision_data]);
-    catch
-        vol = fread(hf,prod(hdr.info.dimensions),precision_data);
-    end
+        %% reading information
+        hf = fopen(file_tmp,'r');
+        try
+            vol = fread(hf,nb_vox,['*' precision_data]);
+        catch
+            vol = fread(hf,nb_vox,precision_data);
+        end
 
-    %% Removing temporary stuff
-    fclose(hf);
-    delete(file_tmp);
+        %% Removing temporary stuff
+        fclose(hf);
+        delete(file_tmp);
+    end
 
     %% Shapping vol as 3D+t array
     vol = reshape(vol,hdr.info.dimensions);
@@ -0,0 +1,106 @@
+function [store,tseries] = niak_read_store(file_store,num_b)
+% Read the time series of a block of voxels in a store of time series.
+%
+% SYNTAX:
+% [STORE,TSERIES] = NIAK_READ_STORE(FILE_STORE,NUM_B)
+%
+% _________________________________________________________________________
+% INPUTS:
+%
+% FILE_STORE
+%   (string) the folder of a store, see NIAK_VOL2STORE.
+%
+% NUM_B
+%   (integer) the number of a block of voxels.
+%
+% _________________________________________________________________________
+% OUTPUTS:
+%
+% STORE
+%   (structure) the description of the store, with the following fields:
+%
+%   HDR
+%       (structure) the header of the volume, see NIAK_READ_VOL.
+%
+%   DIM
+%       (vector 1x4) the dimensions [nx ny nz nt] of the volume.
+%
+%   BLOCKS
+%       (array Bx2) BLOCKS(B,:) are the first and last linear index of the
+%       voxels of the B-th block.
+%
+%   PRECISION
+%       (string) the precision of the data on disk, 'float32' or 'double'.
+%
+%   FILE_NAME
+%       (string) FILE_STORE.
+%
+% TSERIES
+%   (array T x V) the time series of the voxels
+%   STORE.BLOCKS(NUM_B,1):STORE.BLOCKS(NUM_B,2), single if PRECISION is
+%   'float32'.
+%
+% _________________________________________________________________________
+% COMMENTS:
+%
+% With one output, only the description of the store is read.
+%
+% The voxels of a block are in the order of the linear indices of the
+% volume, so that TSERIES(:,MASK(BLOCKS(NUM_B,1):BLOCKS(NUM_B,2))>0) are
+% the columns of NIAK_VOL2TSERIES(VOL,MASK) for that block.
+%
+% Copyright (c) The NIAK contributors, 2026.
+% See licensing information in the code.
+% Keywords : medical imaging, I/O, time series, memory
+
+% Permission is hereby granted, free of charge, to any person obtaining a copy
+% of this software and associated documentation files (the "Software"), to deal
+% in the Software without restriction, including without limitation the rights
+% to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+% copies of the Software, and to permit persons to whom the Software is
+% furnished to do so, subject to the following conditions:
+%
+% The above copyright notice and this permission notice shall be included in
+% all copies or substantial portions of the Software.
+%
+% THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+% IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+% FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+% AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+% LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+% OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+% THE SOFTWARE.
+
+file_header = [file_store filesep 'header.mat'];
+if ~psom_exist(file_header)
+    error('Could not find the store of time series %s',file_store)
+end
+store = load(file_header);
+store.file_name = file_store;
+
+if nargout < 2
+    return
+end
+
+if (num_b < 1)||(num_b > size(store.blocks,1))
+    error('The store %s has %i blocks, I could not read block %i',file_store,size(store.blocks,1),num_b)
+end
+switch store.precision
+    case 'float32'
+        nb_bytes = 4;
+    case 'double'
+        nb_bytes = 8;
+end
+nt = store.dim(4);
+nb_vox_b = store.blocks(num_b,2)-store.blocks(num_b,1)+1;
+fid = fopen([file_store filesep 'data.bin'],'r');
+if fid < 0
+    error('Cannot open the data of the store %s',file_store)
+end
+fseek(fid,(store.blocks(num_b,1)-1)*nt*nb_bytes,'bof');
+tseries = fread(fid,nt*nb_vox_b,['*' store.precision]);
+fclose(fid);
+if length(tseries) < nt*nb_vox_b
+    error('The block %i of the store %s is incomplete',num_b,file_store)
+end
+tseries = reshape(tseries,[nt nb_vox_b]);
@@ -105,7 +105,7 @@ function [hdr,vol] = niak_read_vol(file_name)
 %
 % NOTE 3:
 % The extension of zipped file is assumed to be .gz. The tools used to
-% unzip files in 'gunzip'. This setting can be changed by changing the
+% unzip files in 'pigz -d' if available, 'gunzip' otherwise. This setting can be changed by changing the
 % variables GB_NIAK_ZIP_EXT and GB_NIAK_UNZIP in the file NIAK_GB_VARS.
 %
 % NOTE 4:
@@ -222,28 +222,27 @@ else
 
                 [path_f_tmp,name_f,type] = fileparts(name_f);
                 file_extra = [path_f filesep name_f '_extra.mat'];
-                file_tmp_gz = niak_file_tmp([name_f type GB_NIAK.zip_ext]);
+                file_tmp = niak_file_tmp([name_f type]);
                 
-                [succ,msg] = system(cat(2,'cp "',file_name,'" ',file_tmp_gz));
-                if succ~=0
-                    error(msg)
-                end
-                
-                instr_unzip = cat(2,GB_NIAK.unzip,' "',file_tmp_gz,'"');
+                %% Decompress straight in the temporary file, the archive is not copied
+                instr_unzip = cat(2,GB_NIAK.unzip,' -c "',file_name,'" > "',file_tmp,'"');
 
                 [succ,msg] = system(instr_unzip);
                 if succ ~= 0
                     fprintf(1,"can't run: %s\n", instr_unzip)
+                    if psom_exist(file_tmp)
+                        delete(file_tmp);
+                    end
                     error(cat(2,'niak:read: ',msg,'. There was a problem unzipping the file. Please check that the command ''',GB_NIAK.unzip,''' works, or change this command using the variable GB_NIAK_UNZIP in the file NIAK_GB_VARS'));
                 end
 
                 if nargout == 2
-                    [hdr,vol] = niak_read_vol(file_tmp_gz(1:end-length(GB_NIAK.zip_ext)));
+                    [hdr,vol] = niak_read_vol(file_tmp);
                 else
-                    hdr = niak_read_vol(file_tmp_gz(1:end-length(GB_NIAK.zip_ext)));
+                    hdr = niak_read_vol(file_tmp);
                 end
 
-                delete(file_tmp_gz(1:end-length(GB_NIAK.zip_ext)));
+                delete(file_tmp);
                 hdr.info.file_parent = file_name;
                 if psom_exist(file_extra)
                     hdr.extra = load(file_extra);
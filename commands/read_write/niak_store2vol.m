@@ -0,0 +1,73 @@
+function [hdr,vol] = niak_store2vol(file_store,file_vol)
+% Convert a store of time series into a 3D+t volume.
+%
+% SYNTAX:
+% [HDR,VOL] = NIAK_STORE2VOL(FILE_STORE,FILE_VOL)
+%
+% _________________________________________________________________________
+% INPUTS:
+%
+% FILE_STORE
+%   (string) the folder of a store, see NIAK_VOL2STORE.
+%
+% FILE_VOL
+%   (string, default '') if not empty, the volume is written in FILE_VOL.
+%
+% _________________________________________________________________________
+% OUTPUTS:
+%
+% HDR
+%   (structure) the header of the volume, see NIAK_READ_VOL.
+%
+% VOL
+%   (array nx x ny x nz x nt) the volume.
+%
+% _________________________________________________________________________
+% COMMENTS:
+%
+% The whole volume is loaded in memory.
+%
+% Copyright (c) The NIAK contributors, 2026.
+% See licensing information in the code.
+% Keywords : medical imaging, I/O, time series, memory
+
+% Permission is hereby granted, free of charge, to any person obtaining a copy
+% of this software and associated documentation files (the "Software"), to deal
+% in the Software without restriction, including without limitation the rights
+% to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+% copies of the Software, and to permit persons to whom the Software is
+% furnished to do so, subject to the following conditions:
+%
+% The above copyright notice and this permission notice shall be included in
+% all copies or substantial portions of the Software.
+%
+% THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+% IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+% FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+% AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+% LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+% OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+% THE SOFTWARE.
+
+if nargin < 2
+    file_vol = '';
+end
+
+store = niak_read_store(file_store);
+hdr = store.hdr;
+dim = store.dim;
+if strcmp(store.precision,'float32')
+    vol = zeros([prod(dim(1:3)) dim(4)],'single');
+else
+    vol = zeros([prod(dim(1:3)) dim(4)]);
+end
+for num_b = 1:size(store.blocks,1)
+    [store,tseries] = niak_read_store(file_store,num_b);
+    vol(store.blocks(num_b,1):store.blocks(num_b,2),:) = tseries';
+end
+vol = reshape(vol,dim);
+
+if ~isempty(file_vol)
+    hdr.file_name = file_vol;
+    niak_write_vol(hdr,vol);
+end
@@ -0,0 +1,188 @@
+function store = niak_vol2store(file_vol,file_store,opt)
+% Copy a 3D+t volume in a store of time series, chunked in blocks of voxels.
+%
+% SYNTAX:
+% STORE = NIAK_VOL2STORE(FILE_VOL,FILE_STORE,OPT)
+%
+% _________________________________________________________________________
+% INPUTS:
+%
+% FILE_VOL
+%   (string) a 3D+t volume (.mnc, .nii, .img, possibly zipped).
+%
+% FILE_STORE
+%   (string) the folder of the store, with a .tss extension.
+%
+% OPT
+%   (structure, optional) with the following fields:
+%
+%   MEMORY
+%       (integer, default 500) the memory (in MB) of the time series of
+%       a block of voxels. This sets the size of the blocks.
+%
+%   FLAG_VERBOSE
+%       (boolean, default true) print progress messages.
+%
+% _________________________________________________________________________
+% OUTPUTS:
+%
+% STORE
+%   (structure) the description of the store, see NIAK_READ_STORE.
+%
+% _________________________________________________________________________
+% COMMENTS:
+%
+% A store is a folder with two files:
+%   HEADER.MAT holds the description STORE of the data, with the fields
+%      HDR (the header of FILE_VOL), DIM ([nx ny nz nt]), BLOCKS (the first
+%      and last linear index of the voxels of each block, one block per row)
+%      and PRECISION (the precision of the data, 'float32' or 'double').
+%   DATA.BIN holds the time series, block after block. A block is an array
+%      time x voxels, in column-major order.
+%
+% Uncompressed NIFTI volumes are copied one block at a time, so that the
+% memory never exceeds OPT.MEMORY. Other formats are read at once.
+%
+% The time series of a block are read with NIAK_READ_STORE and written
+% with NIAK_WRITE_STORE. NIAK_STORE2VOL converts a store back to a volume.
+%
+% Copyright (c) The NIAK contributors, 2026.
+% See licensing information in the code.
+% Keywords : medical imaging, I/O, time series, memory
+
+% Permission is hereby granted, free of charge, to any person obtaining a copy
+% of this software and associated documentation files (the "Software"), to deal
+% in the Software without restriction, including without limitation the rights
+% to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+% copies of the Software, and to permit persons to whom the Software is
+% furnished to do so, subject to the following conditions:
+%
+% The above copyright notice and this permission notice shall be included in
+% all copies or substantial portions of the Software.
+%
+% THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+% IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+% FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+% AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+% LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+% OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+% THE SOFTWARE.
+
+niak_gb_vars
+
+if nargin < 2
+    error('Syntax: STORE = NIAK_VOL2STORE(FILE_VOL,FILE_STORE,OPT)')
+end
+if nargin < 3
+    opt = struct();
+end
+opt = psom_struct_defaults(opt, ...
+    { 'memory' , 'flag_verbose' }, ...
+    { 500      , true           });
+
+%% Zipped volumes are decompressed in a temporary file, and streamed from there
+[path_f,name_f,ext_f] = fileparts(file_vol);
+file_tmp = '';
+if strcmp(ext_f,GB_NIAK.zip_ext)
+    [tmp,name_f,ext_f] = fileparts(name_f);
+    if strcmp(ext_f,'.nii')
+        file_tmp = niak_file_tmp(ext_f);
+        instr_unzip = cat(2,GB_NIAK.unzip,' -c "',file_vol,'" > "',file_tmp,'"');
+        [succ,msg] = system(instr_unzip);
+        if succ ~= 0
+            error('niak:read: %s. There was a problem unzipping the file %s',msg,file_vol);
+        end
+    end
+end
+
+if isempty(file_tmp)&&~strcmp(ext_f,'.nii')
+    %% Other formats are read at once
+    if opt.flag_verbose
+        fprintf('Reading %s ...\n',file_vol);
+    end
+    [hdr,vol] = niak_read_vol(file_vol);
+    dim = [size(vol,1) size(vol,2) size(vol,3) size(vol,4)];
+    store = sub_init(hdr,dim,class(vol),file_store,opt.memory);
+    vol = reshape(vol,[prod(dim(1:3)) dim(4)]);
+    for num_b = 1:size(store.blocks,1)
+        niak_write_store(store,vol(store.blocks(num_b,1):store.blocks(num_b,2),:)',num_b);
+    end
+    return
+end
+
+if isempty(file_tmp)
+    file_tmp = file_vol;
+end
+hdr = niak_read_vol(file_tmp);
+if (hdr.details.datatype == 32)||(hdr.details.datatype == 1792)||(hdr.details.datatype == 128)||(hdr.details.datatype == 511)
+    error('Complex and RGB volumes are not supported in a store of time series (%s)',file_vol)
+end
+dim = max(hdr.details.dim(2:5),1);
+nb_vox = prod(dim(1:3));
+nb_bytes = hdr.details.bitpix/8;
+slope = hdr.details.scl_slope;
+inter = hdr.details.scl_inter;
+flag_scale = ((slope~=0)&&(slope~=1))||(inter~=0);
+precision_file = hdr.info.precision;
+
+%% Same header as NIAK_READ_NIFTI
+hdr.info.precision = 'float';
+hdr.details.scl_slope = 1;
+hdr.details.scl_inter = 0;
+if ~strcmp(file_tmp,file_vol)
+    hdr.info.file_parent = file_vol;
+    file_extra = [path_f filesep name_f '_extra.mat'];
+    if psom_exist(file_extra)
+        hdr.extra = load(file_extra);
+    end
+end
+store = sub_init(hdr,dim,'single',file_store,opt.memory);
+
+fid = fopen(file_tmp,'r',hdr.info.machine);
+if fid < 0
+    error('Cannot open file %s.',file_tmp);
+end
+for num_b = 1:size(store.blocks,1)
+    if opt.flag_verbose
+        fprintf('Copying block %i/%i of %s ...\n',num_b,size(store.blocks,1),file_vol);
+    end
+    first = store.blocks(num_b,1);
+    nb_vox_b = store.blocks(num_b,2)-first+1;
+    tseries = zeros([dim(4) nb_vox_b],'single');
+    for num_t = 1:dim(4)
+        fseek(fid,hdr.details.vox_offset+((num_t-1)*nb_vox+first-1)*nb_bytes,'bof');
+        tseries(num_t,:) = fread(fid,nb_vox_b,sprintf('*%s',precision_file))';
+    end
+    if flag_scale
+        tseries = slope*tseries+inter;
+    end
+    niak_write_store(store,tseries,num_b);
+end
+fclose(fid);
+if ~strcmp(file_tmp,file_vol)
+    delete(file_tmp);
+end
+
+%%%%%%%%%%%%%%%%%%
+%% SUBFUNCTIONS %%
+%%%%%%%%%%%%%%%%%%
+function store = sub_init(hdr,dim,type,file_store,memory)
+%% The description of the store, with blocks of at most MEMORY MB
+switch type
+    case 'single'
+        store.precision = 'float32';
+        nb_bytes = 4;
+    case 'double'
+        store.precision = 'double';
+        nb_bytes = 8;
+    otherwise
+        error('%s data are not supported in a store of time series',type)
+end
+hdr.file_name = '';
+store.hdr = hdr;
+store.dim = dim;
+nb_vox = prod(dim(1:3));
+size_b = max(floor(memory*2^20/(dim(4)*nb_bytes)),1);
+first = (1:size_b:nb_vox)';
+store.blocks = [first min(first+size_b-1,nb_vox)];
+store.file_name = file_store;
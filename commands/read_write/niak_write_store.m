@@ -0,0 +1,97 @@
+function [] = niak_write_store(store,tseries,num_b)
+% Write the time series of a block of voxels in a store of time series.
+%
+% SYNTAX:
+% [] = NIAK_WRITE_STORE(STORE,TSERIES,NUM_B)
+%
+% _________________________________________________________________________
+% INPUTS:
+%
+% STORE
+%   (structure) the description of the store, see NIAK_READ_STORE. The
+%   store is written in the folder STORE.FILE_NAME.
+%
+% TSERIES
+%   (array T x V) the time series of the voxels
+%   STORE.BLOCKS(NUM_B,1):STORE.BLOCKS(NUM_B,2).
+%
+% NUM_B
+%   (integer) the number of the block.
+%
+% _________________________________________________________________________
+% OUTPUTS:
+%
+% The block is written in STORE.FILE_NAME.
+%
+% _________________________________________________________________________
+% COMMENTS:
+%
+% The blocks have to be written in order: writing the first block creates
+% the store (and erases any previous content), the following blocks are
+% appended to the data.
+%
+% A store with the same blocks as an input store, but another header, is
+% built with:
+%   STORE_OUT = NIAK_READ_STORE(FILE_IN);
+%   STORE_OUT.HDR = HDR_OUT;
+%   STORE_OUT.FILE_NAME = FILE_OUT;
+%
+% Copyright (c) The NIAK contributors, 2026.
+% See licensing information in the code.
+% Keywords : medical imaging, I/O, time series, memory
+
+% Permission is hereby granted, free of charge, to any person obtaining a copy
+% of this software and associated documentation files (the "Software"), to deal
+% in the Software without restriction, including without limitation the rights
+% to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+% copies of the Software, and to permit persons to whom the Software is
+% furnished to do so, subject to the following conditions:
+%
+% The above copyright notice and this permission notice shall be included in
+% all copies or substantial portions of the Software.
+%
+% THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+% IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+% FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+% AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+% LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+% OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+% THE SOFTWARE.
+
+file_store = store.file_name;
+nt = store.dim(4);
+nb_vox_b = store.blocks(num_b,2)-store.blocks(num_b,1)+1;
+if any(size(tseries)~=[nt nb_vox_b])
+    error('The time series of block %i should be a %ix%i array',num_b,nt,nb_vox_b)
+end
+switch store.precision
+    case 'float32'
+        nb_bytes = 4;
+    case 'double'
+        nb_bytes = 8;
+    otherwise
+        error('%s is not a supported precision for a store of time series',store.precision)
+end
+
+file_data = [file_store filesep 'data.bin'];
+if num_b == 1
+    psom_mkdir(file_store);
+    hdr = store.hdr;
+    dim = store.dim;
+    blocks = store.blocks;
+    precision = store.precision;
+    save([file_store filesep 'header.mat'],'hdr','dim','blocks','precision');
+    fid = fopen(file_data,'w');
+else
+    fid = fopen(file_data,'r+');
+end
+if fid < 0
+    error('Cannot open the data of the store %s',file_store)
+end
+fseek(fid,0,'eof');
+if ftell(fid) ~= (store.blocks(num_b,1)-1)*nt*nb_bytes
+    fclose(fid);
+    error('The blocks of the store %s have to be written in order, I could not write block %i',file_store,num_b)
+end
+fwrite(fid,tseries,store.precision);
+fclose(fid);
@@ -102,8 +102,8 @@ function [] = niak_write_vol(hdr,vol)
 % COMMENTS:
 %
 % As mentioned in the description of HDR.FILE_NAME, the extension of zipped 
-% file is assumed to be .gz. The tools used to zip files is 'gzip'. This 
-% setting can be changed by changing the variables GB_NIAK_ZIP_EXT and 
+% file is assumed to be .gz. The tools used to zip files is 'pigz' if 
+% available, 'gzip' otherwise. This setting can be changed by changing the variables GB_NIAK_ZIP_EXT and 
 % GB_NIAK_UNZIP in the file NIAK_GB_VARS.
 %
 % Other fields of HDR can be used in MINC format to speed up writting. 
@@ -297,16 +297,18 @@ elseif ischar(file_name)
         end
 
         if flag_zip
-            instr_zip = cat(2,GB_NIAK.zip,' ',hdr.file_name);
+            %% Compress straight to the final destination, the archive is not moved
+            instr_zip = cat(2,GB_NIAK.zip,' -c "',hdr.file_name,'" > "',file_name,'"');
             [status,msg] = system(instr_zip);
             if status~=0
+                % Do not leave a truncated archive at the destination
+                delete(hdr.file_name);
+                if psom_exist(file_name)
+                    delete(file_name);
+                end
                 error(cat(2,'niak:write: ',msg,'. There was a problem when attempting to zip the file. Please check that the command ''',GB_NIAK.zip,''' works, or change program using the variable GB_NIAK_ZIP in the file NIAK_GB_VARS'));
             end
-            instr_mv = ['mv "' hdr.file_name GB_NIAK.zip_ext '" "' file_name '"'];
-            [status,msg] = system(instr_mv);
-            if status~=0
-                error(cat(2,'niak:write: ',msg,'. There was a problem moving the compressed file from the temporary folder to its final destination'));
-            end
+            delete(hdr.file_name);
         end
         
         %% Copy extra information, only if the number of time frames match with the actual data
@@ -38,6 +38,14 @@ function [res_ica]=niak_sica(data,opt)
 %           graphical wait bar highly unstable in batch mode). Available
 %           options : 'on' or 'off'.
 %
+%       SVD
+%           (structure, default struct()) the options of the PCA reduction 
+%           of the data before ICA. With SVD.FLAG_RAND = true, the principal
+%           components are estimated with a randomized truncated SVD, and the 
+%           other fields of SVD are passed to NIAK_SVD_RAND. This is only 
+%           used with the 'Infomax' algorithm and a fixed number of 
+%           components (TYPE_NB_COMP = 0 and PARAM_NB_COMP > 0).
+%
 % _________________________________________________________________________
 % OUTPUTS:
 %
@@ -84,6 +92,8 @@ function [res_ica]=niak_sica(data,opt)
 % The number of components cannot exceed the inner dimension of the data, as 
 % indicated by the RANK function . This value is usually a couple of 
 % components less than the actual number of time samples of the data.
+% With OPT.SVD.FLAG_RAND, the rank is not computed and the number of 
+% components is only bounded by the size of the data.
 %
 % Copyright (c) Vincent Perlbarg, U678, LIF, Inserm, UMR_S 678, Laboratoire
 % d'Imagerie Fonctionnelle, F-75634, Paris, France, 2005-2010.
@@ -140,6 +150,13 @@ else
     algo = 'Infomax';
 end
 
+if isfield(opt,'svd')
+    opt_svd = opt.svd;
+else
+    opt_svd = struct();
+end
+flag_rand = isfield(opt_svd,'flag_rand') && opt_svd.flag_rand && strcmp(algo,'Infomax') && (type_nb_comp == 0) && (param_nb_comp ~= -1);
+
 
 if type_nb_comp == 1 %energie  conserver sans gui
         
@@ -167,7 +184,11 @@ elseif type_nb_comp==0 %param=nbcomp
         nbcomp = param_nb_comp;
     end
 end
-nbcomp = min(nbcomp,rank(data));
+if flag_rand
+    nbcomp = min(nbcomp,min(size(data)));
+else
+    nbcomp = min(nbcomp,rank(data));
+end
 varData = (1/(size(data,1)-1))*sum((data').^2,2);
 residus = [];
 
@@ -180,7 +201,11 @@ if strcmp(algo,'Infomax')
     %        is_verbose = 0;
     %end            
             
-    [weights,sphere] = niak_sub_runica(data,'sphering','off','ncomps',nbcomp,'pca',nbcomp,'verbose',is_verbose,'maxsteps',300);
+    if flag_rand
+        [weights,sphere] = niak_sub_runica(data,'sphering','off','ncomps',nbcomp,'pca',nbcomp,'svd',opt_svd,'verbose',is_verbose,'maxsteps',300);
+    else
+        [weights,sphere] = niak_sub_runica(data,'sphering','off','ncomps',nbcomp,'pca',nbcomp,'verbose',is_verbose,'maxsteps',300);
+    end
     W=weights*sphere;
     a = pinv(W);
     IC=W*data;
@@ -276,6 +301,9 @@ res_ica.residus = residus';
 %                            (defaults [srate 0 srate/2 size(data,2) size(data,2)])
 % 'posact'    = make all component activations net-positive(default 'on'}
 % 'verbose'   = give ascii messages ('on'/'off')        (default -> 'on')
+% 'svd'       = [struct] with the field FLAG_RAND = true, the 'pca' reduction
+%               uses a randomized truncated SVD, see NIAK_SVD_RAND
+%                                                       (default -> exact)
 %
 % Outputs: [RO: output in reverse order of projected mean variance
 %                        unless starting weight matrix passed ('weights' above)]
@@ -433,6 +461,7 @@ end
 epochs = 1;							 % do not care how many epochs in data
 
 pcaflag    = DEFAULT_PCAFLAG;
+opt_svd    = struct();
 sphering   = DEFAULT_SPHEREFLAG;     % default flags
 posactflag = DEFAULT_POSACTFLAG;
 verbose    = DEFAULT_VERBOSE;
@@ -704,6 +733,12 @@ for i = 3:2:nargin % for each Keyword
                 end
             end
         end
+    elseif strcmp(Keyword,'svd')
+        if ~isstruct(Value)
+            fprintf('runica(): svd value must be a structure')
+            return
+        end
+        opt_svd = Value;
     elseif strcmp(Keyword,'verbose')
         if ~ischar(Value)
             fprintf('runica(): verbose flag value must be on or off')
@@ -844,14 +879,23 @@ if strcmp(pcaflag,'on')
         fprintf('    Reducing the data to %d principal dimensions...\n',ncomps);
     end
 
-    covarianceMatrix = cov(data');
-    [E, D] = eig(covarianceMatrix);
-    [eigenval,index] = sort(diag(D));
-    index=rot90(rot90(index));
-    eigenvalues=rot90(rot90(eigenval))';
-    eigenvectors=E(:,index);
-    residus = eigenvectors(:,ncomps+1:end)*eigenvectors(:,ncomps+1:end)'*data;
-    data = eigenvectors(:,1:ncomps)'*data;
+    if isfield(opt_svd,'flag_rand') && opt_svd.flag_rand
+        % the rows are centered, the left singular vectors are the eigen vectors of the covariance
+        eigenvectors = niak_svd_rand(data,ncomps,rmfield(opt_svd,'flag_rand'));
+        if nargout > 2
+            residus = data - eigenvectors*(eigenvectors'*data);
+        end
+        data = eigenvectors'*data;
+    else
+        covarianceMatrix = cov(data');
+        [E, D] = eig(covarianceMatrix);
+        [eigenval,index] = sort(diag(D));
+        index=rot90(rot90(index));
+        eigenvalues=rot90(rot90(eigenval))';
+        eigenvectors=E(:,index);
+        residus = eigenvectors(:,ncomps+1:end)*eigenvectors(:,ncomps+1:end)'*data;
+        data = eigenvectors(:,1:ncomps)'*data;
+    end
 
     %    [pc,coeff,sigma] = runpca(data);
     %    data = coeff(:,1:ncomps)'*data;
@@ -52,6 +52,10 @@ function [files_in,files_out,opt] = niak_brick_glm_connectome_perm(files_in,file
 %      (integer, default 1000) the number of samples under the null hypothesis
 %      used to test the significance of the number of discoveries.
 %   
+%   MEMORY
+%      (integer, default 500) the memory (in MB) of the permuted connectomes 
+%      of a batch of samples. The samples of a batch are fitted at once.
+%
 %   RAND_SEED
 %       (scalar, default []) The specified value is used to seed the random
 %       number generator with PSOM_SET_RAND_SEED. If left empty, no action
@@ -80,6 +84,14 @@ function [files_in,files_out,opt] = niak_brick_glm_connectome_perm(files_in,file
 %
 % The input files are generated with NIAK_BRICK_GLM_CONNECTOME
 %
+% The samples under the null are generated like NIAK_PERMUTATION_GLM, 
+% with the same draws of the random number generator. The fit of the 
+% restricted model and the pseudo-inverse of the design are computed once,
+% and the permuted connectomes of a batch of samples are fitted with a 
+% single matrix product for each scale (and site). The permutation samples
+% of a study are split in independent jobs, with their own seeds, by 
+% NIAK_PIPELINE_GLM_CONNECTOME (see OPT.NB_BATCH).
+%
 % Copyright (c) Pierre Bellec, Centre de recherche de l'institut de 
 % Gériatrie de Montréal, Département d'informatique et de recherche 
 % opérationnelle, Université de Montréal, 2012.
@@ -125,8 +137,8 @@ if ~ischar(files_out)
 end
 
 %% Options
-list_fields   = { 'nb_samps' , 'fdr' , 'type_fdr'  , 'rand_seed' , 'flag_verbose' , 'flag_test'  };
-list_defaults = { 1000       , 0.05  , 'BH-global' , []          , true           , false        };
+list_fields   = { 'nb_samps' , 'fdr' , 'type_fdr'  , 'memory' , 'rand_seed' , 'flag_verbose' , 'flag_test'  };
+list_defaults = { 1000       , 0.05  , 'BH-global' , 500      , []          , true           , false        };
 if nargin < 3
     opt = psom_struct_defaults(struct,list_fields,list_defaults);
 else
@@ -172,87 +184,157 @@ if opt.nb_samps>0
     if opt.flag_verbose
         fprintf('Estimate the significance of the number of findings ...\n')
     end
-    p_vol_disc = 0;
-    p_perc_disc = 0;
+    
+    %% One model per scale (row) and site (column)
+    if ~d.flag_multisite
+        glm = glm(:);
+    end
+    [nb_scale,nb_site] = size(glm);
+    for ss = 1:nb_site
+        for num_e = 1:nb_scale
+            pre(num_e,ss) = sub_prepare(glm(num_e,ss));
+        end
+    end
+    clear glm
+    
+    %% The number of samples in a batch
+    nb_val = 0;
+    for ss = 1:nb_site
+        for num_e = 1:nb_scale
+            nb_val = nb_val + numel(pre(num_e,ss).y);
+        end
+    end
+    size_batch = min(max(floor(opt.memory*2^20/(8*nb_val)),1),opt.nb_samps);
+    
     vol_disc_null = zeros([opt.nb_samps 1]);
     perc_disc_null = zeros([opt.nb_samps 1]);
-    
-    opt_glm.test = 'ttest';
-    for num_s = 1:opt.nb_samps
-        if opt.flag_verbose
-            niak_progress(num_s,opt.nb_samps);
+    y_null = cell(nb_scale,nb_site);
+    for num_s = 1:size_batch:opt.nb_samps
+        list_s = num_s:min(num_s+size_batch-1,opt.nb_samps);
+        nb_b = length(list_s);
+        
+        %% Draw the samples of the batch, in the order of NIAK_PERMUTATION_GLM
+        for ss = 1:nb_site
+            for num_e = 1:nb_scale
+                y_null{num_e,ss} = zeros(size(pre(num_e,ss).y,1),size(pre(num_e,ss).y,2)*nb_b);
+            end
         end
-        if d.flag_multisite
-            res_null = struct();
-            for ss = 1:length(results.multisite.list_site)
-                glm_null(:,ss) = niak_permutation_glm(glm(:,ss));                
+        for bb = 1:nb_b
+            for ss = 1:nb_site
+                perm_obs = randperm(size(pre(1,ss).y,1));
+                for num_e = 1:nb_scale
+                    nb_conn = size(pre(num_e,ss).y,2);
+                    y_null{num_e,ss}(:,(bb-1)*nb_conn+(1:nb_conn)) = sub_permute(pre(num_e,ss),perm_obs);
+                end
             end
-            for num_e = 1:size(glm_null,1)                            
-                for ss = 1:length(results.multisite.list_site)
-                    res_null(ss) = niak_glm(glm_null(num_e,ss),opt_glm);
+        end
+        
+        %% Fit the batch, one scale at a time
+        for num_e = 1:nb_scale
+            if d.flag_multisite
+                for ss = 1:nb_site
+                    [ttest_s,pce_s,eff_s,std_eff_s] = sub_ttest(pre(num_e,ss),y_null{num_e,ss});
+                    y_null{num_e,ss} = [];
                     if ss == 1
-                        eff = zeros(size(res_null(1).eff));
-                        std_eff = zeros(size(res_null(1).std_eff));
+                        eff = zeros(size(eff_s));
+                        std_eff = zeros(size(std_eff_s));
                     end
-                    eff = eff + res_null(ss).eff./(res_null(ss).std_eff).^2;
-                    std_eff = std_eff + 1./(res_null(ss).std_eff).^2;
+                    eff = eff + eff_s./(std_eff_s).^2;
+                    std_eff = std_eff + 1./(std_eff_s).^2;
                 end
                 eff = eff ./ std_eff;
                 std_eff = sqrt(1./std_eff);
                 ttest = eff./std_eff;
                 pce = 2*(1-normcdf(abs(ttest)));
-                [fdr_null,test_null] = niak_glm_fdr(pce,opt.type_fdr,opt.fdr,type_measure); 
-                nb_disc_null = sum(test_null,1);
-                perc_disc_null(num_s) = perc_disc_null(num_s) + mean(nb_disc_null/size(fdr_null,1));
-
-                switch type_measure
-                    case 'correlation'
-                        ttest_mat = niak_lvec2mat (ttest);        
-                    case 'glm'
-                        ttest_mat = reshape (ttest,[sqrt(length(ttest)),sqrt(length(ttest))]);
-                    otherwise
-                        error('%s is an unkown type of measure',type_measure)
-                end
-                if any(test_null(:))
-                    vol_disc_null(num_s) = vol_disc_null(num_s) + sum(ttest_mat(test_null(:)).^2);
-                else
-                    vol_disc_null(num_s) = vol_disc_null(num_s) + max(ttest_mat(:).^2);
-                end 
-            end            
-        else
-            glm_null = niak_permutation_glm(glm);        
-            for num_e = 1:length(glm_null)
-                res_null = niak_glm(glm_null(num_e),opt_glm);            
-                [fdr_null,test_null] = niak_glm_fdr(res_null.pce,opt.type_fdr,opt.fdr,type_measure);
-                nb_disc_null = sum(test_null,1);
-                perc_disc_null(num_s) = perc_disc_null(num_s) + mean(nb_disc_null/size(fdr_null,1));
-
-                switch type_measure
-                    case 'correlation'
-                        ttest_mat = niak_lvec2mat (res_null.ttest);        
-                    case 'glm'
-                        ttest_mat = reshape (res_null.ttest,[sqrt(length(res_null.ttest)),sqrt(length(res_null.ttest))]);
-                    otherwise
-                        error('%s is an unkown type of measure',type_measure)
-                end
-                if any(test_null(:))
-                    vol_disc_null(num_s) = vol_disc_null(num_s) + sum(ttest_mat(test_null(:)).^2);
-                else
-                    vol_disc_null(num_s) = vol_disc_null(num_s) + max(ttest_mat(:).^2);
-                end            
+            else
+                [ttest,pce] = sub_ttest(pre(num_e),y_null{num_e});
+                y_null{num_e} = [];
+            end
+            nb_conn = size(pre(num_e,1).y,2);
+            for bb = 1:nb_b
+                ind = (bb-1)*nb_conn+(1:nb_conn);
+                [vol_null,perc_null] = sub_discoveries(ttest(ind),pce(ind),opt,type_measure);
+                vol_disc_null(list_s(bb)) = vol_disc_null(list_s(bb)) + vol_null;
+                perc_disc_null(list_s(bb)) = perc_disc_null(list_s(bb)) + perc_null;
             end
         end
-        perc_disc_null = perc_disc_null/length(files_in);
-        p_vol_disc = p_vol_disc + double(vol_disc_null(num_s)>=vol_disc);
-        p_perc_disc = p_perc_disc + double(perc_disc_null(num_s)>=perc_disc);
+        if opt.flag_verbose
+            niak_progress(list_s(end),opt.nb_samps);
+        end
     end
-    p_perc_disc = p_perc_disc / opt.nb_samps;
-    p_vol_disc = p_vol_disc / opt.nb_samps;
+    perc_disc_null = perc_disc_null/length(files_in);
+    p_vol_disc = sum(vol_disc_null>=vol_disc) / opt.nb_samps;
+    p_perc_disc = sum(perc_disc_null>=perc_disc) / opt.nb_samps;
 else
     p_perc_disc = NaN;
     p_vol_disc = NaN;
     vol_disc_null = NaN;    
+    perc_disc_null = NaN;
 end
 
 %% Save the results 
 save(files_out,'vol_disc','nb_disc_scale','perc_disc_scale','vol_disc_scale','p_vol_disc','perc_disc','vol_disc_null','perc_disc_null','p_perc_disc');
+
+%%%%%%%%%%%%%%%%%%
+%% SUBFUNCTIONS %%
+%%%%%%%%%%%%%%%%%%
+function pre = sub_prepare(glm)
+%% What does not depend on the permutation: the pseudo-inverse of the design, 
+%% and the fit of the restricted model, see NIAK_PERMUTATION_GLM and NIAK_GLM
+if length(find(glm.c))~=1
+    error('The contrast vector should have exactly one 1')
+end
+pre.x = glm.x;
+pre.c = glm.c(:);
+pre.pinv = (glm.x'*glm.x)\glm.x';
+pre.d = sqrt(pre.c'*(glm.x'*glm.x)^(-1)*pre.c);
+if any(~glm.c)
+    [beta,pre.y] = niak_lse(glm.y,glm.x(:,~glm.c));
+    pre.fit0 = glm.x(:,~glm.c)*beta;
+else
+    pre.y = glm.y;
+    pre.fit0 = [];
+end
+% the contrast is on the intercept
+pre.flag_sign = length(unique(glm.x(:,glm.c==1)))==1;
+
+function y = sub_permute(pre,perm_obs)
+%% A sample under the null hypothesis, see NIAK_PERMUTATION_GLM
+if isempty(pre.fit0)
+    y = pre.y(perm_obs,:);
+else
+    y = pre.fit0 + pre.y(perm_obs,:);
+end
+if pre.flag_sign
+    y = y.*(2*(rand(size(y))>=0.5) - 1);
+end
+
+function [ttest,pce,eff,std_eff] = sub_ttest(pre,y)
+%% The t-test of NIAK_GLM, for all the columns of y
+[N,K] = size(pre.x);
+beta = pre.pinv*y;
+e = y-pre.x*beta;
+std_e = sqrt(sum(e.^2,1)/(N-K));
+eff = pre.c'*beta;
+ttest = eff./(std_e*pre.d);
+pce = 2*(1-niak_cdf_t(abs(ttest),N-K));
+std_eff = std_e*pre.d;
+
+function [vol_null,perc_null] = sub_discoveries(ttest,pce,opt,type_measure)
+%% The volume and percentage of discoveries of one sample under the null
+[fdr_null,test_null] = niak_glm_fdr(pce,opt.type_fdr,opt.fdr,type_measure);
+nb_disc_null = sum(test_null,1);
+perc_null = mean(nb_disc_null/size(fdr_null,1));
+switch type_measure
+    case 'correlation'
+        ttest_mat = niak_lvec2mat (ttest);        
+    case 'glm'
+        ttest_mat = reshape (ttest,[sqrt(length(ttest)),sqrt(length(ttest))]);
+    otherwise
+        error('%s is an unkown type of measure',type_measure)
+end
+if any(test_null(:))
+    vol_null = sum(ttest_mat(test_null(:)).^2);
+else
+    vol_null = max(ttest_mat(:).^2);
+end
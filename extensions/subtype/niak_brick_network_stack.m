@@ -25,8 +25,17 @@ function [files_in,files_out,opt] = niak_brick_network_stack(files_in, files_out
 %       FILES_IN.DATA
 %
 % FILES_OUT 
-%   (string, default 'network_stack.mat') absolute path to the output .mat 
-%   file containing the subject by voxel by network stack array.
+%   (structure) with the following fields. A string is the same as 
+%   FILES_OUT.STACK.
+%
+%   STACK
+%       (string, default 'network_stack.mat') absolute path to the output 
+%       .mat file containing the subject by voxel by network stack array.
+%
+%   STORE
+%       (string, default <base STACK>.tss with OPT.FLAG_STORE, 
+%       'gb_niak_omitted' otherwise) the folder of the store of the stack,
+%       only written with OPT.FLAG_STORE.
 %
 % OPT 
 %   (structure, optional) with the following fields:
@@ -42,6 +51,20 @@ function [files_in,files_out,opt] = niak_brick_network_stack(files_in, files_out
 %   REGRESS_CONF 
 %       (Cell of string, Default {}) A list of variables name to be regressed out.
 %
+%   FLAG_STORE
+%       (boolean, default false) if the flag is true, the stack is not kept
+%       in memory but written in the store FILES_OUT.STORE, see the 
+%       comments below.
+%
+%   MEMORY
+%       (integer, default 500) with FLAG_STORE, the memory (in MB) of a 
+%       block of voxels of the stack.
+%
+%   NB_PREFETCH
+%       (integer, default 0) the number of subjects decompressed in the 
+%       background while the current subject is read. Only zipped maps are
+%       prefetched.
+%
 %   FLAG_VERBOSE
 %       (boolean, default true) turn on/off the verbose.
 %
@@ -100,8 +123,22 @@ function [files_in,files_out,opt] = niak_brick_network_stack(files_in, files_out
 %               map the vectorized data in FILES_OUT.STACK back into volume
 %               space.
 %
+%   FILE_STACK
+%       (string) with OPT.FLAG_STORE, FILES_OUT.STORE, instead of the 
+%       variable STACK.
+%
 % The structures FILES_IN, FILES_OUT and OPT are updated with default
 % valued. If OPT.FLAG_TEST == 0, the specified outputs are written.
+%
+% _________________________________________________________________________
+% COMMENTS:
+%
+% With OPT.FLAG_STORE, the masked maps are written on disk as the subjects
+% are read, and the stack is then converted into a store of #subjects x 
+% #voxels blocks (see NIAK_READ_STORE), with the confounds regressed out
+% one block at a time. The memory does not depend on the number of 
+% subjects. NIAK_BRICK_SUBTYPING and NIAK_BRICK_SUBTYPE_WEIGHT read the 
+% store one block at a time as well.
 
 
 %% Initialization and syntax checks
@@ -117,24 +154,44 @@ files_in = psom_struct_defaults(files_in,...
            { NaN    , NaN    , 'gb_niak_omitted' });
        
 % FILES_OUT
-if ~ischar(files_out)
-    error('FILES_OUT should be a string');
+if ischar(files_out)
+    files_out = struct('stack', files_out);
+end
+if ~isstruct(files_out)
+    error('FILES_OUT should be a string or a structure');
 end
+files_out = psom_struct_defaults(files_out,...
+            { 'stack' , 'store' },...
+            { ''      , ''      });
 
 % Options
 if nargin < 3
     opt = struct;
 end
 opt = psom_struct_defaults(opt,...
-      { 'folder_out' , 'network' , 'regress_conf' , 'flag_verbose' , 'flag_test' },...
-      { ''           , []        , {}             , true           , false       });
+      { 'folder_out' , 'network' , 'regress_conf' , 'flag_store' , 'memory' , 'nb_prefetch' , 'flag_verbose' , 'flag_test' },...
+      { ''           , []        , {}             , false        , 500      , 0             , true           , false       });
 
 % Check the output specification
-if isempty(files_out) && ~strcmp(files_out, 'gb_niak_omitted')
+if isempty(files_out.stack) && ~strcmp(files_out.stack, 'gb_niak_omitted')
     if isempty(opt.folder_out)
         error('Neither FILES_OUT nor OPT.FOLDER_OUT are specified. Won''t generate any outputs');
     else
-        files_out = [niak_full_path(opt.folder_out) 'network_stack.mat'];
+        files_out.stack = [niak_full_path(opt.folder_out) 'network_stack.mat'];
+    end
+end
+if ~opt.flag_store && ~isempty(files_out.store) && ~strcmp(files_out.store, 'gb_niak_omitted')
+    error('FILES_OUT.STORE is only written with OPT.FLAG_STORE');
+end
+if isempty(files_out.store)
+    if opt.flag_store
+        [path_f, name_f] = fileparts(files_out.stack);
+        if isempty(path_f)
+            path_f = '.';
+        end
+        files_out.store = [path_f filesep name_f '.tss'];
+    else
+        files_out.store = 'gb_niak_omitted';
     end
 end
 
@@ -199,7 +256,7 @@ end
 
 %% Brick starts here
 % Read the mask
-[~, mask] = niak_read_vol(files_in.mask);
+[hdr_mask, mask] = niak_read_vol(files_in.mask);
 % Turn the mask into a boolean array
 mask = logical(mask);
 % Get the number of non-zero voxels in the mask
@@ -207,9 +264,26 @@ n_vox = sum(mask(:));
 % Get the number of scales
 n_scales = length(opt.network);
 
-% Pre-allocate the output matrix. If we have more than one network, we'll
-% repmat it
-stack = zeros(n_input, n_vox, n_scales);
+if opt.flag_store
+    % The masked maps are appended to a temporary file, one subject after
+    % the other
+    file_rows = niak_file_tmp('_stack.bin');
+    fid_rows = fopen(file_rows, 'w');
+    if fid_rows < 0
+        error('Could not open the temporary file %s', file_rows);
+    end
+else
+    % Pre-allocate the output matrix. If we have more than one network, we'll
+    % repmat it
+    stack = zeros(n_input, n_vox, n_scales);
+end
+
+% Start decompressing the first subjects in the background
+files_tmp = cell(n_input, 1);
+try
+for in_id = 1:min(opt.nb_prefetch, n_input)
+    files_tmp{in_id} = sub_prefetch(files_in.data.(list_subject{in_id}));
+end
 
 % Iterate over the input files
 for in_id = 1:n_input
@@ -217,10 +291,21 @@ for in_id = 1:n_input
     in_name = list_subject{in_id};
     % Load the corresponding path
     read_file = files_in.data.(in_name);
+    % Keep OPT.NB_PREFETCH subjects ahead
+    if (opt.nb_prefetch > 0) && (in_id + opt.nb_prefetch <= n_input)
+        files_tmp{in_id + opt.nb_prefetch} = sub_prefetch(files_in.data.(list_subject{in_id + opt.nb_prefetch}));
+    end
     if opt.flag_verbose
         fprintf('Reading %s now ...\n', read_file);
     end
-    [~, vol] = niak_read_vol(read_file);
+    if isempty(files_tmp{in_id})
+        [~, vol] = niak_read_vol(read_file);
+    else
+        [~, vol] = niak_read_vol(sub_wait(files_tmp{in_id}, read_file));
+        delete(files_tmp{in_id});
+        delete([files_tmp{in_id} '.done']);
+        files_tmp{in_id} = '';
+    end
     
     % Loop through the networks and mask the thing
     for net_id = 1:length(opt.network)
@@ -229,19 +314,34 @@ for in_id = 1:n_input
         % Mask the volume
         masked_vol = niak_vol2tseries(vol(:, :, :, net), mask);
         % Save the masked array into the stack variablne
-        stack(in_id, :, net_id) = masked_vol;
+        if opt.flag_store
+            fwrite(fid_rows, masked_vol, 'double');
+        else
+            stack(in_id, :, net_id) = masked_vol;
+        end
     end
 end
+catch err
+    % Do not leave the decompressed maps of the prefetched subjects behind
+    sub_clean(files_tmp);
+    if opt.flag_store
+        fclose(fid_rows);
+        delete(file_rows);
+    end
+    rethrow(err);
+end
 
 %% Regress confounds
-if ~strcmp(files_in.model, 'gb_niak_omitted')&&opt.flag_conf
-
+flag_regress = ~strcmp(files_in.model, 'gb_niak_omitted')&&opt.flag_conf;
+if flag_regress
     % Set up the model structure for the regression
     opt_mod = struct;
     opt_mod.flag_residuals = true;
     m = struct;
     m.x = [ones(length(list_subject),1) conf_model];
-    
+end
+
+if flag_regress&&~opt.flag_store
     % Loop through the networks again for the regression
     for net_id = 1:length(opt.network)
         % Get the correct network
@@ -252,6 +352,42 @@ if ~strcmp(files_in.model, 'gb_niak_omitted')&&opt.flag_conf
     end
 end
 
+%% Write the stack in a store, one block of voxels at a time
+if opt.flag_store
+    fclose(fid_rows);
+    file_stack = files_out.store;
+    store = struct;
+    store.hdr = hdr_mask;
+    store.dim = [n_vox n_scales 1 n_input];
+    store.precision = 'double';
+    size_b = max(floor(opt.memory*2^20/(8*n_input)), 1);
+    first = (1:size_b:n_vox*n_scales)';
+    store.blocks = [first min(first+size_b-1, n_vox*n_scales)];
+    store.file_name = file_stack;
+    fid_rows = fopen(file_rows, 'r');
+    for num_b = 1:size(store.blocks, 1)
+        if opt.flag_verbose
+            fprintf('Writing block %i/%i of the stack ...\n', num_b, size(store.blocks, 1));
+        end
+        % Gather the voxels of the block for all subjects
+        nb_vox_b = store.blocks(num_b, 2) - store.blocks(num_b, 1) + 1;
+        data = zeros(n_input, nb_vox_b);
+        for in_id = 1:n_input
+            fseek(fid_rows, ((in_id-1)*n_vox*n_scales + store.blocks(num_b, 1) - 1)*8, 'bof');
+            data(in_id, :) = fread(fid_rows, nb_vox_b, 'double')';
+        end
+        % The regression is done voxel by voxel
+        if flag_regress
+            m.y = data;
+            [res] = niak_glm(m, opt_mod);
+            data = res.e;
+        end
+        niak_write_store(store, data, num_b);
+    end
+    fclose(fid_rows);
+    delete(file_rows);
+end
+
 % Build the provenance data
 provenance = struct;
 % Get the subjects
@@ -276,4 +412,59 @@ provenance.volume.mask = mask;
 % Region mask is missing so far
 
 % Save the stack matrix
-save(files_out, 'stack', 'provenance');
\ No newline at end of file
+if opt.flag_store
+    save(files_out.stack, 'file_stack', 'provenance');
+else
+    save(files_out.stack, 'stack', 'provenance');
+end
+
+%%%%%%%%%%%%%%%%%%
+%% SUBFUNCTIONS %%
+%%%%%%%%%%%%%%%%%%
+function file_tmp = sub_prefetch(file_name)
+% Decompress a zipped map in the background. Returns an empty string if the
+% map is not zipped
+niak_gb_vars
+file_tmp = '';
+[path_f, name_f, ext_f] = fileparts(file_name);
+if ~strcmp(ext_f, GB_NIAK.zip_ext)
+    return
+end
+[~, name_f, ext_f] = fileparts(name_f);
+file_tmp = niak_file_tmp(['_' name_f ext_f]);
+% The .done file is created once the decompression is over, or the .failed
+% file, with the error message, if it did not work
+instr_unzip = sprintf('(%s -c "%s" > "%s" 2> "%s.err" && mv "%s.err" "%s.done" || mv "%s.err" "%s.failed") > /dev/null 2>&1 &', ...
+    GB_NIAK.unzip, file_name, file_tmp, file_tmp, file_tmp, file_tmp, file_tmp, file_tmp);
+[succ, msg] = system(instr_unzip);
+if succ ~= 0
+    error('Could not start the decompression of %s: %s', file_name, msg);
+end
+
+function file_tmp = sub_wait(file_tmp, file_name)
+% Wait for a background decompression to finish
+while ~psom_exist([file_tmp '.done']) && ~psom_exist([file_tmp '.failed'])
+    pause(0.1);
+end
+if psom_exist([file_tmp '.failed'])
+    error('niak:read: %s. There was a problem unzipping the file %s', fileread([file_tmp '.failed']), file_name);
+end
+
+function sub_clean(files_tmp)
+% Wait for the background decompressions still running, and delete their
+% outputs
+for num_f = 1:length(files_tmp)
+    file_tmp = files_tmp{num_f};
+    if isempty(file_tmp)
+        continue
+    end
+    while ~psom_exist([file_tmp '.done']) && ~psom_exist([file_tmp '.failed'])
+        pause(0.1);
+    end
+    list_ext = {'', '.done', '.failed'};
+    for num_e = 1:length(list_ext)
+        if psom_exist([file_tmp list_ext{num_e}])
+            delete([file_tmp list_ext{num_e}]);
+        end
+    end
+end
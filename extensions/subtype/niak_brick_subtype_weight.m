@@ -14,7 +14,14 @@ function [files_in,files_out,opt] = niak_brick_subtype_weight(files_in, files_ou
 %
 %   DATA.<NETWORK>
 %       (string) path to the network stack with the preprocessed individual 
-%       brain maps for each network
+%       brain maps for each network. A stack written in a store (see 
+%       OPT.FLAG_STORE in NIAK_BRICK_NETWORK_STACK) is read one block of 
+%       voxels at a time.
+%
+%   STORE.<NETWORK>
+%       (string, default the FILE_STACK of DATA.<NETWORK>) the store of the
+%       stack of that network, i.e. FILES_OUT.STORE of 
+%       NIAK_BRICK_NETWORK_STACK.
 %
 %   SUBTYPE.<NETWORK>
 %       (string) path to the subtype maps for that network. The subtype map is
@@ -109,8 +116,8 @@ end
 
 % FILES_IN
 files_in = psom_struct_defaults(files_in,...
-           { 'data' , 'subtype' },...
-           { NaN    , NaN       });
+           { 'data' , 'subtype' , 'store'  },...
+           { NaN    , NaN       , struct() });
 
 % Options
 if nargin < 3
@@ -159,7 +166,6 @@ for net_id = 1:n_networks
     network = list_network{net_id};
     % Get the network stack data
     tmp_data = load(files_in.data.(network));
-    data = tmp_data.stack;
     list_subject = tmp_data.provenance.subjects(:,1);
     
     % Get the network subtype maps (i.e. for each subtype one)
@@ -171,11 +177,16 @@ for net_id = 1:n_networks
         % Get the number of subtypes
         n_sbt = size(sbt, 1);
         % Get the number of subjects
-        n_sub = size(data, 1);
+        n_sub = length(list_subject);
         weight_mat = zeros(n_sub, n_sbt, n_networks);
     end
     % Extract the weights and store them 
-    weight_mat(:, :, net_id) = niak_corr(data', sbt');
+    if isfield(tmp_data, 'file_stack')
+        weight_mat(:, :, net_id) = niak_corr_stack(sub_file_stack(files_in, network, tmp_data.file_stack), sbt);
+    else
+        weight_mat(:, :, net_id) = niak_corr(tmp_data.stack', sbt');
+    end
+    clear tmp_data
 end
 
 % Save the weight matrix
@@ -211,14 +222,17 @@ for net_id = 1:n_networks
         % if external subtypes are supplied, generate a new partition to get the subject order
         % Get the network stack data
         tmp_data = load(files_in.data.(network));
-        data = tmp_data.stack;
         % pre-allocate size of partition
         part = zeros(size(weight_mat,1),1);
         for ss = 1:size(weight_mat,1)
             [maxi,ind] = max(weight_mat(ss,:,net_id));
             part(ss) = ind;
         end
-        simmat = niak_build_correlation(data');
+        if isfield(tmp_data, 'file_stack')
+            simmat = niak_corr_stack(sub_file_stack(files_in, network, tmp_data.file_stack));
+        else
+            simmat = niak_build_correlation(tmp_data.stack');
+        end
         [subj_order,~,~] = niak_part2order(part,simmat);
     else
         % Get the subject order from files_in.subtype
@@ -246,4 +260,22 @@ function path_array = make_paths(out_path, template, scales)
         path = fullfile(out_path, sprintf(template, sc));
         path_array{sc_id, 1} = path;
     end
-return
\ No newline at end of file
+return
+
+function file_stack = sub_file_stack(files_in, network, name_stack)
+    % The store of a stack is given in FILES_IN.STORE, or named in the
+    % stack file, relative to the folder of that file unless it is an
+    % absolute path
+    if isfield(files_in.store, network)
+        file_stack = files_in.store.(network);
+        return
+    end
+    if ~isempty(name_stack) && strcmp(name_stack(1), filesep)
+        file_stack = name_stack;
+        return
+    end
+    path_d = fileparts(files_in.data.(network));
+    if isempty(path_d)
+        path_d = '.';
+    end
+    file_stack = [path_d filesep name_stack];
@@ -13,7 +13,14 @@ function [files_in,files_out,opt] = niak_brick_subtyping(files_in,files_out,opt)
 %   DATA 
 %       (string) path to a .mat file containing a variable STACK, which is 
 %       an array (#subjects x #voxels OR vertices OR regions), see also
-%       niak_brick_network_stack
+%       niak_brick_network_stack. If the file contains a variable 
+%       FILE_STACK instead, the stack is read one block of voxels at a 
+%       time from that store (see OPT.FLAG_STORE in 
+%       NIAK_BRICK_NETWORK_STACK).
+%
+%   STORE
+%       (string, default the FILE_STACK of DATA) the store of the stack, 
+%       i.e. FILES_OUT.STORE of NIAK_BRICK_NETWORK_STACK.
 %
 %   MASK
 %       (3D volume) file name of a binary mask of the voxels that 
@@ -137,8 +144,8 @@ end
 
 % Input
 files_in = psom_struct_defaults(files_in,...
-           { 'data' , 'mask' },...
-           { NaN    , NaN    });
+           { 'data' , 'mask' , 'store'           },...
+           { NaN    , NaN    , 'gb_niak_omitted' });
 [path_m,name_m,ext_m] = niak_fileparts(files_in.mask);
 
 % Options
@@ -175,11 +182,25 @@ end
 %% Load the data
 data = load(files_in.data);
 provenance = data.provenance; % loading provenance from the data file
-data = data.stack; % get the stack data
+flag_store = isfield(data,'file_stack');
+if flag_store
+    if strcmp(files_in.store,'gb_niak_omitted')
+        file_stack = sub_file_stack(files_in.data,data.file_stack);
+    else
+        file_stack = files_in.store;
+    end
+    data = [];
+else
+    data = data.stack; % get the stack data
+end
 list_subject = provenance.subjects(:,1);
 
 %% Build the similarity matrix
-sim_matrix = niak_build_correlation(data');
+if flag_store
+    sim_matrix = niak_corr_stack(file_stack);
+else
+    sim_matrix = niak_build_correlation(data');
+end
 
 %% Compute the hierarchy
 % Cluster subjects
@@ -217,16 +238,28 @@ part = niak_threshold_hierarchy(hier,struct('thresh',opt.nb_subtype));
 
 %% Build subtype maps
 
-% Generating and writing the mean or the median subtype maps in a single volume
-sub.map = zeros(opt.nb_subtype, n_vox);
-for ss = 1:opt.nb_subtype
-    if strcmp(opt.sub_map_type, 'mean')
-        % Construct the subtype map as the mean map of the subgroup
-        sub.map(ss,:) = mean(data(part==ss,:),1);
-    elseif strcmp(opt.sub_map_type, 'median')
-        % Construct the subtype map as the median map of the subgroup
-        sub.map(ss,:) = median(data(part==ss,:),1);
+% Generating the mean or the median subtype maps, the t-test and effect maps 
+% and the grand mean and std maps, voxel by voxel
+if flag_store
+    store = niak_read_store(file_stack);
+    sub = struct;
+    for num_b = 1:size(store.blocks,1)
+        [store,data] = niak_read_store(file_stack,num_b);
+        sub_b = sub_maps(data,part,opt);
+        list_field = fieldnames(sub_b);
+        for ff = 1:length(list_field)
+            sub.(list_field{ff})(:,store.blocks(num_b,1):store.blocks(num_b,2)) = sub_b.(list_field{ff});
+        end
     end
+    clear data
+else
+    sub = sub_maps(data,part,opt);
+end
+if strcmp(files_out.grand_mean_map, 'gb_niak_omitted')
+    sub = rmfield(sub,'gd_mean');
+end
+if strcmp(files_out.grand_std_map, 'gb_niak_omitted')
+    sub = rmfield(sub,'gd_std');
 end
 
 % Bring the subtype map back to volumetric space
@@ -240,9 +273,6 @@ end
 %% Generating and writing t-test and effect maps of the difference between subtype
 % average and grand average in volumes
 
-for ss = 1:opt.nb_subtype
-    [sub.ttest(ss,:), ~, sub.mean_eff(ss,:), ~, ~] = niak_ttest(data(part==ss,:), data(part~=ss,:),true);
-end
 % Check if to be saved - improvable
 if ~strcmp(files_out.ttest_map, 'gb_niak_omitted')
     vol_ttest_sub = niak_tseries2vol(sub.ttest, mask);
@@ -260,7 +290,6 @@ end
 % Check if to be saved - improvable
 if ~strcmp(files_out.grand_mean_map, 'gb_niak_omitted')
     hdr.file_name = files_out.grand_mean_map;
-    sub.gd_mean = mean(data,1);
     vol_gd_mean = niak_tseries2vol(sub.gd_mean, mask);
     niak_write_vol(hdr,vol_gd_mean);
 end
@@ -269,7 +298,6 @@ end
 % Check if to be saved - improvable
 if ~strcmp(files_out.grand_std_map, 'gb_niak_omitted')
     hdr.file_name = files_out.grand_std_map;
-    sub.gd_std = std(data,1);
     vol_std_mean = niak_tseries2vol(sub.gd_std, mask);
     niak_write_vol(hdr,vol_std_mean);
 end
@@ -291,6 +319,27 @@ end
 
 end
 
+function sub = sub_maps(data, part, opt)
+    % The subtype maps, t-test and effect maps and grand mean and std maps
+    % of the voxels (columns) of data
+    sub = struct;
+    sub.map = zeros(opt.nb_subtype, size(data,2));
+    for ss = 1:opt.nb_subtype
+        if strcmp(opt.sub_map_type, 'mean')
+            % Construct the subtype map as the mean map of the subgroup
+            sub.map(ss,:) = mean(data(part==ss,:),1);
+        elseif strcmp(opt.sub_map_type, 'median')
+            % Construct the subtype map as the median map of the subgroup
+            sub.map(ss,:) = median(data(part==ss,:),1);
+        end
+    end
+    for ss = 1:opt.nb_subtype
+        [sub.ttest(ss,:), ~, sub.mean_eff(ss,:), ~, ~] = niak_ttest(data(part==ss,:), data(part~=ss,:),true);
+    end
+    sub.gd_mean = mean(data,1);
+    sub.gd_std = std(data,1);
+end
+
 function path_array = make_paths(out_path, template, scales)
     % Get the number of networks
     n_networks = length(scales);
@@ -303,9 +352,16 @@ function path_array = make_paths(out_path, template, scales)
 return
 end
 
-
-
-
-
-
-
+function file_stack = sub_file_stack(file_data, name_stack)
+    % A store named in the stack file is relative to the folder of that
+    % file, unless it is an absolute path
+    if ~isempty(name_stack) && strcmp(name_stack(1), filesep)
+        file_stack = name_stack;
+        return
+    end
+    path_d = fileparts(file_data);
+    if isempty(path_d)
+        path_d = '.';
+    end
+    file_stack = [path_d filesep name_stack];
+end
@@ -0,0 +1,94 @@
+function r = niak_corr_stack(file_stack,maps)
+% Correlation between the maps of a stack on disk, or with other maps
+%
+% SYNTAX:
+% R = NIAK_CORR_STACK(FILE_STACK,MAPS)
+%
+% _________________________________________________________________________
+% INPUTS:
+%
+% FILE_STACK
+%   (string) a store of individual maps (#subjects x #voxels), see 
+%   NIAK_BRICK_NETWORK_STACK and NIAK_READ_STORE.
+%
+% MAPS
+%   (array, optional) #maps x #voxels, e.g. subtype maps.
+%
+% _________________________________________________________________________
+% OUTPUTS:
+%
+% R
+%   (array) the correlation between the maps of the subjects across voxels,
+%   #subjects x #subjects like NIAK_BUILD_CORRELATION(STACK') or, if MAPS is
+%   specified, #subjects x #maps like NIAK_CORR(STACK',MAPS').
+%
+% _________________________________________________________________________
+% COMMENTS:
+%
+% The stack is read one block of voxels at a time, twice: once for the 
+% average of the maps, once for the cross-products.
+%
+% Copyright (c) The NIAK contributors, 2026.
+% See licensing information in the code.
+% Keywords : subtype, correlation, memory
+
+% Permission is hereby granted, free of charge, to any person obtaining a copy
+% of this software and associated documentation files (the "Software"), to deal
+% in the Software without restriction, including without limitation the rights
+% to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+% copies of the Software, and to permit persons to whom the Software is
+% furnished to do so, subject to the following conditions:
+%
+% The above copyright notice and this permission notice shall be included in
+% all copies or substantial portions of the Software.
+%
+% THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+% IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+% FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+% AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+% LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+% OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+% THE SOFTWARE.
+
+store = niak_read_store(file_stack);
+nb_b = size(store.blocks,1);
+n_sub = store.dim(4);
+n_vox = prod(store.dim(1:3));
+
+%% The average of the maps
+mean_sub = zeros(n_sub,1);
+for num_b = 1:nb_b
+    [store,data] = niak_read_store(file_stack,num_b);
+    mean_sub = mean_sub + sum(data,2);
+end
+mean_sub = mean_sub/n_vox;
+if nargin > 1
+    if size(maps,2)~=n_vox
+        error('MAPS should have %i columns, as many as voxels in the stack %s',n_vox,file_stack)
+    end
+    maps = maps - repmat(mean(maps,2),[1 n_vox]);
+    cross = zeros(n_sub,size(maps,1));
+else
+    cross = zeros(n_sub,n_sub);
+end
+
+%% The cross-products of the centered maps
+ss_sub = zeros(n_sub,1);
+for num_b = 1:nb_b
+    [store,data] = niak_read_store(file_stack,num_b);
+    data = data - repmat(mean_sub,[1 size(data,2)]);
+    if nargin > 1
+        cross = cross + data*maps(:,store.blocks(num_b,1):store.blocks(num_b,2))';
+    else
+        cross = cross + data*data';
+    end
+    ss_sub = ss_sub + sum(data.^2,2);
+end
+
+if nargin > 1
+    r = cross./(sqrt(ss_sub)*sqrt(sum(maps.^2,2))');
+    r(r>1) = 1;
+    r(r<-1) = -1;
+else
+    r = cross./sqrt(ss_sub*ss_sub');
+end
@@ -44,6 +44,19 @@ function [pipe,opt] = niak_pipeline_subtype(files_in,opt)
 %           regressed out. If unspecified or left empty, no regression 
 %           is applied.
 %
+%       FLAG_STORE
+%           (boolean, default false) if the flag is true, the stack of each
+%           network is written in a store of time series instead of being
+%           kept in memory, see NIAK_BRICK_NETWORK_STACK.
+%
+%       MEMORY
+%           (integer, default 500) with FLAG_STORE, the memory (in MB) of
+%           a block of voxels of the stack.
+%
+%       NB_PREFETCH
+%           (integer, default 0) the number of subjects decompressed in the
+%           background while the current subject is read.
+%
 %   SUBTYPE
 %       (struct, optional) with the following fields:
 %
@@ -228,8 +241,8 @@ opt.psom = psom_struct_defaults(opt.psom,...
 
 % Preprocessing options
 opt.stack = psom_struct_defaults(opt.stack,...
-            { 'regress_conf' },...
-            { {}             });
+            { 'regress_conf' , 'flag_store' , 'memory' , 'nb_prefetch' },...
+            { {}             , false        , 500      , 0             });
 
 % Subtype options
 opt.subtype = psom_struct_defaults(opt.subtype,...
@@ -286,11 +299,18 @@ for net_id = 1:length(list_net);
     if ext_sbt
         pre_in.subtype = files_in.subtype;
     end
-    pre_out = [network_folder filesep sprintf('stack_%s.mat', net_name)];
+    pre_out = struct;
+    pre_out.stack = [network_folder filesep sprintf('stack_%s.mat', net_name)];
+    if opt.stack.flag_store
+        pre_out.store = [network_folder filesep sprintf('stack_%s.tss', net_name)];
+    end
     pipe = psom_add_job(pipe, pre_name, 'niak_brick_network_stack',...
                         pre_in, pre_out, pre_opt);
     % Assign output to weight extraction step
-    weight_in.data.(net_name) = pipe.(pre_name).files_out;
+    weight_in.data.(net_name) = pipe.(pre_name).files_out.stack;
+    if opt.stack.flag_store
+        weight_in.store.(net_name) = pipe.(pre_name).files_out.store;
+    end
     weight_out.weights_csv{net_id} = [network_folder filesep sprintf('sbt_weights_net_%s.csv', net_name)];
     weight_out.weights_pdf{net_id} = [network_folder filesep sprintf('sbt_weights_net_%s.pdf', net_name)];
     
@@ -309,7 +329,10 @@ for net_id = 1:length(list_net);
         % Assign inputs
         sfields = {'data', 'model'};
         sub_in = rmfield(files_in, sfields);
-        sub_in.data = pipe.(pre_name).files_out;
+        sub_in.data = pipe.(pre_name).files_out.stack;
+        if opt.stack.flag_store
+            sub_in.store = pipe.(pre_name).files_out.store;
+        end
         sub_out = struct;
         sub_out.subtype = [network_folder filesep sprintf('subtype_%s.mat', net_name)];
         sub_out.provenance = [network_folder filesep sprintf('provenance_%s.mat', net_name)];
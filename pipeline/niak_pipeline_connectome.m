@@ -71,6 +71,11 @@ function [pipeline,opt] = niak_pipeline_connectome(files_in,opt)
 %      OPT argument of PSOM_RUN_PIPELINE. Default values can be used here.
 %      Note that the field PSOM.PATH_LOGS will be set up by the pipeline.
 %
+%   FLAG_BATCH
+%      (boolean, default false) also generate the connectomes of all subjects 
+%      in a single HDF5 file, connectomes_<LABEL_NETWORK>.h5, with 
+%      NIAK_BRICK_CONNECTOME_BATCH. The type of connectome is OPT.CONNECTOME.TYPE.
+%
 %   FLAG_SYM 
 %      (boolean, default true) if true use a symmetric MNI template background, 
 %      otherwise use an asymmetric one. 
@@ -107,7 +112,7 @@ function [pipeline,opt] = niak_pipeline_connectome(files_in,opt)
 %
 % _________________________________________________________________________
 % SEE ALSO:
-% NIAK_BRICK_CONNECTOME, NIAK_BRICK_GRAPH_PROP, NIAK_BRICK_RMAP
+% NIAK_BRICK_CONNECTOME, NIAK_BRICK_CONNECTOME_BATCH, NIAK_BRICK_GRAPH_PROP, NIAK_BRICK_RMAP
 %
 % _________________________________________________________________________
 % COMMENTS:
@@ -190,8 +195,8 @@ list_defaults = { NaN       , NaN    , 'gb_niak_omitted' };
 files_in      = psom_struct_defaults(files_in,list_fields,list_defaults);
 
 %% Options
-list_fields   = { 'report_rmap' , 'flag_sym' , 'flag_rand' , 'label_network' , 'flag_p2p' , 'flag_rmap'   , 'flag_global_prop' , 'flag_local_prop' , 'connectome' , 'psom'   , 'folder_out' , 'flag_verbose' , 'flag_test' };
-list_defaults = { struct        , true       , false       , 'rois'          , true       , true          , true               , true              , struct()     , struct() , NaN          , true           , false       };
+list_fields   = { 'report_rmap' , 'flag_sym' , 'flag_rand' , 'label_network' , 'flag_p2p' , 'flag_rmap'   , 'flag_global_prop' , 'flag_local_prop' , 'flag_batch' , 'connectome' , 'psom'   , 'folder_out' , 'flag_verbose' , 'flag_test' };
+list_defaults = { struct        , true       , false       , 'rois'          , true       , true          , true               , true              , false        , struct()     , struct() , NaN          , true           , false       };
 opt = psom_struct_defaults(opt,list_fields,list_defaults);
 folder_out = niak_full_path(opt.folder_out);
 opt.psom.path_logs = [folder_out 'logs' filesep];
@@ -352,6 +357,19 @@ for num_s = 1:length(list_subject)
     jopt = opt.connectome;
     pipeline = psom_add_job(pipeline,name_job,'niak_brick_connectome',in,out,jopt);
 end
+
+%% Run the estimation of all connectomes in one file
+if opt.flag_batch
+    clear in out jopt
+    in.fmri = files_tseries;
+    in.mask = pipeline.(['mask_' network]).files_out;
+    out = [folder_out 'connectomes' filesep 'connectomes_' network '.h5'];
+    if isfield(opt.connectome,'type')
+        jopt.type = opt.connectome.type;
+    end
+    jopt.flag_verbose = opt.flag_verbose;
+    pipeline = psom_add_job(pipeline,['connectome_batch_' network],'niak_brick_connectome_batch',in,out,jopt);
+end
          
 %% Generate graph properties
 list_mes = fieldnames(opt.graph_prop);
@@ -82,6 +82,14 @@ function [pipeline,opt] = niak_pipeline_fmri_preprocess(files_in,opt)
 %       the data. Otherwise, PSOM_RUN_PIPELINE will be used to process the 
 %       data.
 %
+%   PATH_CACHE
+%       (string, default '') if not empty, the jobs are run through a cache
+%       of brick results in this folder, shared between runs. A job whose
+%       inputs, options and NIAK version did not change since a previous
+%       run copies the outputs of that run instead of running again (the 
+%       copies share their blocks with the cache where the file system 
+%       supports it). See NIAK_PIPELINE_CACHE.
+%
 %   FLAG_VERBOSE
 %       (boolean, default 1) if the flag is 1, then the function
 %       prints some infos during the processing.
@@ -206,6 +214,27 @@ function [pipeline,opt] = niak_pipeline_fmri_preprocess(files_in,opt)
 %       registration of the T1 volume in stereotaxic space as well as the 
 %       coregistration between the anatomical and functional volumes).
 %
+%   STORE
+%       (structure) options of NIAK_VOL2STORE (copy of the resampled fMRI 
+%       data in a store of time series, which is read one block of voxels 
+%       at a time by NIAK_BRICK_TIME_FILTER and NIAK_BRICK_REGRESS_CONFOUNDS).
+%
+%       FLAG_SKIP
+%           (boolean, default true) if FLAG_SKIP==1, no store is built and 
+%           the bricks read the resampled volumes at once.
+%
+%       MEMORY
+%           (integer, default 500) the memory (in MB) of the time series 
+%           of a block of voxels.
+%
+%       The store only bounds the memory of NIAK_BRICK_TIME_FILTER, and of 
+%       the regression in NIAK_BRICK_REGRESS_CONFOUNDS. Its output is still 
+%       assembled as a whole run, in single precision, for the smoothing. 
+%       NIAK_BRICK_BUILD_CONFOUNDS and NIAK_BRICK_SMOOTH_VOL read a whole 
+%       run, and so does NIAK_VOL2STORE when the resampled volumes are not 
+%       in the NIFTI format. The store is an extra copy of each run on 
+%       disk, removed at the end unless OPT.SIZE_OUTPUT is 'all'.
+%
 %   TIME_FILTER 
 %       (structure) options of NIAK_BRICK_TIME_FILTER (temporal filtering).
 %
@@ -449,8 +478,8 @@ files_in = sub_check_format(files_in); % check the format of FILES_IN
 %% OPT
 opt = sub_backwards(opt); % Fiddling with OPT for backwards compatibility
 
-list_fields    = { 'civet'           , 'target_space' , 'flag_rand' , 'granularity' , 'tune'   , 'flag_verbose' , 'template'                 , 'size_output'     , 'folder_out' , 'folder_logs' , 'folder_fmri' , 'folder_anat' , 'folder_qc' , 'folder_intermediate' , 'flag_test' , 'psom'   , 'slice_timing' , 'motion' , 'qc_motion_correction_ind' , 't1_preprocess' , 'pve'   , 'mask_anat2func' , 'anat2func' , 'qc_coregister' , 'time_filter' , 'resample_vol' , 'smooth_vol' , 'build_confounds' , 'regress_confounds' };
-list_defaults  = { 'gb_niak_omitted' , 'stereonl'     , false       , 'cleanup'     , struct() , true           , 'mni_icbm152_nlin_sym_09a' , 'quality_control' , NaN          , ''            , ''            , ''            , ''          , ''                    , false       , struct() , struct()       , struct() , struct()                   , struct()        , struct(), struct()          , struct()    , struct()        , struct()      , struct()       , struct()     , struct()          , struct()            };
+list_fields    = { 'civet'           , 'target_space' , 'flag_rand' , 'granularity' , 'tune'   , 'flag_verbose' , 'template'                 , 'size_output'     , 'folder_out' , 'folder_logs' , 'folder_fmri' , 'folder_anat' , 'folder_qc' , 'folder_intermediate' , 'flag_test' , 'path_cache' , 'psom'   , 'slice_timing' , 'motion' , 'qc_motion_correction_ind' , 't1_preprocess' , 'pve'   , 'mask_anat2func' , 'anat2func' , 'qc_coregister' , 'time_filter' , 'resample_vol' , 'smooth_vol' , 'build_confounds' , 'regress_confounds' , 'store'  };
+list_defaults  = { 'gb_niak_omitted' , 'stereonl'     , false       , 'cleanup'     , struct() , true           , 'mni_icbm152_nlin_sym_09a' , 'quality_control' , NaN          , ''            , ''            , ''            , ''          , ''                    , false       , ''           , struct() , struct()       , struct() , struct()                   , struct()        , struct(), struct()          , struct()    , struct()        , struct()      , struct()       , struct()     , struct()          , struct()            , struct() };
 opt = psom_struct_defaults(opt,list_fields,list_defaults);
 opt.folder_out = niak_full_path(opt.folder_out);
 opt.psom.path_logs = [opt.folder_out 'logs' filesep];
@@ -744,6 +773,11 @@ if opt.flag_verbose
     fprintf('%1.2f sec\n',etime(clock,t1));
 end
 
+%% Run the jobs through the cache of brick results
+if ~isempty(opt.path_cache)
+    pipeline = niak_pipeline_cache(pipeline,opt.path_cache,opt.folder_out);
+end
+
 %% Run the pipeline 
 if ~opt.flag_test
     psom_run_pipeline(pipeline,opt.psom);
@@ -239,6 +239,27 @@ function [pipeline,opt] = niak_pipeline_fmri_preprocess_ind(files_in,opt)
 %       registration of the T1 volume in stereotaxic space as well as the 
 %       coregistration between the anatomical and functional volumes).
 %
+%   STORE
+%       (structure) options of NIAK_VOL2STORE (copy of the resampled fMRI 
+%       data in a store of time series, which is read one block of voxels 
+%       at a time by NIAK_BRICK_TIME_FILTER and NIAK_BRICK_REGRESS_CONFOUNDS).
+%
+%       FLAG_SKIP
+%           (boolean, default true) if FLAG_SKIP==1, no store is built and 
+%           the bricks read the resampled volumes at once.
+%
+%       MEMORY
+%           (integer, default 500) the memory (in MB) of the time series 
+%           of a block of voxels.
+%
+%       The store only bounds the memory of NIAK_BRICK_TIME_FILTER, and of 
+%       the regression in NIAK_BRICK_REGRESS_CONFOUNDS. Its output is still 
+%       assembled as a whole run, in single precision, for the smoothing. 
+%       NIAK_BRICK_BUILD_CONFOUNDS and NIAK_BRICK_SMOOTH_VOL read a whole 
+%       run, and so does NIAK_VOL2STORE when the resampled volumes are not 
+%       in the NIFTI format. The store is an extra copy of each run on 
+%       disk, removed at the end unless OPT.SIZE_OUTPUT is 'all'.
+%
 %   TIME_FILTER 
 %       (structure) options of NIAK_BRICK_TIME_FILTER (temporal filtering).
 %
@@ -433,10 +454,11 @@ end
 files_in = sub_check_format(files_in); % Checking that FILES_IN is in the correct format
 
 %% OPT
-list_fields    = { 'civet'           , 'target_space' , 'rand_seed' , 'subject' , 'template' , 'size_output'     , 'folder_out' , 'folder_logs' , 'folder_resample' , 'folder_fmri' , 'folder_anat' , 'folder_qc' , 'folder_intermediate' , 'flag_test' , 'flag_verbose' , 'psom'   , 'slice_timing' , 'motion' , 'qc_motion_correction_ind' , 't1_preprocess' , 'pve'    , 'mask_anat2func' , 'anat2func' , 'qc_coregister' , 'time_filter' , 'resample_vol' , 'smooth_vol' , 'build_confounds' , 'regress_confounds'};
-list_defaults  = { 'gb_niak_omitted' , 'stereonl'     , []          , NaN       , NaN        , 'quality_control' , NaN          , ''            , ''                , ''            , ''            , ''          , ''                    , false       , false          , struct() , struct()       , struct() , struct()                   , struct()        , struct() , struct()         , struct()    , struct()         , struct()      , struct()       , struct()     , struct()          , struct()           };
+list_fields    = { 'civet'           , 'target_space' , 'rand_seed' , 'subject' , 'template' , 'size_output'     , 'folder_out' , 'folder_logs' , 'folder_resample' , 'folder_fmri' , 'folder_anat' , 'folder_qc' , 'folder_intermediate' , 'flag_test' , 'flag_verbose' , 'psom'   , 'slice_timing' , 'motion' , 'qc_motion_correction_ind' , 't1_preprocess' , 'pve'    , 'mask_anat2func' , 'anat2func' , 'qc_coregister' , 'time_filter' , 'resample_vol' , 'smooth_vol' , 'build_confounds' , 'regress_confounds' , 'store'  };
+list_defaults  = { 'gb_niak_omitted' , 'stereonl'     , []          , NaN       , NaN        , 'quality_control' , NaN          , ''            , ''                , ''            , ''            , ''          , ''                    , false       , false          , struct() , struct()       , struct() , struct()                   , struct()        , struct() , struct()         , struct()    , struct()         , struct()      , struct()       , struct()     , struct()          , struct()            , struct() };
 opt = psom_struct_defaults(opt,list_fields,list_defaults);
 subject = opt.subject;
+opt.store = psom_struct_defaults(opt.store,{ 'flag_skip' , 'memory' },{ true , 500 });
 
 opt.template = psom_struct_defaults(opt.template, ...
                { 't1' , 'fmri' , 'aal' , 'mask' , 'mask_dilated' , 'mask_eroded' , 'mask_bold' , 'mask_avg' , 'mask_wm' , 'mask_vent' , 'mask_willis' }, ...
@@ -724,6 +746,27 @@ job_opt.target_space = opt.target_space;
 job_opt.flag_test = false;
 pipeline = psom_add_job(pipeline,['mask_confounds_' subject],'niak_brick_mask_corsica',job_in,job_out,job_opt);
 
+%% Store of time series
+if ~opt.store.flag_skip
+    if opt.flag_verbose
+        t1 = clock;
+        fprintf('store (');
+    end
+    for num_e = 1:length(fmri)
+        name_job = ['store_' label(num_e).name];
+        pipeline.(name_job).command   = 'niak_vol2store(files_in,files_out,opt);';
+        pipeline.(name_job).files_in  = pipeline.(['resample_' label(num_e).name]).files_out;
+        pipeline.(name_job).files_out = [opt.folder_intermediate 'store' filesep 'fmri_' label(num_e).name '.tss'];
+        pipeline.(name_job).opt.memory = opt.store.memory;
+        if strcmp(opt.size_output,'quality_control')
+            pipeline = psom_add_clean(pipeline,['clean_' name_job],pipeline.(name_job).files_out);
+        end
+    end
+    if opt.flag_verbose        
+        fprintf('%1.2f sec) - ',etime(clock,t1));
+    end
+end
+
 %% temporal filtering 
 if opt.flag_verbose
     t1 = clock;
@@ -731,7 +774,7 @@ if opt.flag_verbose
 end
 for num_e = 1:length(fmri)
     clear job_opt job_in job_out
-    job_in = pipeline.(['resample_' label(num_e).name]).files_out;
+    job_in = sub_tseries(pipeline,label(num_e).name,opt);
     job_out.dc_high  = '';
     job_out.dc_low   = '';                                    
     job_opt            = opt.time_filter;
@@ -779,7 +822,7 @@ if opt.flag_verbose
 end
 for num_e = 1:length(fmri)
     clear job_opt job_in job_out
-    job_in.fmri         = pipeline.(['resample_' label(num_e).name]).files_out;
+    job_in.fmri         = sub_tseries(pipeline,label(num_e).name,opt);
     job_in.confounds    = pipeline.(['build_confounds_' label(num_e).name]).files_out.confounds;
     job_opt = opt.regress_confounds;
     job_opt.folder_out = [opt.folder_intermediate 'regress_confounds' filesep];
@@ -823,6 +866,14 @@ end
 %% SUBFUNCTIONS %%
 %%%%%%%%%%%%%%%%%%
 
+function file_tseries = sub_tseries(pipeline,name,opt)
+%% The time series of a run, in a store or in the resampled volume
+if opt.store.flag_skip
+    file_tseries = pipeline.(['resample_' name]).files_out;
+else
+    file_tseries = pipeline.(['store_' name]).files_out;
+end
+
 function files_in = sub_check_format(files_in)
 %% Check that FILES_IN is in a proper format
 
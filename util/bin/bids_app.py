@@ -10,9 +10,15 @@ import argparse
 import os
 import re
 import sys
+try:
+    from shlex import quote
+except ImportError:
+    from pipes import quote
 
 #sys.path.append("{}/..".format(os.path.dirname(os.path.realpath(__file__))))
 import pyniak.load_pipeline
+from pyniak import bids_cache
+from pyniak import shards
 
 OPTION_PREFIX = "--opt"
 ESCAPE_STRING = "666_____666_____666"
@@ -43,6 +49,30 @@ def build_opt(option):
     return opt_dico
 
 
+def shard_command(args, labels, n_labels=0):
+    """
+    :param args: the arguments of this script
+    :param labels: the participant labels of one shard
+    :param n_labels: the number of values given to --participant_label in args
+    :return: the command running the shard, as a shell string
+    """
+    # The number of values taken by the options that are replaced
+    n_values = {"--emit_array": 1, "--shard": 1, "--participant_label": n_labels}
+    cmd = [os.path.realpath(__file__)]
+    skip = 0
+    for a in args:
+        if skip:
+            skip -= 1
+            continue
+        if a.split("=")[0] in n_values:
+            if "=" not in a:
+                skip = n_values[a]
+            continue
+        cmd.append(a)
+    cmd += ["--participant_label"] + list(labels)
+    return " ".join(quote(c) for c in cmd)
+
+
 def main(args=None):
 
     if args is None:
@@ -81,6 +111,59 @@ def main(args=None):
 
     parser.add_argument('--n_thread', default=1, help="Number of threads to compute niak")
 
+    parser.add_argument("--func_hint", default="",
+                        help="Only use the functional runs with that string in their name")
+
+    parser.add_argument("--anat_hint", default="",
+                        help="Pick the anatomical scan with that string in its name, by default the T1w")
+
+    parser.add_argument("--octave_pool", default=0, type=int,
+                        help="Run the pipeline jobs in that many warm octave interpreters, "
+                             "instead of starting octave for every job")
+
+    parser.add_argument("--sync_threads", default=0, type=int,
+                        help="Copy participant results to output_dir with that many threads while the "
+                             "pipeline runs, instead of one rsync at the end")
+
+    parser.add_argument("--no_bids_cache", action="store_true",
+                        help="Always list the BIDS dataset, instead of reusing the listing cached "
+                             "in output_dir/logs by previous participant jobs")
+
+    parser.add_argument("--plan", default=None, metavar="FILE",
+                        help="Do not run the pipeline, save its jobs, inputs, outputs and dependencies in "
+                             "this json file and print the estimated run time and size of the outputs")
+
+    parser.add_argument("--plan_history", default=None, metavar="DIR",
+                        help="Estimate the cost of --plan from the logs of the pipeline run in that "
+                             "folder, by default output_dir")
+
+    parser.add_argument("--cache_dir", default=None,
+                        help="Reuse the results of the pipeline jobs whose inputs and options did not change, "
+                             "from this folder shared between runs")
+
+    parser.add_argument("--cache_size", default=None, type=float, metavar="GB",
+                        help="Remove the least recently used results of --cache_dir beyond that size")
+
+    parser.add_argument("--resume", action="store_true",
+                        help="Continue the unfinished jobs of a previous launch on the same participants, "
+                             "and keep the working folder if the pipeline does not finish")
+
+    parser.add_argument("--work_max_age", default=7, type=float, metavar="DAYS",
+                        help="Remove the working folders in output_dir/work left idle for that many days")
+
+    parser.add_argument("--scratch", default=None, metavar="DIR",
+                        help="Node-local folder where participant runs copy their inputs, in the background, "
+                             "and write their intermediate files. Only the results are copied to output_dir")
+
+    parser.add_argument("--shard", default=None, metavar="i/N",
+                        help="Split the participants in N shards of similar work, the number of fmri "
+                             "volumes, and only process the shard i, from 1 to N")
+
+    parser.add_argument("--emit_array", default=None, type=int, metavar="N",
+                        help="Split the participants in N shards of similar work and print the command "
+                             "processing each shard, one per line, instead of running the pipeline. The "
+                             "shards are saved in output_dir/logs and reused by --shard")
+
     ## Slice timing options
     parser.add_argument('--type_scaner', default="", type=str.capitalize
                         , help="Type of MR scanner. The only value that will change something to the processing here "
@@ -136,15 +219,65 @@ def main(args=None):
     group = False
     if parsed.analysis_level == "group":
         group = True
+
+    if not group and (parsed.shard or parsed.emit_array):
+        if parsed.shard:
+            shard_num, n_shards = shards.parse_shard(parsed.shard)
+        else:
+            n_shards = parsed.emit_array
+        subjects = None
+        if parsed.participant_label:
+            subjects = pyniak.load_pipeline.unroll_numbers(parsed.participant_label)
+        # The partition computed by --emit_array is reused by the --shard jobs,
+        # so that they do not all read the headers of the dataset again
+        shard_file = shards.shard_file(parsed.output_dir)
+        key = shards.shard_key(parsed.bids_dir, n_shards, subjects=subjects,
+                               func_hint=parsed.func_hint, anat_hint=parsed.anat_hint)
+        all_shards = None
+        if parsed.shard:
+            all_shards = shards.load_shards(shard_file, key)
+        if all_shards is None:
+            cache = None
+            if not parsed.no_bids_cache:
+                cache = bids_cache.layout_cache(parsed.output_dir)
+            try:
+                all_shards = shards.dataset_shards(parsed.bids_dir, n_shards, subjects=subjects, cache=cache,
+                                                   func_hint=parsed.func_hint, anat_hint=parsed.anat_hint)
+            finally:
+                if cache is not None:
+                    cache.close()
+
+        if parsed.emit_array:
+            shards.save_shards(shard_file, key, all_shards)
+            n_labels = len(parsed.participant_label) if parsed.participant_label else 0
+            for labels, _ in all_shards:
+                if labels:
+                    print(shard_command(args, labels, n_labels))
+            return
+
+        parsed.participant_label = all_shards[shard_num - 1][0]
+        if not parsed.participant_label:
+            print("Shard {0} has no participant".format(parsed.shard))
+            return
     pipeline = pyniak.load_pipeline.FmriPreprocessBids(folder_in=parsed.bids_dir, folder_out=parsed.output_dir,
                                                        subjects=parsed.participant_label,
+                                                       func_hint=parsed.func_hint, anat_hint=parsed.anat_hint,
                                                        smooth_vol_fwhm=parsed.smooth_vol_fwhm,
                                                        t1_preprocess_nu_correct=parsed.t1_preprocess_nu_correct,
                                                        lp=parsed.lp, hp=parsed.hp, suppress_vol=parsed.suppress_vol,
                                                        delay_in_tr=parsed.delay_in_tr,
                                                        type_acquisition=parsed.type_acquisition,
                                                        type_scaner=parsed.type_scaner, n_thread=parsed.n_thread,
-                                                       skip_slice_timing=parsed.skip_slice_timing, group=group)
+                                                       skip_slice_timing=parsed.skip_slice_timing, group=group,
+                                                       use_bids_cache=not parsed.no_bids_cache,
+                                                       octave_pool=parsed.octave_pool,
+                                                       sync_threads=parsed.sync_threads,
+                                                       plan=parsed.plan, plan_history=parsed.plan_history,
+                                                       cache_dir=parsed.cache_dir,
+                                                       resume=parsed.resume, work_max_age=parsed.work_max_age,
+                                                       scratch=parsed.scratch,
+                                                       cache_size=(None if parsed.cache_size is None
+                                                                   else int(parsed.cache_size * 1024 ** 3)))
     pipeline.run()
 
 
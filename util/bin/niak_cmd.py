@@ -75,6 +75,15 @@ def main(args=None):
 
     parser.add_argument("--subjects", default=None)
 
+    parser.add_argument("--n_workers", default=None, type=int, help=(
+        'Start that many psom workers along the pipeline manager, 0 sizes the pool '
+        'from the cores and memory of the node. By default no worker is started.'))
+
+    parser.add_argument("--plan", default=None, help=(
+        'Do not run the pipeline, save its jobs, inputs, outputs and dependencies in '
+        'that json file and print the estimated run time and size of the outputs, '
+        'from the logs found in folder_out.'))
+
     parsed, unformated_options = parser.parse_known_args(args)
 
     pipeline_name = parsed.pipeline
@@ -101,7 +110,9 @@ def main(args=None):
                                                        subjects=parsed.subjects,
                                                        options=options,
                                                        func_hint=parsed.func_hint,
-                                                       anat_hint=parsed.anat_hint)
+                                                       anat_hint=parsed.anat_hint,
+                                                       n_workers=parsed.n_workers,
+                                                       plan=parsed.plan)
 
     pipeline.run()
 
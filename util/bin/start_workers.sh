@@ -1,8 +1,5 @@
 #!/bin/bash
-~/simexp/psom/psom_worker.py -d /home/poquirion/test/results-directory -w 1 &
-~/simexp/psom/psom_worker.py -d /home/poquirion/test/results-directory -w 2 &
-~/simexp/psom/psom_worker.py -d /home/poquirion/test/results-directory -w 3 &
-~/simexp/psom/psom_worker.py -d /home/poquirion/test/results-directory -w 4 &
-~/simexp/psom/psom_worker.py -d /home/poquirion/test/results-directory -w 5 &
-~/simexp/psom/psom_worker.py -d /home/poquirion/test/results-directory -w 6 &
-~/simexp/psom/psom_worker.py -d /home/poquirion/test/results-directory -w 7 &
+# Usage: start_workers.sh RESULTS_DIRECTORY [NB_WORKERS]
+# Without NB_WORKERS, the pool is sized from the cores and memory of the node
+CURRENT_DIR="$( cd "$( dirname "${BASH_SOURCE[0]}" )" && pwd )"
+PYTHONPATH=${CURRENT_DIR}/..:${PYTHONPATH} python -m pyniak.workers -d ${1:-$PWD} -n ${2:-0}
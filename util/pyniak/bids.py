@@ -0,0 +1,279 @@
+"""
+Pure python grabber for BIDS datasets.
+
+Builds the same files_in structure as commands/read_write/niak_grab_bids.m,
+without booting octave, and only lists the directories of the selected
+subjects.
+"""
+
+import collections
+import json
+import logging
+import os
+import re
+
+try:
+    from os import scandir
+except ImportError:
+    scandir = None
+
+
+log = logging.getLogger(__file__)
+
+# Same patterns as in niak_grab_bids.m
+SUBJECT_REGEX = re.compile("(sub-(.*))", re.IGNORECASE)
+SESSION_REGEX = re.compile("(ses-(.*))")
+RUN_REGEX = re.compile("run-([0-9]+)", re.IGNORECASE)
+ENTITY_REGEX = re.compile("(?:^|_)([a-zA-Z]+)-([a-zA-Z0-9]+)")
+ANAT_DIR = 'anat'
+FUNC_DIR = 'func'
+
+
+def list_dir(path):
+    """
+    One pass over a directory, files and sub directories are separated
+    without an extra stat when the file system provides the entry type.
+
+    :param path: a directory
+    :return: (sorted list of directories, sorted list of other entries),
+             two empty lists if path does not exist
+    """
+    dirs = []
+    files = []
+    try:
+        if scandir is not None:
+            for entry in scandir(path):
+                if entry.is_dir():
+                    dirs.append(entry.name)
+                else:
+                    files.append(entry.name)
+        else:
+            for name in os.listdir(path):
+                if os.path.isdir(os.path.join(path, name)):
+                    dirs.append(name)
+                else:
+                    files.append(name)
+    except OSError:
+        return [], []
+    return sorted(dirs), sorted(files)
+
+
+def parse_entities(file_name):
+    """
+    :param file_name: a BIDS file name, like sub-01_ses-02_task-rest_run-1_bold.nii.gz
+    :return: a dict of the key-value entities, like {'sub': '01', 'ses': '02', ...}
+    """
+    return dict((k.lower(), v) for k, v in ENTITY_REGEX.findall(file_name))
+
+
+def subject_id(dir_name):
+    """
+    :param dir_name: the name of a directory at the root of the dataset
+    :return: the subject label, or None if dir_name is not a subject directory
+    """
+    match = SUBJECT_REGEX.search(dir_name)
+    if match:
+        return match.group(2)
+    return None
+
+
+class BidsIndex(object):
+    """
+    Listing of the anat and func files of a BIDS dataset, indexed by subject
+    and session.
+    """
+
+    def __init__(self, path_data, subjects=None, cache=None):
+        """
+        :param path_data: root of the BIDS dataset
+        :param subjects: list of int, only those subjects are listed.
+                         None, all subjects are listed.
+        :param cache: a bids_cache.LayoutCache, directory listings are
+                      reused from it when the directories did not change
+        """
+        self.path_data = os.path.abspath(path_data)
+        self.subjects = subjects
+        self.cache = cache
+        self._layout = None
+
+    def list_dir(self, path):
+        if self.cache is not None:
+            return self.cache.list_dir(path)
+        return list_dir(path)
+
+    def selected(self, sub_id):
+        """
+        Mimic the subject_list filter of niak_grab_bids, where labels are
+        compared as numbers
+        """
+        if self.subjects is None:
+            return True
+        try:
+            return int(sub_id) in self.subjects
+        except ValueError:
+            return False
+
+    def subject_dirs(self):
+        """
+        :return: list of (subject directory, subject label) of the selected subjects
+        """
+        dirs, _ = self.list_dir(self.path_data)
+        subject_dirs = []
+        for d in dirs:
+            sub_id = subject_id(d)
+            if sub_id is not None and self.selected(sub_id):
+                subject_dirs.append((d, sub_id))
+        return subject_dirs
+
+    def scan_subject(self, subject_dir):
+        """
+        :param subject_dir: name of the subject directory
+        :return: an OrderedDict {session directory: {'anat': [names], 'func': [names]}},
+                 the session directory is '' if the subject has no session directory
+        """
+        subject_path = os.path.join(self.path_data, subject_dir)
+        dirs, _ = self.list_dir(subject_path)
+        sessions = [d for d in dirs if SESSION_REGEX.search(d)]
+        if not sessions:
+            sessions = ['']
+
+        layout = collections.OrderedDict()
+        for ses_dir in sessions:
+            session_path = os.path.join(subject_path, ses_dir)
+            layout[ses_dir] = {ANAT_DIR: self.list_dir(os.path.join(session_path, ANAT_DIR))[1],
+                              FUNC_DIR: self.list_dir(os.path.join(session_path, FUNC_DIR))[1]}
+        return layout
+
+    def scan(self):
+        """
+        :return: an OrderedDict {subject directory: subject layout}, see scan_subject
+        """
+        layout = collections.OrderedDict()
+        for subject_dir, _ in self.subject_dirs():
+            layout[subject_dir] = self.scan_subject(subject_dir)
+        if self.cache is not None:
+            self.cache.flush()
+        return layout
+
+    @property
+    def layout(self):
+        if self._layout is None:
+            self._layout = self.scan()
+        return self._layout
+
+    def grab(self, func_hint="", anat_hint="T1w", task_type="rest", max_subjects=0):
+        """
+        Same selection rules and field names as niak_grab_bids.m
+
+        :param func_hint: pick the fmri runs with that string in their name
+        :param anat_hint: pick the anatomical scan with that string in its name
+        :param task_type: the task name used in the run field names
+        :param max_subjects: 0 return all subjects, otherwise stop after that many
+        :return: a files_in OrderedDict ready for niak_pipeline_fmri_preprocess
+        """
+        files = collections.OrderedDict()
+        for subject_dir, sessions in self.layout.items():
+            sub_id = subject_id(subject_dir)
+            fmri_regex = re.compile("({0}.*{1}.*(nii|mnc).*)".format(re.escape(subject_dir), re.escape(func_hint)),
+                                    re.IGNORECASE)
+            anat_regex = re.compile("({0}.*{1}.*(nii|mnc).*)".format(re.escape(subject_dir), re.escape(anat_hint)),
+                                    re.IGNORECASE)
+            fmri = collections.OrderedDict()
+            anat_match = []
+            for ses_dir, content in sessions.items():
+                session_path = os.path.join(self.path_data, subject_dir, ses_dir).rstrip(os.sep)
+                if ses_dir:
+                    session_field = "sess{0}".format(SESSION_REGEX.search(ses_dir).group(2))
+                else:
+                    session_field = "sess1"
+
+                # As in niak_grab_bids, only the anat of the last session is kept
+                anat_match = [os.path.join(session_path, ANAT_DIR, m.group(1))
+                              for m in (anat_regex.search(f) for f in content[ANAT_DIR]) if m]
+
+                for f in content[FUNC_DIR]:
+                    m = fmri_regex.search(f)
+                    if not m:
+                        continue
+                    run_num = RUN_REGEX.search(m.group(1))
+                    if run_num:
+                        run_field = "task{0}run{1}".format(task_type, run_num.group(1))
+                    else:
+                        run_field = "task{0}".format(task_type)
+                    fmri.setdefault(session_field, collections.OrderedDict())[run_field] = \
+                        os.path.join(session_path, FUNC_DIR, m.group(1))
+
+            # only return subject if anat and one func is found
+            if anat_match and fmri:
+                files["sub{0}".format(sub_id)] = collections.OrderedDict([("anat", anat_match[0]),
+                                                                           ("fmri", fmri)])
+                if max_subjects and len(files) >= max_subjects:
+                    break
+        return files
+
+
+def grab_bids(path_data, subjects=None, func_hint="", anat_hint="T1w", task_type="rest", max_subjects=0,
+              cache=None):
+    """
+    Python version of niak_grab_bids
+
+    :param cache: an optional bids_cache.LayoutCache
+    :return: a files_in OrderedDict, see BidsIndex.grab
+    """
+    log.info("Reading Bids structure {0}".format(path_data))
+    return BidsIndex(path_data, subjects=subjects, cache=cache).grab(func_hint=func_hint or "", anat_hint=anat_hint or "T1w",
+                                                        task_type=task_type, max_subjects=max_subjects)
+
+
+def octave_string(s):
+    """
+    :return: s as a single quoted octave string
+    """
+    return "'{0}'".format(s.replace("'", "''"))
+
+
+def to_octave(files, var_name="files_in"):
+    """
+    Translate a (nested) files_in dict into octave assignments
+
+    :param files: the output of grab_bids
+    :param var_name: the name of the octave variable
+    :return: a list of octave commands
+    """
+    cmd = ["{0} = struct()".format(var_name)]
+
+    def unfold(prefix, value):
+        if isinstance(value, dict):
+            for k, v in value.items():
+                unfold("{0}.{1}".format(prefix, k), v)
+        else:
+            cmd.append("{0} = {1}".format(prefix, octave_string(value)))
+
+    unfold(var_name, files)
+    return cmd
+
+
+def to_json(files, json_file):
+    """
+    Save a files_in dict in a json file, readable in octave with loadjson
+    """
+    with open(json_file, 'w') as fp:
+        json.dump(files, fp, indent=2)
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description="Print the niak files_in structure of a BIDS dataset")
+    parser.add_argument("bids_dir")
+    parser.add_argument("--participant_label", nargs="+", type=int, default=None)
+    parser.add_argument("--func_hint", default="")
+    parser.add_argument("--anat_hint", default="T1w")
+    parser.add_argument("--json", default=None, help="Save files_in in that json file instead of printing it")
+    parsed = parser.parse_args()
+
+    files_in = grab_bids(parsed.bids_dir, subjects=parsed.participant_label,
+                         func_hint=parsed.func_hint, anat_hint=parsed.anat_hint)
+    if parsed.json:
+        to_json(files_in, parsed.json)
+    else:
+        print(";\n".join(to_octave(files_in)) + ";")
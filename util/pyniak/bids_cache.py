@@ -0,0 +1,119 @@
+"""
+Persistent cache of the directory listings of a BIDS dataset.
+
+Listings are stored in a sqlite file and keyed on the inode and time stamps
+of each directory. A directory is listed again only if it changed, so when
+many participant jobs run against the same dataset only the first one pays
+for the listing, the others only stat the directories of their subjects.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+
+from pyniak import bids
+
+
+log = logging.getLogger(__file__)
+
+CACHE_FILE = "bids_layout.sqlite"
+# Many participant jobs can start at the same time, wait for the lock
+SQLITE_TIMEOUT = 60
+
+
+def dir_stamp(path):
+    """
+    :param path: a directory
+    :return: a string that changes whenever an entry is added, removed or
+             renamed in the directory, None if it does not exist
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return "{0}:{1!r}:{2!r}".format(st.st_ino, st.st_mtime, st.st_ctime)
+
+
+class LayoutCache(object):
+    """
+    Drop in replacement for bids.list_dir, backed by a sqlite file
+    """
+
+    def __init__(self, cache_file):
+        """
+        :param cache_file: the sqlite file, created if it does not exist
+        """
+        self.cache_file = cache_file
+        self._updates = []
+        self.hit = 0
+        self.miss = 0
+        try:
+            self.connection = sqlite3.connect(cache_file, timeout=SQLITE_TIMEOUT)
+            with self.connection:
+                self.connection.execute("CREATE TABLE IF NOT EXISTS listing "
+                                        "(path TEXT PRIMARY KEY, stamp TEXT, dirs TEXT, files TEXT)")
+        except sqlite3.Error as e:
+            log.warning("BIDS layout cache {0} not usable, listing the dataset: {1}".format(cache_file, e))
+            self.connection = None
+
+    def list_dir(self, path):
+        """
+        Same as bids.list_dir, the listing is read from the cache when the
+        directory did not change since it was stored
+
+        :param path: a directory
+        :return: (sorted list of directories, sorted list of other entries)
+        """
+        stamp = dir_stamp(path)
+        if stamp is None:
+            return [], []
+
+        if self.connection is not None:
+            try:
+                row = self.connection.execute("SELECT stamp, dirs, files FROM listing WHERE path=?",
+                                              (path,)).fetchone()
+            except sqlite3.Error as e:
+                log.warning("Could not read BIDS layout cache: {0}".format(e))
+                row = None
+            if row is not None and row[0] == stamp:
+                self.hit += 1
+                return json.loads(row[1]), json.loads(row[2])
+
+        self.miss += 1
+        dirs, files = bids.list_dir(path)
+        self._updates.append((path, stamp, json.dumps(dirs), json.dumps(files)))
+        return dirs, files
+
+    def flush(self):
+        """
+        Write the new listings in one transaction, to keep the lock short
+        """
+        log.info("BIDS layout cache: {0} directories reused, {1} listed".format(self.hit, self.miss))
+        if self.connection is None or not self._updates:
+            return
+        try:
+            with self.connection:
+                self.connection.executemany("INSERT OR REPLACE INTO listing (path, stamp, dirs, files) "
+                                            "VALUES (?, ?, ?, ?)", self._updates)
+            self._updates = []
+        except sqlite3.Error as e:
+            log.warning("Could not update BIDS layout cache: {0}".format(e))
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+def layout_cache(folder_out):
+    """
+    :param folder_out: the final output folder of the pipeline
+    :return: the LayoutCache stored in folder_out/logs
+    """
+    logs = os.path.join(folder_out, "logs")
+    try:
+        os.makedirs(logs)
+    except OSError:
+        pass
+    return LayoutCache(os.path.join(logs, CACHE_FILE))
@@ -0,0 +1,111 @@
+"""
+Size cap of the cache of brick results.
+
+The cache is filled by commands/misc/niak_cache_job.m, one folder per job
+key in <cache>/<2 first characters of the key>/<key>, touched on every hit.
+The least recently used entries are removed until the cache fits in its
+size. The digests of the job inputs, kept in <cache>/digests, are removed
+once they are old, they only spare the hashing of unchanged inputs.
+"""
+
+import logging
+import os
+import shutil
+import time
+
+
+log = logging.getLogger(__file__)
+
+MANIFEST = "manifest.mat"
+# Entries being written by niak_cache_job are <key>.tmp<pid>
+TMP_TAG = ".tmp"
+# A partial entry older than that was left by a job that died
+STALE_TMP = 24 * 3600
+# The digests of the job inputs, see niak_cache_job
+DIGESTS = "digests"
+DIGEST_AGE = 30 * 24 * 3600
+
+
+def entry_size(path):
+    size = 0
+    for f in os.listdir(path):
+        try:
+            size += os.lstat(os.path.join(path, f)).st_size
+        except OSError:
+            pass
+    return size
+
+
+def entries(path_cache):
+    """
+    :return: list of (last use, size, path) of the complete entries of the cache,
+             least recently used first
+    """
+    found = []
+    try:
+        prefixes = os.listdir(path_cache)
+    except OSError:
+        return found
+    for prefix in prefixes:
+        prefix_path = os.path.join(path_cache, prefix)
+        if prefix == DIGESTS or not os.path.isdir(prefix_path):
+            continue
+        for key in os.listdir(prefix_path):
+            path = os.path.join(prefix_path, key)
+            if TMP_TAG in key or not os.path.exists(os.path.join(path, MANIFEST)):
+                continue
+            found.append((os.path.getmtime(path), entry_size(path), path))
+    return sorted(found)
+
+
+def remove_stale(path_cache, age=STALE_TMP):
+    """
+    Remove the partial entries left by jobs that died while storing their outputs
+    """
+    now = time.time()
+    for prefix in os.listdir(path_cache):
+        prefix_path = os.path.join(path_cache, prefix)
+        if prefix == DIGESTS or not os.path.isdir(prefix_path):
+            continue
+        for key in os.listdir(prefix_path):
+            path = os.path.join(prefix_path, key)
+            if TMP_TAG in key and now - os.path.getmtime(path) > age:
+                shutil.rmtree(path, ignore_errors=True)
+
+
+def remove_old_digests(path_cache, age=DIGEST_AGE):
+    """
+    Remove the digests of job inputs written more than age seconds ago
+    """
+    now = time.time()
+    for dir_path, _, file_names in os.walk(os.path.join(path_cache, DIGESTS)):
+        for f in file_names:
+            path = os.path.join(dir_path, f)
+            try:
+                if now - os.path.getmtime(path) > age:
+                    os.remove(path)
+            except OSError:
+                pass
+
+
+def evict(path_cache, max_bytes):
+    """
+    Remove the least recently used entries until the cache holds at most max_bytes
+
+    :return: the number of bytes removed
+    """
+    if not os.path.isdir(path_cache):
+        return 0
+    remove_stale(path_cache)
+    remove_old_digests(path_cache)
+    found = entries(path_cache)
+    total = sum(size for _, size, _ in found)
+    removed = 0
+    for _, size, path in found:
+        if total - removed <= max_bytes:
+            break
+        shutil.rmtree(path, ignore_errors=True)
+        removed += size
+    if removed:
+        log.info("{0} bytes removed from the cache {1}".format(removed, path_cache))
+    return removed
@@ -0,0 +1,228 @@
+"""
+Connectomes of many subjects on one parcellation, in one pass.
+
+Same connectomes as bricks/connectome/niak_brick_connectome.m, for all
+the subjects of a study at once: the parcellation is read a single time,
+the region time series of a run are the product of its voxels with a
+sparse averaging matrix, and the covariance is a float32 product of the
+time series, in a pool of threads (numpy releases the GIL in BLAS and
+while reading the volumes). The inverse of the covariance, for 'U' and
+'P', is computed in float64.
+
+The connectomes are vectorized like the brick, with CODE 'vec' or 'lvec'
+(see niak_mat2vec and niak_mat2lvec), averaged over the runs of a
+subject, and written as the rows of the dataset CONN of a single HDF5
+file, chunked by subject, as they are computed.
+"""
+
+import collections
+import logging
+import os
+from multiprocessing.pool import ThreadPool
+
+import numpy as np
+import scipy.io
+import scipy.sparse
+
+import h5py
+
+from pyniak import volume
+
+
+log = logging.getLogger(__file__)
+
+TYPES = ("S", "R", "Z", "U", "P", "A", "AZ")
+# Connectomes with their diagonal
+LVEC_TYPES = ("S", "U", "A", "AZ")
+
+
+class Parcellation(object):
+    """
+    The regions of a parcellation, read once for all the runs
+    """
+
+    def __init__(self, file_mask):
+        hdr, mask = volume.read_vol(file_mask)
+        self.file_mask = file_mask
+        self.mat = np.asarray(hdr["info"]["mat"])
+        self.shape = mask.shape[:3]
+        labels = np.rint(mask).astype(int).ravel()
+        self.voxels = np.flatnonzero(labels)
+        # The regions are numbered in the order of their labels, like the brick
+        self.ind_roi, index = np.unique(labels[self.voxels], return_inverse=True)
+        self.size = np.bincount(index).astype(np.float32)
+        weights = 1. / self.size[index]
+        # regions x voxels of the mask, the average of the voxels of each region
+        self.average = scipy.sparse.csr_matrix((weights, (index, np.arange(len(index)))),
+                                               shape=(len(self.ind_roi), len(index)), dtype=np.float32)
+
+    def check(self, hdr, vol, file_name):
+        if vol.shape[:3] != self.shape or not np.allclose(np.asarray(hdr["info"]["mat"]), self.mat):
+            raise ValueError("{0} and {1} should be in the same space and spatial grid"
+                             .format(file_name, self.file_mask))
+
+    def tseries(self, voxels):
+        """
+        :param voxels: array voxels of the mask x time
+        :return: array time x regions of the average time series
+        """
+        return np.asarray(self.average.dot(voxels).T, dtype=np.float32)
+
+
+def read_run(parcellation, file_name):
+    """
+    :return: the voxels of the mask x time points of a run, without the scrubbed volumes
+    """
+    hdr, vol = volume.read_vol(file_name)
+    parcellation.check(hdr, vol, file_name)
+    voxels = np.asarray(vol.reshape(-1, vol.shape[3])[parcellation.voxels], dtype=np.float32)
+    if "file_extra" in hdr:
+        extra = scipy.io.loadmat(hdr["file_extra"])
+        if "mask_scrubbing" in extra:
+            voxels = voxels[:, ~extra["mask_scrubbing"].ravel().astype(bool)]
+    return voxels
+
+
+def vectorize(mat, code):
+    # The matrices are symmetric, the row major upper triangle is the column major lower triangle
+    return mat[np.triu_indices(mat.shape[0], 0 if code == "lvec" else 1)]
+
+
+def run_connectome(parcellation, voxels, conn_type):
+    """
+    :param voxels: the time series of the voxels of the mask, voxels x time
+    :return: the vectorized connectome
+    """
+    tseries = parcellation.tseries(voxels)
+    n_time = tseries.shape[0]
+    tseries -= tseries.mean(axis=0)
+    cov = tseries.T.dot(tseries) / np.float32(n_time - 1)
+    if conn_type == "S":
+        return vectorize(cov, "lvec")
+    std = np.sqrt(np.diag(cov))
+    if conn_type in ("U", "P"):
+        conc = np.linalg.inv(cov.astype(np.float64))
+        if conn_type == "U":
+            return vectorize(conc, "lvec")
+        d_conc = np.sqrt(np.diag(conc))
+        return vectorize(-conc / np.outer(d_conc, d_conc), "vec")
+    corr = cov / np.outer(std, std)
+    if conn_type == "R":
+        return vectorize(corr, "vec")
+    if conn_type == "Z":
+        return np.arctanh(vectorize(corr, "vec"))
+    # 'A' and 'AZ', the average correlation between the voxels of a region on the diagonal
+    voxels = voxels - voxels.mean(axis=1)[:, np.newaxis]
+    std_v = np.sqrt((voxels ** 2).sum(axis=1) / (n_time - 1))
+    voxels[std_v != 0] /= std_v[std_v != 0, np.newaxis]
+    intra = parcellation.tseries(voxels).var(axis=0, ddof=1)
+    size = parcellation.size.copy()
+    mask_0 = size <= 1
+    size[mask_0] = 10
+    intra = (size ** 2 * intra - size) / (size * (size - 1))
+    intra[mask_0] = 0
+    corr[np.diag_indices_from(corr)] = intra
+    conn = vectorize(corr, "lvec")
+    return np.arctanh(conn) if conn_type == "AZ" else conn
+
+
+def subject_connectome(parcellation, runs, conn_type):
+    """
+    :param runs: the fmri files of a subject
+    :return: the vectorized connectome, averaged over the runs
+    """
+    conn = None
+    for file_name in runs:
+        run_conn = run_connectome(parcellation, read_run(parcellation, file_name), conn_type)
+        conn = run_conn.astype(np.float64) if conn is None else conn + run_conn
+    return (conn / len(runs)).astype(np.float32)
+
+
+def batch(fmri, file_mask, file_out, conn_type="AZ", n_threads=4):
+    """
+    Compute the connectomes of all the subjects in one file
+
+    :param fmri: OrderedDict subject: list of fmri runs
+    :param file_mask: the parcellation, in the space of the runs
+    :param file_out: the HDF5 file, with the datasets CONN (subjects x connections), SUBJECTS,
+                     IND_ROI and FAILED (the subjects whose connectome could not be computed,
+                     their row is nan) and the attributes TYPE and CODE
+    :return: the list of failed subjects
+    :raise volume.UnsupportedFormat: if a run is neither nifti nor MINC2, file_out is not written
+    """
+    if conn_type not in TYPES:
+        raise ValueError("{0} is an unknown type of connectome".format(conn_type))
+    parcellation = Parcellation(file_mask)
+    subjects = list(fmri)
+    n_roi = len(parcellation.ind_roi)
+    code = "lvec" if conn_type in LVEC_TYPES else "vec"
+    n_conn = n_roi * (n_roi + 1) // 2 if code == "lvec" else n_roi * (n_roi - 1) // 2
+
+    def compute(subject):
+        try:
+            return subject, subject_connectome(parcellation, fmri[subject], conn_type)
+        except volume.UnsupportedFormat:
+            # The same for all the subjects of a study, do not write a file full of nan
+            raise
+        except Exception as e:
+            log.error("Could not compute the connectome of {0}: {1}".format(subject, e))
+            return subject, None
+
+    failed = []
+    pool = ThreadPool(n_threads)
+    try:
+        with h5py.File(file_out, "w") as h5:
+            conn = h5.create_dataset("conn", shape=(len(subjects), n_conn), dtype=np.float32,
+                                     chunks=(1, n_conn), fillvalue=np.nan)
+            h5.create_dataset("subjects", data=np.array(subjects, dtype="S"))
+            h5.create_dataset("ind_roi", data=parcellation.ind_roi)
+            h5.attrs["type"] = conn_type
+            h5.attrs["code"] = code
+            for num_s, (subject, subject_conn) in enumerate(pool.imap(compute, subjects)):
+                if subject_conn is None:
+                    failed.append(subject)
+                else:
+                    conn[num_s] = subject_conn
+                log.info("{0}/{1} {2}".format(num_s + 1, len(subjects), subject))
+            h5.create_dataset("failed", data=np.array(failed, dtype="S"))
+    except Exception:
+        if os.path.exists(file_out):
+            os.remove(file_out)
+        raise
+    finally:
+        pool.terminate()
+        pool.join()
+    return failed
+
+
+def read_subjects(file_name):
+    """
+    :param file_name: a tab separated file, with a subject and a fmri run on each line
+    :return: OrderedDict subject: list of runs
+    """
+    fmri = collections.OrderedDict()
+    with open(file_name) as fp:
+        for line in fp:
+            if not line.strip():
+                continue
+            subject, run = line.rstrip("\n").split("\t")
+            fmri.setdefault(subject, []).append(run)
+    return fmri
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description="Compute the connectomes of many subjects in one HDF5 file")
+    parser.add_argument("subjects", help="Tab separated file with a subject and one of its fmri runs per line")
+    parser.add_argument("mask", help="The parcellation, in the space of the runs")
+    parser.add_argument("output", help="The HDF5 file of connectomes")
+    parser.add_argument("--type", choices=TYPES, default="AZ",
+                        help="The type of connectome, see niak_brick_connectome")
+    parser.add_argument("-n", "--n_threads", type=int, default=4, help="Number of subjects computed at once")
+    parsed = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    failed = batch(read_subjects(parsed.subjects), parsed.mask, parsed.output, conn_type=parsed.type,
+                   n_threads=parsed.n_threads)
+    if failed:
+        raise SystemExit("No connectome for {0}".format(", ".join(failed)))
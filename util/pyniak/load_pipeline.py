@@ -7,14 +7,26 @@ import re
 import subprocess
 import tempfile
 import logging
-import time
 import yaml
 
+from pyniak import bids
+from pyniak import bids_cache
+from pyniak import brick_cache
+from pyniak import octave_pool
+from pyniak import plan
+from pyniak import psom_status
+from pyniak import staging
+from pyniak import sync
+from pyniak import workdir
+from pyniak import workers
+
 
 NIAK_CONFIG_PATH = os.getenv("NIAK_CONFIG_PATH", '/local_config')
 
 PSOM_GB_LOCAL = "{}/../lib/psom_gb_vars_local.cbrain".format(os.path.dirname(os.path.realpath(__file__)))
 
+NIAK_OCTAVE = "{}/../bin/niak_octave".format(os.path.dirname(os.path.realpath(__file__)))
+
 DEBUG = False
 if os.getenv("DEBUG", False):
     DEBUG = True
@@ -115,7 +127,8 @@ class BasePipeline(object):
     BOUTIQUE_TYPE = "type"
     BOUTIQUE_LIST = "list"
 
-    def __init__(self, pipeline_name, folder_in=None, folder_out=None, options=None, **kwargs):
+    def __init__(self, pipeline_name, folder_in=None, folder_out=None, options=None, n_workers=None, plan=None,
+                 **kwargs):
 
         self.log = logging.getLogger(__file__)
         # literal file name in niak
@@ -134,6 +147,12 @@ class BasePipeline(object):
 
         self.psom_gb_local_path = None
 
+        # None, the psom workers are started by someone else, 0 use the whole node
+        self.n_workers = n_workers
+
+        # A json file, the pipeline is only described there, see pyniak.plan
+        self.plan = plan
+
     def psom_gb_vars_local_setup(self):
         """
         This method is crucial to have psom/niak running properly on cbrain.
@@ -148,33 +167,50 @@ class BasePipeline(object):
         shutil.copyfile(PSOM_GB_LOCAL, self.psom_gb_local_path)
 
     def run(self):
-        self.log.debug("Run: {}".format(" ".join(self.octave_cmd)))
+        # Each access to octave_cmd writes a new script
+        octave_cmd = self.octave_cmd
+        self.log.debug("Run: {}".format(" ".join(octave_cmd)))
         p = None
 
         self.psom_gb_vars_local_setup()
 
+        if self.plan:
+            subprocess.check_call(octave_cmd)
+            print(plan.finalize(self.plan))
+            return
+
+        pool = None
+        if self.n_workers is not None:
+            pool = workers.WorkerPool(self.folder_out, n_workers=self.n_workers)
+            pool.start()
+
         try:
-            self.log.info("{}".format(" ".join(self.octave_cmd)))
-            self.log.info(("{0};\n{1}(files_in, opt);".format(";\n".join(self.octave_options), self.pipeline_name)))
-            p = subprocess.Popen(self.octave_cmd)
+            self.log.info("{}".format(" ".join(octave_cmd)))
+            p = subprocess.Popen(octave_cmd)
             p.wait()
         except BaseException as e:
-            if p and psutil_loaded:
-                parent = psutil.Process(p.pid)
-                try:
-                    children = parent.children(recursive=True)
-                except AttributeError:
-                    children = parent.get_children(recursive=True)
-                for child in children:
-                    child.kill()
-                parent.kill()
+            if p:
+                workers.kill_tree(p)
             self.log.error("Could no process octave command")
             raise e
+        finally:
+            if pool is not None:
+                pool.stop()
+
+    def pipeline_call(self):
+        """
+        :return: the octave commands that run the pipeline, or only describe it in plan mode
+        """
+        if self.plan:
+            return plan.octave_script(self.pipeline_name, os.path.abspath(self.plan), self.folder_out)
+        return ["{0}(files_in, opt)".format(self.pipeline_name)]
 
     @property
     def octave_cmd(self):
         tmp_oct = tempfile.NamedTemporaryFile('w', prefix='niak_script_', suffix='.m', delete=False)
-        tmp_oct.write(("{0};\n{1}(files_in, opt);".format(";\n".join(self.octave_options), self.pipeline_name)))
+        script = "{0};\n".format(";\n".join(self.octave_options + self.pipeline_call()))
+        self.log.info(script)
+        tmp_oct.write(script)
         tmp_oct.close()
         return ["/usr/bin/env", "octave", "--no-gui", "{}".format(tmp_oct.name)]
 
@@ -311,11 +347,21 @@ class BaseBids(object):
     BOUTIQUE_LIST = "list"
     PIPELINE_M_FILE = 'pipeline.m'
 
-    def __init__(self, pipeline_name, folder_in, folder_out, config_file=None, options=None):
+    def __init__(self, pipeline_name, folder_in, folder_out, config_file=None, options=None, octave_pool=0,
+                 sync_threads=0, plan=None, plan_history=None, cache_dir=None, cache_size=None, resume=False,
+                 work_max_age=workdir.MAX_AGE, scratch=None):
 
         # The name should be Provided in the derived class
         self._grabber_options = []
         self._pipeline_options = []
+        # The octave commands building files_in, the dataset is only scanned once per launch
+        self._files_in_cmd = None
+
+        # Number of warm octave interpreters running the psom jobs, 0 starts octave for each job
+        self.octave_pool_size = octave_pool
+        self.octave_pool = None
+        if octave_pool:
+            self._pipeline_options.append("opt.psom.command_matlab = '{0}'".format(os.path.realpath(NIAK_OCTAVE)))
         # literal file name in niak
         self.pipeline_name = pipeline_name
 
@@ -325,7 +371,31 @@ class BaseBids(object):
             self.folder_in = folder_in
         self.folder_out_finale = folder_out
         self.octave_options = options
-
+        # Number of threads shipping results to folder_out_finale while the pipeline runs,
+        # 0 ships everything with rsync at the end
+        self.sync_threads = sync_threads
+        # A json file, the pipeline is only described there, see pyniak.plan.
+        # Run times and output sizes are estimated from the logs of plan_history
+        self.plan = plan
+        self.plan_history = plan_history or folder_out
+        self.n_thread = 1
+        # Brick results are reused from that folder, see niak_pipeline_cache.
+        # Least recently used results are removed beyond cache_size bytes
+        self.cache_dir = cache_dir
+        self.cache_size = cache_size
+        if cache_dir:
+            self._pipeline_options.append("opt.path_cache = '{0}'".format(os.path.abspath(cache_dir)))
+        # Continue the unfinished jobs left in the working folder by a previous launch,
+        # and keep that folder if the pipeline does not finish
+        self.resume = resume
+        # Days without activity before the working folder of another run is removed
+        self.work_max_age = work_max_age
+        # Node-local folder for the working folder and a copy of the inputs,
+        # only the results are shipped to folder_out_finale
+        self.scratch = scratch
+        self.staging = None
+        # Held while the working folder is in use, see workdir.lock
+        self.work_lock = None
 
         if config_file:
             self.opt_and_tune_config = load_config(config_file)
@@ -333,53 +403,203 @@ class BaseBids(object):
             self.opt_and_tune_config = []
 
     def run(self):
-        log.info(" ".join(self.octave_cmd))
+        if self.plan:
+            return self.run_plan()
+
+        octave_cmd = self.octave_cmd
+        log.info(" ".join(octave_cmd))
         p = None
 
+        self.start_octave_pool()
+        if self.folder_out == self.folder_out_finale:
+            # Group run, psom reads the logs of all participants
+            self.compact_status()
+        pool = workers.WorkerPool(self.folder_out, n_workers=self.n_thread)
+        streaming = None
+        if self.sync_threads and self.folder_out != self.folder_out_finale:
+            streaming = sync.StreamingSync(self.folder_out, self.folder_out_finale, n_threads=self.sync_threads)
+            streaming.start()
         try:
             log.info(self.folder_out)
-            p = subprocess.Popen(self.octave_cmd)
+            if self.staging is not None:
+                self.staging.start()
+            pool.start()
+            p = subprocess.Popen(octave_cmd)
             p.wait()
         finally:
-            self.rsync_to_finale_folder()
+            pool.stop()
+            resume = self.keep_for_resume(p)
+            if self.staging is not None:
+                self.staging.cleanup(keep=resume)
+            try:
+                if resume:
+                    log.warning("The pipeline did not finish, {0} is kept to resume it".format(self.folder_out))
+                    if streaming is not None:
+                        streaming.finish(remove_source=False)
+                elif not self.rsync_to_finale_folder(streaming):
+                    log.error("The results were not all copied to {0}, they are kept in {1}"
+                              .format(self.folder_out_finale, self.folder_out))
+                elif self.folder_out != self.folder_out_finale and not DEBUG:
+                    shutil.rmtree(self.folder_out, ignore_errors=True)
+            finally:
+                if self.work_lock is not None:
+                    self.work_lock.close()
+                    self.work_lock = None
+                self.stop_octave_pool()
+                if self.cache_dir and self.cache_size is not None:
+                    brick_cache.evict(self.cache_dir, self.cache_size)
+
+    def keep_for_resume(self, p):
+        """
+        :param p: the octave process, None if it did not start
+        :return: True if the working folder should be kept for the next launch
+        """
+        if not self.resume or self.folder_out == self.folder_out_finale:
+            return False
+        if p is None or p.returncode != 0:
+            return True
+        # psom does not fail when some jobs do
+        return psom_status.finished(self.folder_out) is False
+
+    def prepare_work_dir(self, subjects=None):
+        """
+        Use the same working folder for the same participants at every launch,
+        and remove the ones of other runs left idle
+        """
+        if self.plan:
+            # Nothing runs, the working folder of real runs is left alone
+            self.folder_out = tempfile.mkdtemp(prefix='plan', dir=self.folder_out_finale)
+            return
+        root = self.scratch or self.folder_out_finale
+        self.folder_out = workdir.work_dir(root, subjects)
+        self.work_lock = workdir.prepare(self.folder_out, resume=self.resume)
+        workdir.collect_garbage(root, max_age=self.work_max_age, keep=[self.folder_out])
+        if self.scratch:
+            self.staging = staging.Prefetch(self.folder_in, os.path.join(self.scratch, staging.STAGING_DIR,
+                                                                         os.path.basename(self.folder_out)))
+
+    def run_plan(self):
+        """
+        Build the pipeline in test mode, save its jobs in self.plan and print the estimated cost
+        """
+        try:
+            subprocess.check_call(self.octave_cmd)
+        finally:
+            if self.folder_out != self.folder_out_finale:
+                shutil.rmtree(self.folder_out, ignore_errors=True)
+        print(plan.finalize(self.plan, n_thread=self.n_thread))
 
-    def rsync_to_finale_folder(self):
+    def start_octave_pool(self):
+        """
+        Serve a pool of octave interpreters to niak_octave, the command used by psom to run jobs
+        """
+        if not self.octave_pool_size:
+            return
+        socket_path = os.path.join(tempfile.mkdtemp(prefix='niak_pool'), 'octave.sock')
+        log.info("Starting {0} octave interpreters on {1}".format(self.octave_pool_size, socket_path))
+        self.octave_pool = octave_pool.OctavePoolServer(socket_path,
+                                                        octave_pool.OctavePool(size=self.octave_pool_size))
+        self.octave_pool.start()
+        os.environ[octave_pool.POOL_SOCKET_ENV] = socket_path
+
+    def stop_octave_pool(self):
+        if self.octave_pool is not None:
+            socket_dir = os.path.dirname(self.octave_pool.server_address)
+            self.octave_pool.stop()
+            shutil.rmtree(socket_dir, ignore_errors=True)
+            os.environ.pop(octave_pool.POOL_SOCKET_ENV, None)
+            self.octave_pool = None
+
+    def rsync_to_finale_folder(self, streaming=None):
+        """
+        :param streaming: the sync.StreamingSync that shipped results during the run, if any
+        :return: True if the results and the logs were all shipped
+        """
 
-        if self.folder_out != self.folder_out_finale:
-            log.info("sync {} to {}".format(self.folder_out,self.folder_out_finale))
+        if self.folder_out == self.folder_out_finale:
+            return True
+        log.info("sync {} to {}".format(self.folder_out,self.folder_out_finale))
+        success = True
+        if streaming is not None:
+            failed = streaming.finish()
+            if failed:
+                log.error("Could not copy {0} files to {1}: {2}"
+                          .format(len(failed), self.folder_out_finale, ", ".join(failed)))
+                success = False
+        else:
             rsync = ("rsync -a  --remove-source-files   --exclude logs --exclude report {0}/ {1}"
                      .format(self.folder_out, self.folder_out_finale).split())
-            subprocess.call(rsync)
-
-            self.concat_status(self.folder_out, self.folder_out_finale)
-
-    def concat_status(self, src, dest):
+            status = subprocess.call(rsync)
+            if status != 0:
+                log.error("rsync to {0} failed with status {1}".format(self.folder_out_finale, status))
+                success = False
 
         try:
-            os.makedirs(os.path.join(dest, "logs"))
-        except OSError:
-            pass
+            psom_status.write_shard(self.folder_out, self.folder_out_finale)
+        except (IOError, OSError) as e:
+            log.error("Could not save the pipeline logs in {0}: {1}".format(self.folder_out_finale, e))
+            success = False
+        return success
 
+    def compact_status(self):
+        """
+        Merge the logs left by participant runs in the logs of the final folder
+        """
+        dest = self.folder_out_finale
+        try:
+            psom_status.compact(dest)
+            return
+        except psom_status.UnsupportedFormat as e:
+            log.info("{0}, merging the logs with octave".format(e))
+
+        status_file = os.path.join(dest, "logs", psom_status.STATUS_FILE)
+        jobs_file = os.path.join(dest, "logs", psom_status.JOBS_FILE)
+        with psom_status.locked(status_file), psom_status.locked(jobs_file):
+            pairs = psom_status.shards(dest)
+            if not pairs:
+                return
+            l = []
+            for status_shard, jobs_shard in pairs:
+                l += self.append_status_cmd(status_shard, jobs_shard, dest, psom_status.profile_shard(status_shard))
+            if not self.octave_call(l):
+                psom_status.remove_shards(pairs)
+
+    @staticmethod
+    def append_status_cmd(status_file, jobs_file, dest, profile_file=None):
+        """
+        :return: octave commands appending a psom status, jobs and profile file to the logs of dest
+        """
         l = []
-        l.append("new_status = load('{}')".format(os.path.join(src, "logs/PIPE_status.mat")))
+        l.append("new_status = load('{}')".format(status_file))
         # void all group computation
         l.append("fe = fieldnames(new_status)")
         l.append("for fn =fe' ; if strfind(fn{1},'group');   new_status.(fn{1}) = 'none'   ; end; end")
         l.append("save('{}','-append','-struct','new_status');".format(os.path.join(dest, "logs/PIPE_status.mat")))
 
-        l.append("jobs = load('{}')".format(os.path.join(src, "logs/PIPE_jobs.mat")))
+        l.append("jobs = load('{}')".format(jobs_file))
         l.append("save('{}','-append','-struct','jobs');".format(os.path.join(dest, "logs/PIPE_jobs.mat")))
-        subprocess.call(self.octave_run(l))
+        if profile_file is not None:
+            l.append("profile = load('{}')".format(profile_file))
+            l.append("save('{}','-append','-struct','profile');".format(os.path.join(dest, "logs/PIPE_profile.mat")))
+        return l
 
     @property
     def octave_cmd(self):
         m_file = "{0}/{1}".format(self.folder_out, self.PIPELINE_M_FILE)
         with open(m_file,'w') as fp:
             log.info(self.opt_and_tune_config + self.octave_options)
-            fp.write(";\n".join(self.opt_and_tune_config + self.octave_options))
-            fp.write(";\n{0}(files_in, opt);\n".format(self.pipeline_name))
+            fp.write(";\n".join(self.opt_and_tune_config + self.octave_options + self.pipeline_call()))
+            fp.write(";\n")
         return ["/usr/bin/env", "octave", m_file]
 
+    def pipeline_call(self):
+        """
+        :return: the octave commands that run the pipeline, or only describe it in plan mode
+        """
+        if self.plan:
+            return plan.octave_script(self.pipeline_name, os.path.abspath(self.plan), self.plan_history)
+        return ["{0}(files_in, opt)".format(self.pipeline_name)]
+
     def octave_run(self, options, script_name="octave_run"):
 
         tmp_oct = tempfile.NamedTemporaryFile('w', prefix=script_name, suffix='.m', delete=False)
@@ -388,12 +608,27 @@ class BaseBids(object):
         tmp_oct.close()
         return ["/usr/bin/env", "octave", tmp_oct.name]
 
+    def octave_call(self, options, script_name="octave_run"):
+        """
+        Run octave commands, in the octave pool if one is running
+        :return: the exit status
+        """
+        if self.octave_pool is not None:
+            log.info(options)
+            status, output = self.octave_pool.pool.execute(";\n".join(options))
+            log.info(output)
+            return status
+        return subprocess.call(self.octave_run(options, script_name=script_name))
+
     @property
     def octave_options(self):
 
         opt_list = ["opt.folder_out=\'{0}\'".format(self.folder_out)]
 
-        opt_list += self.grabber_construction()
+        if self._files_in_cmd is None:
+            # The BIDS scan, its cache and the staging of the inputs run once
+            self._files_in_cmd = self.grabber_construction() or []
+        opt_list += self._files_in_cmd
 
         if self._pipeline_options:
             opt_list += self._pipeline_options
@@ -439,25 +674,24 @@ class FmriPreprocessBids(BaseBids):
     def __init__(self, subjects=None, func_hint="", anat_hint="", n_thread=1, group=False
                  , type_scaner="", type_acquisition=None, delay_in_tr=0, suppress_vol=0
                  , hp=0.01, lp=float('inf'), t1_preprocess_nu_correct=50, smooth_vol_fwhm=6, skip_slice_timing=False
-                 , *args, **kwargs):
+                 , use_bids_cache=True, *args, **kwargs):
         super(FmriPreprocessBids, self).__init__("niak_pipeline_fmri_preprocess", *args, **kwargs)
 
 
         self.func_hint = func_hint
         self.anat_hint = anat_hint
+        self.use_bids_cache = use_bids_cache
 
         if subjects is not None:
             self.subjects = unroll_numbers(subjects)
-            le_suffix = str(self.subjects[0])
         else:
             self.subjects = None
-            le_suffix = 'all'
 
         if not group:
             if DEBUG:
                 self.folder_out = os.path.join(self.folder_out_finale, "results_debug")
             else:
-                self.folder_out = tempfile.mkdtemp(prefix='results', suffix=le_suffix, dir=self.folder_out_finale)
+                self.prepare_work_dir(self.subjects)
 
             self._pipeline_options.append("opt.size_output = 'all' ")
         else:
@@ -466,7 +700,10 @@ class FmriPreprocessBids(BaseBids):
             self._pipeline_options.append("opt.psom.flag_verbose = 2")
 
 
-        self._pipeline_options.append("opt.psom.max_queued = {}".format(n_thread))
+        # The jobs are run by a pool of psom_worker.py, sized from n_thread and the node resources
+        self.n_thread = workers.pool_size(n_thread)
+        self._pipeline_options.append("opt.psom.mode = 'cbrain'")
+        self._pipeline_options.append("opt.psom.max_queued = {}".format(self.n_thread))
         self._pipeline_options.append("opt.slice_timing.type_acquisition = '{}'".format(type_acquisition))
         self._pipeline_options.append("opt.slice_timing.type_scanner = '{}'".format(type_scaner))
         self._pipeline_options.append("opt.slice_timing.delay_in_tr = {}".format(delay_in_tr))
@@ -508,10 +745,22 @@ class FmriPreprocessBids(BaseBids):
 
         elif bids_description:
                 if self.subjects is not None and len(self.subjects) >= 1:
-                    opt_list += ["opt_gr.subject_list = {0}".format(self.subjects).replace('[', '{').replace(']', '}')]
-                    opt_list += ["files_in=niak_grab_bids('{0}',opt_gr)".format(in_full_path)]
+                    subjects = self.subjects
                 else:
-                    opt_list += ["files_in=niak_grab_bids('{0}')".format(in_full_path)]
+                    subjects = None
+                # Only the selected subjects are listed, no need to start octave for that
+                cache = None
+                if self.use_bids_cache:
+                    cache = bids_cache.layout_cache(self.folder_out_finale)
+                try:
+                    files_in = bids.grab_bids(in_full_path, subjects=subjects, cache=cache,
+                                              func_hint=self.func_hint, anat_hint=self.anat_hint)
+                finally:
+                    if cache is not None:
+                        cache.close()
+                if self.staging is not None:
+                    files_in = self.staging.stage(files_in)
+                opt_list += bids.to_octave(files_in)
 
                 opt_list += ["opt.slice_timing.flag_skip=true"]
 
@@ -528,14 +777,6 @@ class FmriPreprocessBids(BaseBids):
 
         return opt_list
 
-def run_worker(dir, num):
-    cmd = ['psom_worker.py', '-d', dir, '-w', str(num)]
-    while not os.path.exists("{0}/logs/tmp/".format(dir)):
-        # sleep long enough to be last on the race condition TODO (FIND A BETTER WAY TO DO THAT)
-        time.sleep(5)
-    return subprocess.Popen(cmd)
-
-
 def bids_validator(path, ignore_warnings=False, ignore_nifti_headers=False):
     """ Runs bids validator on path is one is installed on the machines
 
@@ -623,6 +864,11 @@ def unroll_numbers(numbers):
 
     def unroll_string(number, unrolled):
         entries = [a[0].split('-') for a in re.findall("([0-9]+((-[0-9]+)+)?)", number)]
+        if re.sub("[-0-9,\\s]", "", number):
+            # Subjects are selected by number in niak
+            kept = ["-".join(e) for e in entries]
+            log.warning("Participant label {0} is not numeric, {1}"
+                        .format(number, "only {0} is used".format(", ".join(kept)) if kept else "it is ignored"))
         for elem in entries:
             if len(elem) == 1:
                 unrolled.append(int(elem[0]))
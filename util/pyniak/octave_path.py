@@ -0,0 +1,139 @@
+"""
+Precomputed octave search path for niak.
+
+addpath(genpath(NIAK_ROOT)) walks the whole niak tree, html assets and
+templates included, every time octave starts. This module does that walk
+once, keeps only the directories that hold octave code, and writes them in
+a single addpath call that octave can source at startup.
+"""
+
+import logging
+import os
+import re
+import subprocess
+import time
+
+
+log = logging.getLogger(__file__)
+
+NIAK_ROOT = os.getenv("NIAK_ROOT", "/usr/local/niak")
+PATH_FILE = "niak_path.m"
+# Relative to the niak root, never added to the search path. The demos are
+# needed by extensions/niak_test only, add them by hand to run the tests
+EXCLUDED_DIRS = re.compile("^(demos|template|util|reports/[^/]+/templates)(/|$)")
+CODE_FILE = re.compile(r"\.(m|oct|mex[a-z0-9]*)$")
+VERSION_REGEX = re.compile(r"GB_NIAK\.version\s*=\s*'([^']*)'")
+HEADER = "% niak search path, generated by pyniak.octave_path for niak {0}"
+
+
+def niak_version(root=NIAK_ROOT):
+    """
+    :return: the niak version found in niak_gb_vars.m, 'unknown' otherwise
+    """
+    try:
+        with open(os.path.join(root, "commands", "misc", "niak_gb_vars.m")) as fp:
+            m = VERSION_REGEX.search(fp.read())
+    except IOError:
+        m = None
+    return m.group(1) if m else "unknown"
+
+
+def genpath_skip(name):
+    """
+    Same rules as octave genpath
+    """
+    return name.startswith(('.', '@', '+')) or name == 'private'
+
+
+def search_path(root=NIAK_ROOT):
+    """
+    :param root: the niak root
+    :return: the directories of root that hold octave code, in genpath order
+    """
+    root = os.path.abspath(root)
+    path = []
+    for dir_path, dir_names, file_names in os.walk(root):
+        rel_path = os.path.relpath(dir_path, root).replace(os.sep, '/')
+        dir_names[:] = sorted(d for d in dir_names
+                              if not genpath_skip(d)
+                              and not EXCLUDED_DIRS.match(d if rel_path == '.' else "{0}/{1}".format(rel_path, d)))
+        if any(CODE_FILE.search(f) for f in file_names):
+            path.append(dir_path)
+    return path
+
+
+def write_path_file(path_file, root=NIAK_ROOT):
+    """
+    Write the niak search path in an octave script
+
+    :param path_file: the octave script, to be sourced at startup
+    :param root: the niak root
+    :return: the number of directories in the search path
+    """
+    path = search_path(root)
+    with open(path_file, 'w') as fp:
+        fp.write(HEADER.format(niak_version(root)) + "\n")
+        fp.write("addpath('{0}');\n".format(os.pathsep.join(p.replace("'", "''") for p in path)))
+    log.info("{0} directories in {1}".format(len(path), path_file))
+    return len(path)
+
+
+def path_file(root=NIAK_ROOT, folder=None):
+    """
+    :param root: the niak root
+    :param folder: where the path file is stored, default root
+    :return: the path file, written only if missing or from another niak version
+    """
+    folder = folder or root
+    p_file = os.path.join(folder, PATH_FILE)
+    try:
+        with open(p_file) as fp:
+            up_to_date = fp.readline().strip() == HEADER.format(niak_version(root))
+    except IOError:
+        up_to_date = False
+    if not up_to_date:
+        write_path_file(p_file, root)
+    return p_file
+
+
+def benchmark(root=NIAK_ROOT, p_file=None, repeat=3):
+    """
+    Time the octave startup with genpath and with the path file
+
+    :return: {'genpath': seconds, 'path_file': seconds}, best of repeat
+    """
+    p_file = p_file or path_file(root)
+    setups = {"genpath": "addpath(genpath('{0}'));".format(root),
+              "path_file": "source('{0}');".format(p_file)}
+    timing = {}
+    for name, setup in setups.items():
+        runs = []
+        for _ in range(repeat):
+            start = time.time()
+            subprocess.check_call(["octave", "--norc", "--no-gui", "--quiet", "--eval",
+                                   "{0} which('niak_gb_vars');".format(setup)])
+            runs.append(time.time() - start)
+        timing[name] = min(runs)
+    return timing
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description="Write the niak octave search path in a file")
+    parser.add_argument("root", nargs='?', default=NIAK_ROOT, help="The niak root")
+    parser.add_argument("--output", default=None, help="The path file, default ROOT/{0}".format(PATH_FILE))
+    parser.add_argument("--benchmark", action="store_true",
+                        help="Compare octave startup time with genpath and with the path file")
+    parsed = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    if parsed.output:
+        write_path_file(parsed.output, parsed.root)
+        output = parsed.output
+    else:
+        output = path_file(parsed.root)
+
+    if parsed.benchmark:
+        timing = benchmark(parsed.root, output)
+        print("octave startup, genpath: {0:.2f} s, path file: {1:.2f} s"
+              .format(timing["genpath"], timing["path_file"]))
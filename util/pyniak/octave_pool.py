@@ -0,0 +1,419 @@
+"""
+A pool of warm octave interpreters.
+
+Starting octave and walking the niak search path costs more than the job
+itself for fine grained pipelines. The interpreters of the pool are started
+once, fed through their stdin, and recycled after a number of jobs to bound
+their memory. A pool can be served on a unix socket, util/bin/niak_octave is
+then a drop in replacement for "octave --eval" that runs the command in the
+pool.
+
+Between two jobs, an interpreter is brought back to the state it had after
+its startup: variables and globals are cleared, and the working directory,
+the search path, the warning state and the environment are restored. The
+rand and randn generators are seeded again from the clock, like in a new
+octave. Loaded functions, including their persistent variables, and the
+state of the other random generators (rande, randg, randp) are kept.
+"""
+
+import errno
+import json
+import logging
+import os
+import re
+import select
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+import uuid
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+try:
+    import socketserver
+except ImportError:
+    import SocketServer as socketserver
+
+
+log = logging.getLogger(__file__)
+
+OCTAVE_CMD = ["/usr/bin/env", "octave", "--no-gui", "--quiet", "--no-history"]
+# The socket used by niak_octave to reach the pool
+POOL_SOCKET_ENV = "NIAK_OCTAVE_POOL"
+# Jobs run by an interpreter before it is replaced
+MAX_JOBS = 50
+# Time (s) given to an interpreter to answer a health check
+PING_TIMEOUT = 30
+END_TAG = "<<niak_octave_pool:{0}:"
+END_REGEX = "<<niak_octave_pool:{0}:(-?[0-9]+)>>"
+# A trailing exit of the command, as psom ends the --eval string of its jobs
+EXIT_REGEX = re.compile(r"[,;\s]*\b(exit|quit)\s*(\(\s*0?\s*\))?[,;\s]*$")
+
+
+def octave_string(s):
+    return "'{0}'".format(s.replace("'", "''"))
+
+
+def strip_exit(cmd):
+    """
+    :param cmd: the octave code of a job
+    :return: cmd without a trailing exit or quit with a success status, which would
+             kill the interpreter of the pool. Other exit status are left alone.
+    """
+    return EXIT_REGEX.sub("", cmd)
+
+
+class OctaveInterpreter(object):
+    """
+    One octave process, fed through its stdin
+    """
+
+    def __init__(self, octave_cmd=None, startup=None):
+        """
+        :param octave_cmd: the command that starts octave
+        :param startup: list of octave commands run once, after octave starts
+        """
+        self.octave_cmd = octave_cmd or OCTAVE_CMD
+        self.n_jobs = 0
+        self._buffer = ""
+        self.cwd = os.getcwd()
+        self.env = dict(os.environ)
+        # The state restored after each job, see the module doc
+        self._state_file = None
+        self.process = subprocess.Popen(self.octave_cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                        stderr=subprocess.STDOUT)
+        fd, state_file = tempfile.mkstemp(prefix='niak_pool_state_', suffix='.mat')
+        os.close(fd)
+        save_state = ("niak_pool_path = path();\n"
+                      "niak_pool_warning = warning();\n"
+                      "save('-binary', {0}, 'niak_pool_path', 'niak_pool_warning')"
+                      .format(octave_string(state_file)))
+        status, output = self.execute(";\n".join((startup or []) + [save_state]))
+        self._state_file = state_file
+        if status:
+            self.close()
+            raise RuntimeError("Octave startup failed:\n{0}".format(output))
+        # Startup does not count in the jobs of the interpreter
+        self.n_jobs = 0
+
+    @property
+    def alive(self):
+        return self.process.poll() is None
+
+    def _read_until(self, regex, timeout=None):
+        """
+        :return: (status, output), status is None on timeout, and the exit code
+                 of octave if it died before printing the end tag
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        fd = self.process.stdout.fileno()
+        while True:
+            m = regex.search(self._buffer)
+            if m:
+                output = self._buffer[:m.start()]
+                self._buffer = self._buffer[m.end():].lstrip("\n")
+                return int(m.group(1)), output
+            wait = None if deadline is None else max(0, deadline - time.time())
+            ready, _, _ = select.select([fd], [], [], wait)
+            if not ready:
+                return None, self._buffer
+            chunk = os.read(fd, 65536)
+            if not chunk:
+                output, self._buffer = self._buffer, ""
+                return self.process.wait(), output
+            self._buffer += chunk.decode("utf-8", "replace")
+
+    def _env_cmd(self, env):
+        """
+        :param env: the environment of a job
+        :return: octave code switching from the environment of the interpreter to env, and back
+        """
+        # Octave strings can not hold a new line, those variables are left alone
+        env = dict((k, v) for k, v in env.items() if "\n" not in v)
+        own = dict((k, v) for k, v in self.env.items() if "\n" not in v)
+        enter = []
+        leave = []
+        for k, v in env.items():
+            if self.env.get(k) != v:
+                enter.append("setenv({0}, {1});".format(octave_string(k), octave_string(v)))
+                if k in self.env:
+                    leave.append("setenv({0}, {1});".format(octave_string(k), octave_string(self.env[k])))
+                else:
+                    leave.append("unsetenv({0});".format(octave_string(k)))
+        for k in own:
+            if k not in env:
+                enter.append("unsetenv({0});".format(octave_string(k)))
+                leave.append("setenv({0}, {1});".format(octave_string(k), octave_string(self.env[k])))
+        return "\n".join(enter), "\n".join(leave)
+
+    def execute(self, cmd, timeout=None, cwd=None, env=None):
+        """
+        Run octave code in the interpreter, which is then reset, see the module doc.
+
+        :param cmd: octave code
+        :param timeout: seconds, None waits for the end of the job
+        :param cwd: the working directory of the job, by default the one of the interpreter
+        :param env: dict, the environment of the job, by default the one of the interpreter
+        :return: (status, output) status is 0 on success, 1 if cmd raised an
+                 error, None on timeout
+        """
+        token = uuid.uuid4().hex
+        enter, leave = self._env_cmd(env) if env is not None else ("", "")
+        if cwd is not None:
+            enter += "\ncd({0});".format(octave_string(cwd))
+        reset = "cd({0});\n{1}".format(octave_string(self.cwd), leave)
+        if self._state_file is not None:
+            reset += ("\nload({0});\n"
+                      "path(niak_pool_path);\n"
+                      "warning(niak_pool_warning);\n"
+                      "rand('state', sum(100*clock));\n"
+                      "randn('state', sum(100*clock));").format(octave_string(self._state_file))
+        script = None
+        if "\n" in cmd:
+            script = tempfile.NamedTemporaryFile('w', prefix='niak_pool_', suffix='.m', delete=False)
+            script.write(cmd)
+            script.close()
+            job = "source({0});".format(octave_string(script.name))
+        else:
+            job = "eval({0});".format(octave_string(cmd))
+        wrapped = ("niak_pool_status = 0;\n"
+                   "try\n{2}\n{0}\n"
+                   "catch niak_pool_err\n"
+                   "  fprintf(2, '%s\\n', niak_pool_err.message);\n"
+                   "  niak_pool_status = 1;\n"
+                   "end\n"
+                   "clear -exclusive niak_pool_status\n"
+                   "clear -global\n"
+                   "try\n{3}\nend\n"
+                   "clear -exclusive niak_pool_status\n"
+                   "fflush(stderr);\n"
+                   "fprintf('\\n{1}%d>>\\n', niak_pool_status);\n"
+                   "fflush(stdout);\n"
+                   "clear -variables\n").format(job, END_TAG.format(token), enter, reset)
+        self.n_jobs += 1
+        try:
+            self.process.stdin.write(wrapped.encode("utf-8"))
+            self.process.stdin.flush()
+            return self._read_until(re.compile(END_REGEX.format(token)), timeout=timeout)
+        except (IOError, OSError) as e:
+            if e.errno != errno.EPIPE:
+                raise
+            return self.process.wait(), ""
+        finally:
+            if script is not None:
+                os.remove(script.name)
+
+    def ping(self, timeout=PING_TIMEOUT):
+        """
+        :return: True if the interpreter answers in time
+        """
+        if not self.alive:
+            return False
+        status, _ = self.execute("1;", timeout=timeout)
+        self.n_jobs -= 1
+        return status == 0
+
+    def kill(self):
+        if self.alive:
+            self.process.kill()
+        self.process.wait()
+
+    def close(self):
+        if self.alive:
+            try:
+                self.process.stdin.write(b"exit\n")
+                self.process.stdin.flush()
+                self.process.wait()
+            except (IOError, OSError):
+                self.kill()
+        if self._state_file is not None and os.path.exists(self._state_file):
+            os.remove(self._state_file)
+
+
+class OctavePool(object):
+    """
+    A fixed number of interpreters, lent one job at a time
+    """
+
+    def __init__(self, size=1, max_jobs=MAX_JOBS, octave_cmd=None, startup=None):
+        """
+        :param size: number of interpreters
+        :param max_jobs: an interpreter is replaced after that many jobs
+        :param octave_cmd: the command that starts octave
+        :param startup: list of octave commands run when an interpreter starts
+        """
+        self.size = size
+        self.max_jobs = max_jobs
+        self.octave_cmd = octave_cmd
+        self.startup = startup
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        errors = []
+
+        def start():
+            try:
+                self._idle.put(self._new())
+            except Exception as e:
+                errors.append(e)
+
+        # Interpreters are started in parallel, they are slow to boot
+        starters = [threading.Thread(target=start) for _ in range(size)]
+        for t in starters:
+            t.start()
+        for t in starters:
+            t.join()
+        if errors:
+            while not self._idle.empty():
+                self._idle.get().close()
+            raise errors[0]
+
+    def _new(self):
+        return OctaveInterpreter(octave_cmd=self.octave_cmd, startup=self.startup)
+
+    def _checked(self, interpreter):
+        """
+        :return: interpreter, or a fresh one if it is worn out or unhealthy
+        """
+        if interpreter.n_jobs >= self.max_jobs:
+            log.info("Recycling octave interpreter {0} after {1} jobs"
+                     .format(interpreter.process.pid, interpreter.n_jobs))
+            interpreter.close()
+            interpreter = self._new()
+        elif not interpreter.ping():
+            log.warning("Octave interpreter {0} is not responding, replacing it".format(interpreter.process.pid))
+            interpreter.kill()
+            interpreter = self._new()
+        return interpreter
+
+    def _replace(self, interpreter):
+        """
+        Give back interpreter to the pool, or a new one if it died. If the new one does not
+        start, the pool shrinks instead of waiting for it forever.
+        """
+        if not interpreter.alive:
+            try:
+                interpreter = self._new()
+            except Exception as e:
+                with self._lock:
+                    self.size -= 1
+                log.error("Could not start an octave interpreter, {0} left in the pool: {1}".format(self.size, e))
+                return
+        self._idle.put(interpreter)
+
+    def execute(self, cmd, timeout=None, cwd=None, env=None):
+        """
+        Run cmd in the first available interpreter, see OctaveInterpreter.execute
+        """
+        if not self.size:
+            raise RuntimeError("The octave pool has no interpreter left")
+        interpreter = self._idle.get()
+        try:
+            interpreter = self._checked(interpreter)
+        except Exception:
+            interpreter.kill()
+            self._replace(interpreter)
+            raise
+        try:
+            status, output = interpreter.execute(cmd, timeout=timeout, cwd=cwd, env=env)
+            if status is None:
+                # The job is still running, this interpreter can not be reused
+                interpreter.kill()
+            return status, output
+        finally:
+            self._replace(interpreter)
+
+    def close(self):
+        for _ in range(self.size):
+            self._idle.get().close()
+
+
+class _PoolHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        request = json.loads(self.rfile.readline().decode("utf-8"))
+        status, output = self.server.pool.execute(request["cmd"], cwd=request.get("cwd"), env=request.get("env"))
+        if status is None:
+            status = 1
+        answer = {"status": status, "output": output}
+        self.wfile.write(json.dumps(answer).encode("utf-8") + b"\n")
+
+
+class OctavePoolServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    Serve an OctavePool on a unix socket, one json request per connection
+    """
+    daemon_threads = True
+
+    def __init__(self, socket_path, pool):
+        self.pool = pool
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        socketserver.UnixStreamServer.__init__(self, socket_path, _PoolHandler)
+
+    def start(self):
+        """
+        Serve in a background thread
+        """
+        t = threading.Thread(target=self.serve_forever)
+        t.daemon = True
+        t.start()
+        return t
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        self.pool.close()
+        try:
+            os.remove(self.server_address)
+        except OSError:
+            pass
+
+
+def run_in_pool(cmd, socket_path=None):
+    """
+    Run cmd in the pool listening on socket_path, in the working directory and
+    environment of the caller
+
+    :return: (status, output), or None if no pool is listening
+    """
+    socket_path = socket_path or os.getenv(POOL_SOCKET_ENV)
+    if not socket_path or not os.path.exists(socket_path):
+        return None
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.connect(socket_path)
+    except socket.error:
+        return None
+    try:
+        client.sendall(json.dumps({"cmd": cmd, "cwd": os.getcwd(), "env": dict(os.environ)}).encode("utf-8") + b"\n")
+        answer = client.makefile("rb").readline()
+    finally:
+        client.close()
+    answer = json.loads(answer.decode("utf-8"))
+    return answer["status"], answer["output"]
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description="Serve a pool of octave interpreters on a unix socket")
+    parser.add_argument("socket", help="Path of the unix socket")
+    parser.add_argument("-n", "--size", type=int, default=1, help="Number of interpreters")
+    parser.add_argument("--max_jobs", type=int, default=MAX_JOBS,
+                        help="Number of jobs after which an interpreter is replaced")
+    parsed = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    server = OctavePoolServer(parsed.socket, OctavePool(size=parsed.size, max_jobs=parsed.max_jobs))
+    log.info("Octave pool of {0} interpreters listening on {1}".format(parsed.size, parsed.socket))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.pool.close()
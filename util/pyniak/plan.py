@@ -0,0 +1,191 @@
+"""
+Dry run of a pipeline: job graph, estimated run time and output size.
+
+The pipeline is built by octave with opt.flag_test = true and described by
+niak_plan_pipeline in a json file. This module adds the dependencies of
+each job and, when a previous run is available, estimates per stage the
+run time and the bytes written from the jobs of that run.
+"""
+
+import collections
+import json
+import logging
+import os
+import re
+
+
+log = logging.getLogger(__file__)
+
+# Job name tokens that are specific to a subject, session or run
+INSTANCE_TOKEN = re.compile("^(sub|subject|ses|sess|session|run)[-a-zA-Z]*[0-9]", re.IGNORECASE)
+
+
+def octave_string(s):
+    return "'{0}'".format(s.replace("'", "''"))
+
+
+def octave_script(pipeline_name, file_plan, path_history=""):
+    """
+    :return: octave commands that build the pipeline in test mode and save its plan,
+             to run after files_in and opt are set
+    """
+    return ["opt.flag_test = true",
+            "pipeline = {0}(files_in, opt)".format(pipeline_name),
+            "niak_plan_pipeline(pipeline, {0}, {1})".format(octave_string(file_plan),
+                                                            octave_string(path_history or ""))]
+
+
+def as_list(value):
+    """
+    savejson writes cells of one string as a string, and empty cells as null
+    """
+    if value is None:
+        return []
+    if isinstance(value, list):
+        return value
+    return [value]
+
+
+def stage_name(job_name):
+    """
+    :param job_name: like slice_timing_sub0275_sess1_taskrestrun01
+    :return: the name without the subject specific part, like slice_timing
+    """
+    tokens = job_name.split('_')
+    for num, token in enumerate(tokens):
+        if num and INSTANCE_TOKEN.match(token):
+            return '_'.join(tokens[:num])
+    return job_name
+
+
+def dependencies(jobs):
+    """
+    :param jobs: list of dict with name, files_in and files_out
+    :return: {job name: sorted list of the jobs it depends on}
+    """
+    producer = {}
+    for job in jobs:
+        for f in as_list(job.get("files_out")):
+            producer[f] = job["name"]
+    deps = {}
+    for job in jobs:
+        deps[job["name"]] = sorted(set(producer[f] for f in as_list(job.get("files_in"))
+                                       if f in producer and producer[f] != job["name"]))
+    return deps
+
+
+def stage_history(history):
+    """
+    :param history: the jobs of a previous run, see niak_plan_pipeline
+    :return: {stage: {'time': mean seconds or None, 'bytes': mean bytes or None}}
+    """
+    times = collections.defaultdict(list)
+    sizes = collections.defaultdict(list)
+    for job in history:
+        stage = stage_name(job["name"])
+        if job.get("elapsed_time", -1) >= 0:
+            times[stage].append(float(job["elapsed_time"]))
+        # The outputs of participant runs are gone from their working folder, their
+        # size was measured when the run finished
+        if job.get("bytes_out", -1) >= 0:
+            sizes[stage].append(float(job["bytes_out"]))
+            continue
+        files_out = [f for f in as_list(job.get("files_out")) if os.path.isfile(f)]
+        if files_out:
+            sizes[stage].append(sum(os.path.getsize(f) for f in files_out))
+
+    def mean(values):
+        return sum(values) / len(values) if values else None
+
+    return dict((stage, {"time": mean(times[stage]), "bytes": mean(sizes[stage])})
+                for stage in set(times) | set(sizes))
+
+
+def critical_path(jobs, deps, cost):
+    """
+    :return: the run time of the longest chain of dependent jobs
+    """
+    finish = {}
+
+    def finish_time(name):
+        if name not in finish:
+            finish[name] = None
+            finish[name] = cost(name) + max([finish_time(d) for d in deps[name]] or [0])
+        return finish[name]
+
+    return max([finish_time(job["name"]) for job in jobs] or [0])
+
+
+def summarize(plan, n_thread=1):
+    """
+    :param plan: the content of the json file written by niak_plan_pipeline
+    :param n_thread: number of jobs running at the same time
+    :return: the plan with the dependencies of each job and a summary, per stage and total
+    """
+    jobs = as_list(plan.get("jobs"))
+    history = stage_history(as_list(plan.get("history")))
+    deps = dependencies(jobs)
+
+    stages = collections.OrderedDict()
+    for job in jobs:
+        job["files_in"] = as_list(job.get("files_in"))
+        job["files_out"] = as_list(job.get("files_out"))
+        job["dependencies"] = deps[job["name"]]
+        stage = stages.setdefault(stage_name(job["name"]), {"jobs": 0, "time": None, "bytes": None})
+        stage["jobs"] += 1
+        known = history.get(stage_name(job["name"]), {})
+        for k in ("time", "bytes"):
+            if known.get(k) is not None:
+                stage[k] = (stage[k] or 0) + known[k]
+
+    def cost(name):
+        return history.get(stage_name(name), {}).get("time") or 0
+
+    cpu_time = sum(s["time"] or 0 for s in stages.values())
+    plan["summary"] = {"jobs": len(jobs),
+                       "stages": stages,
+                       "cpu_time": cpu_time,
+                       "wall_time": max(critical_path(jobs, deps, cost), cpu_time / max(1, int(n_thread))),
+                       "bytes": sum(s["bytes"] or 0 for s in stages.values()),
+                       "unknown_stages": sorted(k for k, s in stages.items() if s["time"] is None)}
+    return plan
+
+
+def human_size(n_bytes):
+    for unit in ("B", "KB", "MB", "GB"):
+        if n_bytes < 1024:
+            return "{0:.1f} {1}".format(n_bytes, unit)
+        n_bytes /= 1024.
+    return "{0:.1f} TB".format(n_bytes)
+
+
+def report(plan):
+    """
+    :return: a printable table of the summary of plan
+    """
+    summary = plan["summary"]
+    lines = ["{0:<40} {1:>6} {2:>12} {3:>12}".format("stage", "jobs", "time (s)", "output")]
+    for name, stage in summary["stages"].items():
+        lines.append("{0:<40} {1:>6} {2:>12} {3:>12}".format(
+            name, stage["jobs"],
+            "?" if stage["time"] is None else "{0:.0f}".format(stage["time"]),
+            "?" if stage["bytes"] is None else human_size(stage["bytes"])))
+    lines.append("{0} jobs, {1:.0f} s of cpu, about {2:.0f} s of wall time, {3} written"
+                 .format(summary["jobs"], summary["cpu_time"], summary["wall_time"],
+                         human_size(summary["bytes"])))
+    if summary["unknown_stages"]:
+        lines.append("No history for: {0}".format(", ".join(summary["unknown_stages"])))
+    return "\n".join(lines)
+
+
+def finalize(file_plan, n_thread=1):
+    """
+    Add the dependencies and the summary to the json file written by octave
+
+    :return: the summary, as printable text
+    """
+    with open(file_plan) as fp:
+        plan = summarize(json.load(fp), n_thread=n_thread)
+    with open(file_plan, 'w') as fp:
+        json.dump(plan, fp, indent=2)
+    return report(plan)
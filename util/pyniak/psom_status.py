@@ -0,0 +1,287 @@
+"""
+Merge the PSOM logs of participant runs in the logs of the final folder.
+
+Each participant run drops its logs as a shard in logs/status.d, without
+any lock, and the group run merges all the shards in one pass before psom
+reads PIPE_status.mat. PIPE_status.mat and PIPE_jobs.mat are read and
+written with scipy.io, in the process, instead of starting octave. They are
+locked for the whole read-merge-write, and replaced with an atomic rename.
+"""
+
+import contextlib
+import fcntl
+import logging
+import os
+import shutil
+
+try:
+    import scipy.io
+    scipy_loaded = True
+except ImportError:
+    scipy_loaded = False
+
+
+log = logging.getLogger(__file__)
+
+STATUS_FILE = "PIPE_status.mat"
+JOBS_FILE = "PIPE_jobs.mat"
+# Run times of the jobs, read by niak_plan_pipeline
+PROFILE_FILE = "PIPE_profile.mat"
+# Bytes written by the jobs, read by niak_plan_pipeline. They are measured when
+# the shard of a participant run is written, its working folder is removed next
+SIZES_FILE = "PIPE_sizes.mat"
+MAT_HEADER = b"MATLAB 5.0 MAT-file"
+# Fields written by loadmat, not variables of the file
+MAT_META = ('__header__', '__version__', '__globals__')
+
+
+class UnsupportedFormat(Exception):
+    pass
+
+
+@contextlib.contextmanager
+def locked(path):
+    """
+    Hold an exclusive lock on path.lock, fcntl locks also work over NFS
+    """
+    with open("{0}.lock".format(path), 'a') as fp:
+        fcntl.lockf(fp, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.lockf(fp, fcntl.LOCK_UN)
+
+
+def is_mat5(path):
+    """
+    :return: True if path is a MAT file version 5 to 7.2, the ones scipy.io can write.
+             Octave text files and v7.3 (HDF5) files are not.
+    """
+    with open(path, 'rb') as fp:
+        return fp.read(len(MAT_HEADER)) == MAT_HEADER
+
+
+def load(path):
+    if not is_mat5(path):
+        raise UnsupportedFormat("{0} is not a MAT file scipy can update".format(path))
+    variables = scipy.io.loadmat(path)
+    for k in MAT_META:
+        variables.pop(k, None)
+    return variables
+
+
+def save(path, variables):
+    tmp = "{0}.{1}.tmp".format(path, os.getpid())
+    try:
+        scipy.io.savemat(tmp, variables, do_compression=True, long_field_names=True, oned_as='row')
+        os.rename(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def mat_strings(value):
+    """
+    :param value: a variable loaded by scipy.io.loadmat
+    :return: the list of all the strings in value, nested in structs and cells
+    """
+    if isinstance(value, str):
+        return [value] if value else []
+    if not hasattr(value, 'dtype'):
+        return []
+    if value.dtype.names:
+        return [s for v in value.flat for name in value.dtype.names for s in mat_strings(v[name])]
+    if value.dtype.kind == 'O':
+        return [s for v in value.flat for s in mat_strings(v)]
+    if value.dtype.kind == 'U':
+        return [s for s in (str(v).rstrip() for v in value.flat) if s]
+    return []
+
+
+def finished_files_out(status, jobs):
+    """
+    :param status: the variables of PIPE_status.mat
+    :param jobs: the variables of PIPE_jobs.mat
+    :return: {job name: list of its files_out} for the finished jobs
+    """
+    files = {}
+    for name, value in status.items():
+        if mat_strings(value) != ['finished'] or name not in jobs:
+            continue
+        job = jobs[name]
+        if job.dtype.names and 'files_out' in job.dtype.names:
+            files[name] = mat_strings(job['files_out'])
+    return files
+
+
+def output_sizes(src, dest):
+    """
+    :param src: a pipeline folder
+    :param dest: the folder its outputs are shipped to
+    :return: {job name: bytes} for the finished jobs of src/logs. An output that is
+             not in src anymore is looked for at the same place in dest.
+    """
+    logs = os.path.join(src, "logs")
+    status = load(os.path.join(logs, STATUS_FILE))
+    jobs = load(os.path.join(logs, JOBS_FILE))
+    root = os.path.normpath(src)
+    sizes = {}
+    for name, files in finished_files_out(status, jobs).items():
+        size = 0
+        for f in files:
+            if not os.path.isfile(f) and os.path.normpath(f).startswith(root + os.sep):
+                f = os.path.join(dest, os.path.relpath(f, root))
+            if os.path.isfile(f):
+                size += os.path.getsize(f)
+        sizes[name] = float(size)
+    return sizes
+
+
+def finished(src):
+    """
+    :param src: a pipeline folder
+    :return: True if all the jobs of src/logs are finished, False if one is not,
+             None if the status can not be read
+    """
+    status_file = os.path.join(src, "logs", STATUS_FILE)
+    if not scipy_loaded or not os.path.exists(status_file):
+        return None
+    try:
+        status = load(status_file)
+    except (UnsupportedFormat, IOError, ValueError):
+        return None
+    for value in status.values():
+        if hasattr(value, 'flat'):
+            value = value.flat[0] if value.size else ''
+        if value != 'finished':
+            return False
+    return True
+
+
+# Participant runs drop their logs here, the group run compacts them
+SHARD_DIR = "status.d"
+SHARD_STATUS = "_status.mat"
+SHARD_JOBS = "_jobs.mat"
+SHARD_PROFILE = "_profile.mat"
+SHARD_SIZES = "_sizes.mat"
+
+
+def write_shard(src, dest, name=None):
+    """
+    Save the status, jobs and profile of the pipeline in src/logs as one shard of dest/logs,
+    with the size of the outputs of the finished jobs, see output_sizes.
+    Each participant writes its own files, there is no lock to wait for.
+
+    :param src: the participant working folder
+    :param dest: the final folder
+    :param name: a name unique to the participant run, default the name of src
+    """
+    name = name or os.path.basename(os.path.normpath(src))
+    shard_dir = os.path.join(dest, "logs", SHARD_DIR)
+    try:
+        os.makedirs(shard_dir)
+    except OSError:
+        pass
+    # The profile and sizes are written first, a shard is complete once its status is there
+    if scipy_loaded:
+        try:
+            sizes = output_sizes(src, dest)
+        except (UnsupportedFormat, IOError, OSError, ValueError) as e:
+            log.warning("Could not measure the outputs of {0}: {1}".format(src, e))
+            sizes = {}
+        if sizes:
+            save(os.path.join(shard_dir, name + SHARD_SIZES), sizes)
+    for log_file, suffix in ((PROFILE_FILE, SHARD_PROFILE), (JOBS_FILE, SHARD_JOBS), (STATUS_FILE, SHARD_STATUS)):
+        if log_file == PROFILE_FILE and not os.path.exists(os.path.join(src, "logs", log_file)):
+            continue
+        shard = os.path.join(shard_dir, name + suffix)
+        tmp = "{0}.tmp".format(shard)
+        shutil.copyfile(os.path.join(src, "logs", log_file), tmp)
+        os.rename(tmp, shard)
+
+
+def shards(dest):
+    """
+    :return: list of (status shard, jobs shard) in dest/logs, oldest first
+    """
+    shard_dir = os.path.join(dest, "logs", SHARD_DIR)
+    try:
+        names = [f[:-len(SHARD_STATUS)] for f in os.listdir(shard_dir) if f.endswith(SHARD_STATUS)]
+    except OSError:
+        return []
+    pairs = [(os.path.join(shard_dir, n + SHARD_STATUS), os.path.join(shard_dir, n + SHARD_JOBS))
+             for n in names]
+    pairs = [p for p in pairs if os.path.exists(p[1])]
+    return sorted(pairs, key=lambda p: os.path.getmtime(p[0]))
+
+
+def profile_shard(status_shard):
+    """
+    :return: the profile shard of the same participant run as status_shard, None if there is none
+    """
+    profile = status_shard[:-len(SHARD_STATUS)] + SHARD_PROFILE
+    return profile if os.path.exists(profile) else None
+
+
+def sizes_shard(status_shard):
+    """
+    :return: the sizes shard of the same participant run as status_shard, None if there is none
+    """
+    sizes = status_shard[:-len(SHARD_STATUS)] + SHARD_SIZES
+    return sizes if os.path.exists(sizes) else None
+
+
+def remove_shards(pairs):
+    for pair in pairs:
+        for f in pair + (profile_shard(pair[0]), sizes_shard(pair[0])):
+            if f is not None:
+                os.remove(f)
+
+
+def compact(dest):
+    """
+    Merge all the shards of dest/logs in its PIPE_status.mat, PIPE_jobs.mat,
+    PIPE_profile.mat and PIPE_sizes.mat, then remove them. Group level jobs of the shards are marked as 'none'.
+
+    :return: the number of merged shards
+    :raise UnsupportedFormat: if scipy is missing or a file is not a MAT v5-v7 file
+    """
+    if not scipy_loaded:
+        raise UnsupportedFormat("scipy is not installed")
+    dest_logs = os.path.join(dest, "logs")
+    status_file = os.path.join(dest_logs, STATUS_FILE)
+    jobs_file = os.path.join(dest_logs, JOBS_FILE)
+    with locked(status_file), locked(jobs_file):
+        pairs = shards(dest)
+        if not pairs:
+            return 0
+        status = load(status_file) if os.path.exists(status_file) else {}
+        jobs = load(jobs_file) if os.path.exists(jobs_file) else {}
+        profile_file = os.path.join(dest_logs, PROFILE_FILE)
+        profile = None
+        sizes_file = os.path.join(dest_logs, SIZES_FILE)
+        sizes = None
+        for status_shard, jobs_shard in pairs:
+            new = load(status_shard)
+            for k in new:
+                if 'group' in k:
+                    new[k] = 'none'
+            status.update(new)
+            jobs.update(load(jobs_shard))
+            if profile_shard(status_shard) is not None:
+                if profile is None:
+                    profile = load(profile_file) if os.path.exists(profile_file) else {}
+                profile.update(load(profile_shard(status_shard)))
+            if sizes_shard(status_shard) is not None:
+                if sizes is None:
+                    sizes = load(sizes_file) if os.path.exists(sizes_file) else {}
+                sizes.update(load(sizes_shard(status_shard)))
+        if profile is not None:
+            save(profile_file, profile)
+        if sizes is not None:
+            save(sizes_file, sizes)
+        save(jobs_file, jobs)
+        save(status_file, status)
+        remove_shards(pairs)
+    log.info("{0} participant logs merged in {1}".format(len(pairs), dest_logs))
+    return len(pairs)
@@ -0,0 +1,164 @@
+"""
+Split the subjects of a BIDS dataset in shards of similar work.
+
+The work of a subject is estimated as the number of fmri volumes it has,
+summed over its runs, read from the nifti headers. Subjects are assigned,
+heaviest first, to the lightest shard, so a large dataset is spread evenly
+over the nodes instead of being split by ranges of subject labels.
+"""
+
+import gzip
+import heapq
+import json
+import logging
+import os
+import re
+import struct
+
+from pyniak import bids
+
+
+log = logging.getLogger(__file__)
+
+NIFTI_HEADER_SIZE = 348
+# dim[8] is at that offset of a nifti-1 header, dim[4] is the number of volumes
+NIFTI_DIM_OFFSET = 40
+SHARD_REGEX = re.compile(r"^\s*([0-9]+)\s*/\s*([0-9]+)\s*$")
+SHARD_FILE = "shards.json"
+
+
+def n_volumes(path):
+    """
+    :param path: a nifti-1 file, gzipped or not
+    :return: the number of volumes, None if the header can not be read, as for minc files
+    """
+    opener = gzip.open if path.endswith(".gz") else open
+    try:
+        with opener(path, 'rb') as fp:
+            header = fp.read(NIFTI_HEADER_SIZE)
+    except (IOError, OSError):
+        return None
+    if len(header) < NIFTI_HEADER_SIZE:
+        return None
+    for endian in ('<', '>'):
+        if struct.unpack(endian + 'i', header[:4])[0] == NIFTI_HEADER_SIZE:
+            dim = struct.unpack(endian + '8h', header[NIFTI_DIM_OFFSET:NIFTI_DIM_OFFSET + 16])
+            return max(1, dim[4]) if dim[0] >= 4 else 1
+    return None
+
+
+def runs(subject_files):
+    """
+    :param subject_files: the files_in entry of one subject, see bids.BidsIndex.grab
+    :return: the list of its fmri runs
+    """
+    return [f for session in subject_files["fmri"].values() for f in session.values()]
+
+
+def subject_costs(files_in):
+    """
+    :param files_in: the output of bids.grab_bids
+    :return: {subject label: number of volumes}. Runs with an unreadable header
+             count as many volumes as the average readable run
+    """
+    volumes = dict((sub, [n_volumes(f) for f in runs(files)]) for sub, files in files_in.items())
+    known = [v for vols in volumes.values() for v in vols if v is not None]
+    default = float(sum(known)) / len(known) if known else 1
+    return dict((sub[len("sub"):], sum(default if v is None else v for v in vols))
+                for sub, vols in volumes.items())
+
+
+def partition(costs, n_shards):
+    """
+    Longest processing time first: heaviest subject in the lightest shard
+
+    :param costs: {subject label: cost}
+    :param n_shards: the number of shards
+    :return: list of n_shards sorted lists of subject labels
+    """
+    shards = [(0, num, []) for num in range(n_shards)]
+    for label in sorted(costs, key=lambda l: (-costs[l], l)):
+        load, num, labels = heapq.heappop(shards)
+        labels.append(label)
+        heapq.heappush(shards, (load + costs[label], num, labels))
+    return [sorted(labels) for _, _, labels in sorted(shards, key=lambda s: s[1])]
+
+
+def parse_shard(shard):
+    """
+    :param shard: a string like "3/10"
+    :return: (3, 10)
+    :raise ValueError: if shard is not of the form i/N with 1 <= i <= N
+    """
+    m = SHARD_REGEX.match(shard)
+    if not m or not 1 <= int(m.group(1)) <= int(m.group(2)):
+        raise ValueError("{0} is not a shard, the format is i/N with 1 <= i <= N".format(shard))
+    return int(m.group(1)), int(m.group(2))
+
+
+def dataset_shards(path_data, n_shards, subjects=None, func_hint="", anat_hint="T1w", cache=None):
+    """
+    :param path_data: root of the BIDS dataset
+    :param n_shards: the number of shards
+    :param subjects: list of int, only those subjects are shared out. None, all subjects
+    :param cache: an optional bids_cache.LayoutCache
+    :return: list of (sorted list of subject labels, cost) for each shard
+    """
+    files_in = bids.grab_bids(path_data, subjects=subjects, func_hint=func_hint, anat_hint=anat_hint,
+                              cache=cache)
+    costs = subject_costs(files_in)
+    shards = partition(costs, n_shards)
+    for num, labels in enumerate(shards, 1):
+        log.info("shard {0}/{1}: {2} subjects, {3:.0f} volumes"
+                 .format(num, n_shards, len(labels), sum(costs[l] for l in labels)))
+    return [(labels, sum(costs[l] for l in labels)) for labels in shards]
+
+
+def shard_file(folder_out):
+    """
+    :param folder_out: the final output folder of the pipeline
+    :return: the file in folder_out/logs where the shards are saved
+    """
+    return os.path.join(folder_out, "logs", SHARD_FILE)
+
+
+def shard_key(path_data, n_shards, subjects=None, func_hint="", anat_hint="T1w"):
+    """
+    :return: what the shards of dataset_shards depend on, as saved with them
+    """
+    return {"path_data": os.path.realpath(path_data), "n_shards": n_shards,
+            "subjects": subjects, "func_hint": func_hint, "anat_hint": anat_hint}
+
+
+def save_shards(path, key, shards):
+    """
+    :param path: the json file, replaced atomically
+    :param key: see shard_key
+    :param shards: the output of dataset_shards
+    """
+    try:
+        os.makedirs(os.path.dirname(path))
+    except OSError:
+        pass
+    tmp = "{0}.{1}.tmp".format(path, os.getpid())
+    with open(tmp, "w") as fp:
+        json.dump({"key": key, "shards": shards}, fp)
+    os.rename(tmp, path)
+
+
+def load_shards(path, key):
+    """
+    :param path: a file written by save_shards
+    :param key: see shard_key
+    :return: the shards saved in path, None if there are none or if they
+             were computed with another key
+    """
+    try:
+        with open(path) as fp:
+            saved = json.load(fp)
+    except (IOError, OSError, ValueError):
+        return None
+    if saved.get("key") != key:
+        log.info("{0} was saved for other shards, splitting the dataset again".format(path))
+        return None
+    return [(labels, cost) for labels, cost in saved["shards"]]
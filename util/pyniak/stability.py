@@ -0,0 +1,234 @@
+"""
+Stability of a clustering of time series, estimated by bootstrap in numpy.
+
+Same estimator as commands/clustering/niak_stability_tseries.m, with the
+opt.engine = 'python' option of that function: the time series are
+resampled nb_samps times, every sample is clustered at each scale, and
+stab(:,s) is the frequency at which two regions fall in the same cluster,
+vectorized like niak_mat2vec.
+
+The samples are processed in chunks of CHUNK replications spread on a
+process pool. Each chunk draws its resampling indices at once from its own
+generator, seeded with (seed, chunk number), so the result only depends on
+the seed, not on the number of workers. The co-occurrences are accumulated
+as integer counts of the lower triangle, and divided by nb_samps once.
+"""
+
+import logging
+import math
+import multiprocessing
+
+import numpy as np
+import scipy.io
+from scipy.cluster import hierarchy
+
+
+log = logging.getLogger(__file__)
+
+# Replications per task of the pool, fixed so the seeds do not depend on the pool
+CHUNK = 10
+SAMPLING = ("bootstrap", "jacknife")
+CLUSTERING = ("hierarchical", "kmeans")
+# Same defaults as niak_kmeans_clustering
+KMEANS_ITER = 100
+
+
+def normalize(tseries):
+    """
+    Correct the time series to zero mean and unit variance, like niak_normalize_tseries 'mean_var'
+    """
+    tseries = tseries - tseries.mean(axis=0)
+    std = np.sqrt((tseries ** 2).sum(axis=0) / max(tseries.shape[0] - 1, 1))
+    mask = std != 0
+    tseries[:, mask] /= std[mask]
+    return tseries
+
+
+def pairs(n_regions):
+    """
+    :return: the two indices of the pairs of regions, in the order of niak_mat2vec
+    """
+    # The column major lower triangle is the row major upper triangle of the transpose
+    col, row = np.triu_indices(n_regions, 1)
+    return row, col
+
+
+def block_lengths(n_time, block_length=None):
+    """
+    :return: the candidate block lengths of the circular block bootstrap, see niak_bootstrap_tseries
+    """
+    if block_length is None or np.size(block_length) == 0:
+        root = int(math.ceil(math.sqrt(n_time)))
+        return np.array([2 * root, 3 * root])
+    return np.atleast_1d(np.asarray(block_length, dtype=int))
+
+
+def cbb_indices(rng, n_time, n_samps, block_length=None):
+    """
+    Time indices of n_samps circular block bootstrap samples
+
+    :param rng: a numpy RandomState
+    :param block_length: the block length, or a list of them picked at random for each sample
+    :return: an array n_samps x n_time
+    """
+    lengths = block_lengths(n_time, block_length)
+    lengths = lengths[rng.randint(len(lengths), size=n_samps)]
+    indices = np.empty((n_samps, n_time), dtype=int)
+    for length in np.unique(lengths):
+        mask = lengths == length
+        nb_b = int(math.ceil(n_time / float(length)))
+        starts = rng.randint(n_time, size=(mask.sum(), nb_b))
+        blocks = (starts[:, :, np.newaxis] + np.arange(length)) % n_time
+        indices[mask] = blocks.reshape(mask.sum(), -1)[:, :n_time]
+    return indices
+
+
+def jacknife_indices(rng, n_time, n_samps, perc=60):
+    """
+    Time indices of n_samps subsamples without replacement of perc % of the time points
+    """
+    n_keep = max(min(int(math.floor(perc * n_time / 100.)), n_time), 1)
+    return np.argsort(rng.rand(n_samps, n_time), axis=1)[:, :n_keep]
+
+
+def hierarchical_partitions(tseries, scales):
+    """
+    Ward hierarchical clustering of the regions, on their squared euclidean distance
+
+    :return: an array regions x scales of cluster labels
+    """
+    linkage = hierarchy.linkage(tseries.T, method="ward")
+    return hierarchy.cut_tree(linkage, n_clusters=scales)
+
+
+def kmeans(data, n_clusters, rng, n_iter=KMEANS_ITER):
+    """
+    k-means of the rows of data, initialized on rows picked at random
+
+    :return: the cluster label of each row
+    """
+    centroids = data[rng.permutation(data.shape[0])[:n_clusters]]
+    labels = None
+    sq_norm = (data ** 2).sum(axis=1)[:, np.newaxis]
+    for _ in range(n_iter):
+        dist = sq_norm - 2 * data.dot(centroids.T) + (centroids ** 2).sum(axis=1)
+        new_labels = dist.argmin(axis=1)
+        if labels is not None and np.array_equal(labels, new_labels):
+            break
+        labels = new_labels
+        for num_c in range(n_clusters):
+            members = labels == num_c
+            if members.any():
+                centroids[num_c] = data[members].mean(axis=0)
+    return labels
+
+
+def kmeans_partitions(tseries, scales, rng):
+    """
+    :return: an array regions x scales of k-means cluster labels
+    """
+    return np.column_stack([kmeans(tseries.T, k, rng) for k in scales])
+
+
+def sample_indices(rng, n_time, n_samps, sampling, block_length=None, perc=60):
+    if sampling == "bootstrap":
+        return cbb_indices(rng, n_time, n_samps, block_length)
+    elif sampling == "jacknife":
+        return jacknife_indices(rng, n_time, n_samps, perc)
+    raise ValueError("{0} is not a supported sampling scheme".format(sampling))
+
+
+def count_chunk(tseries, scales, n_samps, seed, chunk, sampling="bootstrap", clustering="hierarchical",
+                block_length=None, perc=60):
+    """
+    Cluster n_samps samples of tseries
+
+    :return: an array pairs x scales, the number of samples where each pair of regions is in the same cluster
+    """
+    rng = np.random.RandomState([seed, chunk])
+    row, col = pairs(tseries.shape[1])
+    counts = np.zeros((len(row), len(scales)), dtype=np.uint16)
+    for ind in sample_indices(rng, tseries.shape[0], n_samps, sampling, block_length, perc):
+        sample = normalize(tseries[ind])
+        if clustering == "hierarchical":
+            part = hierarchical_partitions(sample, scales)
+        elif clustering == "kmeans":
+            part = kmeans_partitions(sample, scales, rng)
+        else:
+            raise ValueError("{0}: unknown type of clustering".format(clustering))
+        counts += part[row] == part[col]
+    return counts
+
+
+_worker_tseries = None
+
+
+def _init_worker(tseries):
+    global _worker_tseries
+    _worker_tseries = tseries
+
+
+def _count_chunk(args):
+    return count_chunk(_worker_tseries, *args)
+
+
+def stability(tseries, scales, n_samps=100, sampling="bootstrap", clustering="hierarchical", block_length=None,
+              perc=60, n_workers=1, seed=0):
+    """
+    :param tseries: array time x regions
+    :param scales: the numbers of clusters
+    :param n_workers: number of processes clustering the samples
+    :param seed: the integer seed of the replications
+    :return: an array pairs x scales, stab[:, s] is the vectorized stability matrix at scales[s]
+    """
+    scales = [int(s) for s in np.atleast_1d(scales)]
+    tseries = np.asarray(tseries, dtype=float)
+    tasks = []
+    for chunk, start in enumerate(range(0, n_samps, CHUNK)):
+        tasks.append((scales, min(CHUNK, n_samps - start), seed, chunk, sampling, clustering, block_length, perc))
+
+    n_pairs = tseries.shape[1] * (tseries.shape[1] - 1) // 2
+    # counts of a chunk fit in uint16, their sum may not
+    counts = np.zeros((n_pairs, len(scales)), dtype=np.uint16 if n_samps < 2 ** 16 else np.uint32)
+    if n_workers > 1:
+        pool = multiprocessing.Pool(n_workers, initializer=_init_worker, initargs=(tseries,))
+        try:
+            for num_t, chunk_counts in enumerate(pool.imap_unordered(_count_chunk, tasks)):
+                counts += chunk_counts
+                log.debug("{0}/{1} chunks done".format(num_t + 1, len(tasks)))
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
+    else:
+        for task in tasks:
+            counts += count_chunk(tseries, *task)
+    return counts / float(n_samps)
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description="Estimate the stability of a clustering of time series")
+    parser.add_argument("file_in", help="A .mat file with the time series, time x regions")
+    parser.add_argument("file_out", help="The .mat file where the stability matrices STAB are saved")
+    parser.add_argument("--name_data", default="tseries", help="The variable of the time series in file_in")
+    parser.add_argument("--nb_classes", required=True,
+                        help="The numbers of clusters, separated by commas")
+    parser.add_argument("--nb_samps", type=int, default=100, help="Number of samples")
+    parser.add_argument("--sampling", choices=SAMPLING, default="bootstrap")
+    parser.add_argument("--block_length", default=None,
+                        help="Block length(s) of the bootstrap, separated by commas")
+    parser.add_argument("--perc", type=float, default=60, help="Percentage of time points of a jacknife sample")
+    parser.add_argument("--clustering", choices=CLUSTERING, default="hierarchical")
+    parser.add_argument("--nb_workers", type=int, default=1, help="Number of processes")
+    parser.add_argument("--rand_seed", type=int, default=0, help="Seed of the replications")
+    parsed = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    data = scipy.io.loadmat(parsed.file_in)[parsed.name_data]
+    stab = stability(data, [int(s) for s in parsed.nb_classes.split(",")], n_samps=parsed.nb_samps,
+                     sampling=parsed.sampling, clustering=parsed.clustering,
+                     block_length=(None if parsed.block_length is None
+                                   else [int(b) for b in parsed.block_length.split(",")]),
+                     perc=parsed.perc, n_workers=parsed.nb_workers, seed=parsed.rand_seed)
+    scipy.io.savemat(parsed.file_out, {"stab": stab})
@@ -0,0 +1,116 @@
+"""
+Stage the inputs of a participant run on node-local scratch.
+
+Each input gets its place in the scratch folder right away, as a symbolic
+link to the shared file system, and threads replace the links with local
+copies, anatomical scans first. A job that starts before its input is
+copied reads it through the link, a job that starts after reads the local
+copy, so the pipeline never waits on the staging.
+"""
+
+import collections
+import logging
+import os
+import shutil
+from multiprocessing.pool import ThreadPool
+
+
+log = logging.getLogger(__file__)
+
+STAGING_DIR = "inputs"
+# Staged first, the T1 stages are the first to start and the longest chain
+FIRST = "anat"
+
+
+class Prefetch(object):
+    """
+    Copy the inputs of a files_in structure in a local folder, see the module doc
+    """
+
+    def __init__(self, path_data, dest, n_threads=2):
+        """
+        :param path_data: root of the input dataset, staged files keep their path relative to it
+        :param dest: the local folder
+        :param n_threads: number of concurrent copies
+        """
+        self.path_data = os.path.abspath(path_data)
+        self.dest = dest
+        self.n_threads = n_threads
+        # source -> staged path, in staging order
+        self.staged = collections.OrderedDict()
+        self.pool = None
+
+    def local_path(self, source):
+        rel_path = os.path.relpath(os.path.abspath(source), self.path_data)
+        if rel_path.startswith(os.pardir):
+            rel_path = os.path.abspath(source).lstrip(os.sep)
+        return os.path.join(self.dest, rel_path)
+
+    def stage(self, files_in):
+        """
+        :param files_in: a files_in dict, see bids.BidsIndex.grab
+        :return: the same structure, with the paths of the staged files
+        """
+        first = []
+        rest = []
+
+        def unfold(value, key=None):
+            if isinstance(value, dict):
+                return collections.OrderedDict((k, unfold(v, k)) for k, v in value.items())
+            (first if key == FIRST else rest).append(value)
+            return self.local_path(value)
+
+        staged_files = unfold(files_in)
+        for source in first + rest:
+            self.staged.setdefault(source, self.local_path(source))
+        return staged_files
+
+    def _copy(self, source, target):
+        tmp = "{0}.staging".format(target)
+        try:
+            shutil.copyfile(source, tmp)
+            # Replaces the link, jobs that already opened it keep reading the shared file
+            os.rename(tmp, target)
+        except (IOError, OSError) as e:
+            log.warning("Could not stage {0}, it is read from the shared file system: {1}".format(source, e))
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    def start(self):
+        """
+        Link all the inputs in the local folder, and start copying them
+        """
+        for source, target in self.staged.items():
+            try:
+                os.makedirs(os.path.dirname(target))
+            except OSError:
+                pass
+            if os.path.lexists(target):
+                if not os.path.islink(target):
+                    # Staged by a previous launch
+                    continue
+                os.remove(target)
+            os.symlink(os.path.abspath(source), target)
+        self.pool = ThreadPool(self.n_threads)
+        for source, target in self.staged.items():
+            if os.path.islink(target):
+                self.pool.apply_async(self._copy, (source, target))
+        self.pool.close()
+
+    def join(self):
+        if self.pool is not None:
+            self.pool.join()
+            self.pool = None
+
+    def cleanup(self, keep=False):
+        """
+        Drop the copies not started yet and remove the local folder
+
+        :param keep: keep the local folder, so the next launch of a resumed run does not copy
+                     again the inputs that are already there
+        """
+        if self.pool is not None:
+            self.pool.terminate()
+        self.join()
+        if not keep:
+            shutil.rmtree(self.dest, ignore_errors=True)
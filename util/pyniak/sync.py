@@ -0,0 +1,219 @@
+"""
+Ship the outputs of a pipeline to their final folder while it runs.
+
+The outputs of a job are copied as soon as psom marks the job as finished
+in logs/PIPE_status.mat, with a pool of threads, instead of one rsync once
+the pipeline is done. The outputs of a job are listed by its files_out in
+logs/PIPE_jobs.mat. Files are only removed from the working folder at the
+end, since later jobs may still read them, and the final pass copies again
+whatever changed after its first copy, as well as the files no job lists.
+When the logs can not be read, everything is shipped by the final pass.
+"""
+
+import hashlib
+import logging
+import os
+import shutil
+import threading
+from multiprocessing.pool import ThreadPool
+
+from pyniak import psom_status
+
+
+log = logging.getLogger(__file__)
+
+# Same exclusions as the final rsync in BaseBids
+EXCLUDED = ('logs', 'report')
+# Seconds between two reads of the psom logs
+PERIOD = 10
+CHUNK = 1024 ** 2
+
+
+def file_digest(path):
+    md5 = hashlib.md5()
+    with open(path, 'rb') as fp:
+        for chunk in iter(lambda: fp.read(CHUNK), b''):
+            md5.update(chunk)
+    return md5.hexdigest()
+
+
+def same_content(src, dest):
+    """
+    :return: True if dest exists and holds the same bytes as src. The files are
+             only hashed when they have the same size but not the same mtime,
+             copy_file keeps the mtime of src.
+    """
+    try:
+        st_src = os.stat(src)
+        st_dest = os.stat(dest)
+    except OSError:
+        return False
+    if st_src.st_size != st_dest.st_size:
+        return False
+    if st_src.st_mtime == st_dest.st_mtime:
+        return True
+    return file_digest(src) == file_digest(dest)
+
+
+def finished_outputs(logs):
+    """
+    :param logs: the logs folder of a psom pipeline
+    :return: the list of the files_out of the finished jobs, None if the logs can not be read
+    """
+    if not psom_status.scipy_loaded:
+        return None
+    try:
+        status = psom_status.load(os.path.join(logs, psom_status.STATUS_FILE))
+        jobs = psom_status.load(os.path.join(logs, psom_status.JOBS_FILE))
+    except (psom_status.UnsupportedFormat, IOError, OSError, ValueError):
+        return None
+    return [f for files in psom_status.finished_files_out(status, jobs).values() for f in files]
+
+
+def copy_file(src, dest):
+    """
+    Copy src on dest through a temporary file, so dest is never partial.
+    Nothing is written if dest already has the same content.
+
+    :return: True if the file was copied
+    """
+    if same_content(src, dest):
+        return False
+    try:
+        os.makedirs(os.path.dirname(dest))
+    except OSError:
+        pass
+    tmp = "{0}.niak_sync".format(dest)
+    shutil.copy2(src, tmp)
+    os.rename(tmp, dest)
+    return True
+
+
+class StreamingSync(object):
+    """
+    Copy the files of src to dest while they are produced, see the module doc
+    """
+
+    def __init__(self, src, dest, n_threads=4, period=PERIOD, excluded=EXCLUDED):
+        """
+        :param src: the working folder of the pipeline
+        :param dest: the final folder
+        :param n_threads: number of concurrent copies
+        :param period: seconds between two reads of the psom logs
+        :param excluded: directory names that are never copied
+        """
+        self.src = src
+        self.dest = dest
+        self.period = period
+        self.excluded = excluded
+        self.pool = ThreadPool(n_threads)
+        # relative path -> (size, mtime) of the version that was copied or is being copied
+        self.shipped = {}
+        # relative paths whose last copy failed
+        self.failed = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._scanner = None
+        self._logs_mtime = None
+
+    def files(self):
+        """
+        :return: iterator of (relative path, stat) of the files to ship
+        """
+        for dir_path, dir_names, file_names in os.walk(self.src):
+            dir_names[:] = [d for d in dir_names if d not in self.excluded]
+            for f in file_names:
+                path = os.path.join(dir_path, f)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                yield os.path.relpath(path, self.src), st
+
+    def finished_files(self):
+        """
+        :return: iterator of (relative path, stat) of the outputs of the finished jobs.
+                 Nothing if the logs did not change since the last call, or can not be read.
+        """
+        logs = os.path.join(self.src, "logs")
+        try:
+            mtime = os.path.getmtime(os.path.join(logs, psom_status.STATUS_FILE))
+        except OSError:
+            return
+        if mtime == self._logs_mtime:
+            return
+        outputs = finished_outputs(logs)
+        if outputs is None:
+            return
+        self._logs_mtime = mtime
+        for path in outputs:
+            rel_path = os.path.relpath(os.path.abspath(path), os.path.abspath(self.src))
+            if rel_path.startswith(os.pardir) or rel_path.split(os.sep)[0] in self.excluded:
+                continue
+            try:
+                st = os.stat(os.path.join(self.src, rel_path))
+            except OSError:
+                continue
+            if os.path.isfile(os.path.join(self.src, rel_path)):
+                yield rel_path, st
+
+    def _copy(self, rel_path, version):
+        try:
+            copy_file(os.path.join(self.src, rel_path), os.path.join(self.dest, rel_path))
+        except (IOError, OSError) as e:
+            # The next scan, or the final pass, will try again
+            log.warning("Could not sync {0}: {1}".format(rel_path, e))
+            with self._lock:
+                self.failed.add(rel_path)
+                if self.shipped.get(rel_path) == version:
+                    del self.shipped[rel_path]
+        else:
+            with self._lock:
+                self.failed.discard(rel_path)
+
+    def scan(self, finished_only=True):
+        """
+        Submit the copy of the files that changed since they were shipped
+
+        :param finished_only: only ship the outputs of the jobs psom marked as finished
+        :return: the list of AsyncResult of the submitted copies
+        """
+        results = []
+        for rel_path, st in self.finished_files() if finished_only else self.files():
+            version = (st.st_size, st.st_mtime)
+            with self._lock:
+                if self.shipped.get(rel_path) == version:
+                    continue
+                self.shipped[rel_path] = version
+            results.append(self.pool.apply_async(self._copy, (rel_path, version)))
+        return results
+
+    def _run(self):
+        while not self._stop.wait(self.period):
+            self.scan()
+
+    def start(self):
+        self._scanner = threading.Thread(target=self._run)
+        self._scanner.daemon = True
+        self._scanner.start()
+
+    def finish(self, remove_source=True):
+        """
+        Ship everything that is left, then remove the source files, like
+        rsync --remove-source-files. The files that could not be copied are kept.
+
+        :return: the sorted list of the relative paths that could not be copied
+        """
+        self._stop.set()
+        if self._scanner is not None:
+            self._scanner.join()
+        for result in self.scan(finished_only=False):
+            result.wait()
+        self.pool.close()
+        self.pool.join()
+
+        if remove_source:
+            for rel_path, st in list(self.files()):
+                if self.shipped.get(rel_path) == (st.st_size, st.st_mtime):
+                    os.remove(os.path.join(self.src, rel_path))
+        return sorted(self.failed)
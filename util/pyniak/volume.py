@@ -0,0 +1,254 @@
+"""
+Read 3D and 3D+t volumes in python, without temporary files.
+
+Same conventions as commands/read_write/niak_read_vol.m: the volume is
+indexed (x, y, z, t), in float32 with the scaling of the file applied, and
+the header is a dict with an 'info' entry holding file_parent, dimensions,
+voxel_size, precision, mat and tr.
+
+Uncompressed nifti files are memory mapped, gzipped nifti files are
+decompressed in memory, and MINC2 files are read directly from their
+HDF5 layout with h5py, instead of going through minctoraw. Gzipped MINC2
+files, niak's default MINC output, are also decompressed in memory.
+"""
+
+import gzip
+import io
+import logging
+import os
+
+import numpy as np
+
+try:
+    import h5py
+    h5py_loaded = True
+except ImportError:
+    h5py_loaded = False
+
+
+log = logging.getLogger(__file__)
+
+NIFTI_HEADER_SIZE = 348
+HDF5_SIGNATURE = b"\x89HDF\r\n\x1a\n"
+# Same name as in niak_read_vol
+EXTRA_SUFFIX = "_extra.mat"
+# The direction cosines of a MINC dimension without that attribute
+DEFAULT_COSINES = {"xspace": [1, 0, 0], "yspace": [0, 1, 0], "zspace": [0, 0, 1]}
+
+
+class UnsupportedFormat(Exception):
+    pass
+
+
+NIFTI_HEADER = [("sizeof_hdr", "i4"), ("data_type", "S10"), ("db_name", "S18"), ("extents", "i4"),
+                ("session_error", "i2"), ("regular", "S1"), ("dim_info", "u1"), ("dim", "i2", 8),
+                ("intent_p1", "f4"), ("intent_p2", "f4"), ("intent_p3", "f4"), ("intent_code", "i2"),
+                ("datatype", "i2"), ("bitpix", "i2"), ("slice_start", "i2"), ("pixdim", "f4", 8),
+                ("vox_offset", "f4"), ("scl_slope", "f4"), ("scl_inter", "f4"), ("slice_end", "i2"),
+                ("slice_code", "u1"), ("xyzt_units", "u1"), ("cal_max", "f4"), ("cal_min", "f4"),
+                ("slice_duration", "f4"), ("toffset", "f4"), ("glmax", "i4"), ("glmin", "i4"),
+                ("descrip", "S80"), ("aux_file", "S24"), ("qform_code", "i2"), ("sform_code", "i2"),
+                ("quatern_b", "f4"), ("quatern_c", "f4"), ("quatern_d", "f4"), ("qoffset_x", "f4"),
+                ("qoffset_y", "f4"), ("qoffset_z", "f4"), ("srow_x", "f4", 4), ("srow_y", "f4", 4),
+                ("srow_z", "f4", 4), ("intent_name", "S16"), ("magic", "S4")]
+
+# nifti datatype code: numpy type, see niak_read_hdr_nifti for the precision names
+NIFTI_TYPES = {2: "u1", 4: "i2", 8: "i4", 16: "f4", 64: "f8", 256: "i1", 512: "u2", 768: "u4",
+               1024: "i8", 1280: "u8"}
+
+
+def nifti_header(raw):
+    """
+    :param raw: the first 348 bytes of a nifti-1 file
+    :return: the header as a numpy record, in the byte order of the file
+    """
+    for endian in ('<', '>'):
+        details = np.frombuffer(raw[:NIFTI_HEADER_SIZE], dtype=np.dtype(NIFTI_HEADER).newbyteorder(endian))[0]
+        if details["sizeof_hdr"] == NIFTI_HEADER_SIZE:
+            return details
+    raise UnsupportedFormat("not a nifti-1 header")
+
+
+def quaternion_mat(details):
+    """
+    The voxel to world transformation of the qform, see niak_quat2mat
+    """
+    b, c, d = [float(details[k]) for k in ("quatern_b", "quatern_c", "quatern_d")]
+    a = np.sqrt(max(0., 1. - (b * b + c * c + d * d)))
+    rot = np.array([[a * a + b * b - c * c - d * d, 2 * (b * c - a * d), 2 * (b * d + a * c)],
+                    [2 * (b * c + a * d), a * a + c * c - b * b - d * d, 2 * (c * d - a * b)],
+                    [2 * (b * d - a * c), 2 * (c * d + a * b), a * a + d * d - c * c - b * b]])
+    pixdim = np.array(details["pixdim"][1:4], dtype=float)
+    if details["pixdim"][0] < 0:
+        pixdim[2] = -pixdim[2]
+    mat = np.eye(4)
+    mat[:3, :3] = rot * pixdim
+    mat[:3, 3] = [details["qoffset_x"], details["qoffset_y"], details["qoffset_z"]]
+    return mat
+
+
+def nifti_info(details, file_name):
+    dim = [max(1, int(d)) for d in details["dim"][1:5]]
+    if details["sform_code"] > 0:
+        mat = np.vstack([details["srow_x"], details["srow_y"], details["srow_z"], [0, 0, 0, 1]]).astype(float)
+    else:
+        mat = quaternion_mat(details)
+    info = {"file_parent": file_name,
+            "dimensions": dim if dim[3] > 1 else dim[:3],
+            "voxel_size": [float(v) for v in details["pixdim"][1:4]],
+            "precision": "float",
+            "mat": mat,
+            "history": details["descrip"].decode("latin-1").rstrip("\x00")}
+    if dim[3] > 1:
+        info["tr"] = float(details["pixdim"][4])
+    return info
+
+
+def scaled(details, vol):
+    """
+    Apply scl_slope and scl_inter, and return float32 like niak_read_nifti.
+    Native float32 data is returned as is, still memory mapped
+    """
+    slope, inter = float(details["scl_slope"]), float(details["scl_inter"])
+    if (slope not in (0, 1)) or inter != 0:
+        return vol.astype(np.float32) * slope + inter
+    return vol.astype(np.float32, copy=False)
+
+
+def read_nifti(file_name, read_data=True):
+    """
+    :param file_name: a .nii or .nii.gz file
+    :param read_data: False to only read the header
+    :return: (hdr, vol), vol is None if read_data is False
+    """
+    compressed = file_name.endswith(".gz")
+    opener = gzip.open if compressed else open
+    with opener(file_name, 'rb') as fp:
+        raw = fp.read() if (compressed and read_data) else fp.read(NIFTI_HEADER_SIZE)
+    details = nifti_header(raw)
+    hdr = {"type": "nii", "info": nifti_info(details, file_name), "details": details}
+    if not read_data:
+        return hdr, None
+
+    if details["datatype"] not in NIFTI_TYPES:
+        raise UnsupportedFormat("nifti datatype {0} of {1}".format(details["datatype"], file_name))
+    byte_order = details.dtype.fields["sizeof_hdr"][0].byteorder
+    dtype = np.dtype(NIFTI_TYPES[int(details["datatype"])]).newbyteorder(byte_order)
+    dim = [max(1, int(d)) for d in details["dim"][1:5]]
+    offset = int(details["vox_offset"])
+    if compressed:
+        data = np.frombuffer(raw, dtype=dtype, count=int(np.prod(dim)), offset=offset)
+    else:
+        data = np.memmap(file_name, dtype=dtype, mode='r', offset=offset, shape=(int(np.prod(dim)),))
+    vol = data.reshape(dim, order='F')
+    if dim[3] == 1:
+        vol = vol[..., 0]
+    return hdr, scaled(details, vol)
+
+
+def is_minc2(file_name):
+    opener = gzip.open if file_name.endswith(".gz") else open
+    with opener(file_name, 'rb') as fp:
+        return fp.read(len(HDF5_SIGNATURE)) == HDF5_SIGNATURE
+
+
+def read_minc2(file_name, read_data=True):
+    """
+    Read a MINC2 file with h5py, with the same normalization as minctoraw -normalize
+
+    :param file_name: a .mnc or .mnc.gz file in MINC2 format
+    :param read_data: False to only read the header
+    :return: (hdr, vol), vol is None if read_data is False
+    """
+    if not h5py_loaded:
+        raise UnsupportedFormat("h5py is not installed")
+    if not is_minc2(file_name):
+        raise UnsupportedFormat("{0} is not a MINC2 file".format(file_name))
+
+    if file_name.endswith(".gz"):
+        # h5py reads file-like objects, the whole file is needed even for the header
+        with gzip.open(file_name, 'rb') as fp:
+            source = io.BytesIO(fp.read())
+    else:
+        source = file_name
+    with h5py.File(source, 'r') as h5:
+        image = h5["minc-2.0/image/0/image"]
+        dim_order = image.attrs["dimorder"]
+        if not isinstance(dim_order, str):
+            dim_order = dim_order.decode()
+        dim_names = dim_order.split(',')
+
+        # The file stores the slowest dimension first, niak puts x first
+        dim_names = dim_names[::-1]
+        dimensions = h5["minc-2.0/dimensions"]
+        step = {}
+        start = {}
+        cosines = {}
+        for name in dim_names:
+            attrs = dimensions[name].attrs
+            step[name] = float(attrs.get("step", 1))
+            start[name] = float(attrs.get("start", 0))
+            cosines[name] = np.array(attrs.get("direction_cosines", DEFAULT_COSINES.get(name, [0, 0, 0])),
+                                     dtype=float)
+        spatial = [n for n in dim_names if n != "time"]
+        mat = np.eye(4)
+        for num, name in enumerate(spatial[:3]):
+            mat[:3, num] = cosines[name] * step[name]
+            mat[:3, 3] += cosines[name] * start[name]
+
+        info = {"file_parent": file_name,
+                "dimensions": list(image.shape[::-1]),
+                "dimension_order": "".join(n[0] for n in dim_names),
+                "voxel_size": [abs(step[n]) for n in spatial[:3]],
+                "precision": "float",
+                "mat": mat}
+        if "time" in step:
+            info["tr"] = abs(step["time"])
+        hdr = {"type": "minc2", "info": info}
+        if not read_data:
+            return hdr, None
+
+        vol = image[()].astype(np.float32)
+        vol = normalized(h5, image, vol)
+    return hdr, vol.transpose()
+
+
+def normalized(h5, image, vol):
+    """
+    Scale the voxel values to the real range given by image-min and image-max,
+    which vary along the slowest dimensions of the image
+    """
+    if not np.issubdtype(image.dtype, np.integer):
+        return vol
+    info = np.iinfo(image.dtype)
+    valid = image.attrs.get("valid_range", [info.min, info.max])
+    vmin, vmax = float(valid[0]), float(valid[1])
+    img_min = np.asarray(h5["minc-2.0/image/0/image-min"][()], dtype=np.float32)
+    img_max = np.asarray(h5["minc-2.0/image/0/image-max"][()], dtype=np.float32)
+    # image-min/max have the shape of the leading dimensions of the image
+    shape = img_min.shape + (1,) * (vol.ndim - img_min.ndim)
+    img_min = img_min.reshape(shape)
+    img_max = img_max.reshape(shape)
+    return (vol - vmin) / (vmax - vmin) * (img_max - img_min) + img_min
+
+
+def read_vol(file_name, read_data=True):
+    """
+    Python version of niak_read_vol, for a single nifti or MINC2 file
+
+    :param file_name: a .nii, .nii.gz, .mnc or .mnc.gz file
+    :param read_data: False to only read the header
+    :return: (hdr, vol)
+    :raise UnsupportedFormat: for MINC1 and analyze files, or MINC2 without h5py
+    """
+    base = file_name[:-3] if file_name.endswith(".gz") else file_name
+    if base.endswith(".nii"):
+        hdr, vol = read_nifti(file_name, read_data=read_data)
+    elif base.endswith(".mnc"):
+        hdr, vol = read_minc2(file_name, read_data=read_data)
+    else:
+        raise UnsupportedFormat("{0} is not a .nii, .nii.gz, .mnc or .mnc.gz file".format(file_name))
+    extra = os.path.splitext(base)[0] + EXTRA_SUFFIX
+    if os.path.exists(extra):
+        hdr["file_extra"] = extra
+    return hdr, vol
@@ -0,0 +1,149 @@
+"""
+Working folders of participant runs.
+
+Each set of participants gets the same working folder in every launch,
+under <output_dir>/work, so a run killed by preemption or walltime can
+resume from the psom logs it left there. The folder is removed once its
+results are shipped, and folders nobody touched for a while are garbage
+collected by the next runs.
+
+A run holds a lock on <folder>.lock, next to its working folder, as long as
+it uses it, so another launch on the same participants, or the garbage
+collection, never removes a folder in use.
+"""
+
+import errno
+import fcntl
+import hashlib
+import logging
+import os
+import shutil
+import time
+
+
+log = logging.getLogger(__file__)
+
+WORK_DIR = "work"
+# Days without activity before a working folder is garbage collected
+MAX_AGE = 7
+# Left by psom_run_pipeline while it runs, and by a manager that was killed
+PIPE_LOCK = os.path.join("logs", "PIPE.lock")
+PIPE_HISTORY = os.path.join("logs", "PIPE_history.txt")
+LOCK_SUFFIX = ".lock"
+
+
+class FolderInUse(Exception):
+    pass
+
+
+def lock(path):
+    """
+    Take the lock of the working folder path, fcntl locks also work over NFS
+    and are released when the process dies
+
+    :return: the open lock file, close it to release the lock
+    :raise FolderInUse: if another live run holds it
+    """
+    fp = open(path.rstrip(os.sep) + LOCK_SUFFIX, 'a')
+    try:
+        fcntl.lockf(fp, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except (IOError, OSError) as e:
+        fp.close()
+        if e.errno in (errno.EACCES, errno.EAGAIN):
+            raise FolderInUse("Another run is using {0}".format(path))
+        raise
+    return fp
+
+
+def work_dir(folder_out, subjects=None):
+    """
+    :param folder_out: the final output folder
+    :param subjects: list of participant labels, None for all participants
+    :return: the working folder of that set of participants
+    """
+    if not subjects:
+        name = "results_all"
+    else:
+        labels = ",".join(str(s) for s in subjects)
+        name = "results_{0}_{1}".format(subjects[0], hashlib.md5(labels.encode()).hexdigest()[:8])
+    return os.path.join(folder_out, WORK_DIR, name)
+
+
+def last_activity(path):
+    """
+    :return: the last time psom wrote in the working folder path
+    """
+    times = []
+    for p in (path, os.path.join(path, "logs"), os.path.join(path, PIPE_HISTORY)):
+        try:
+            times.append(os.path.getmtime(p))
+        except OSError:
+            pass
+    return max(times) if times else 0
+
+
+def prepare(path, resume=False):
+    """
+    Lock and create the working folder path
+
+    :param resume: keep what a previous run left in path, so psom only runs the unfinished jobs.
+                   Otherwise path is emptied first.
+    :return: the lock of path, see lock
+    :raise FolderInUse: if another live run uses path, which is then left alone
+    """
+    try:
+        os.makedirs(os.path.dirname(path.rstrip(os.sep)))
+    except OSError:
+        pass
+    held = lock(path)
+    if os.path.isdir(path):
+        if resume:
+            log.info("Resuming the pipeline in {0}".format(path))
+            pipe_lock = os.path.join(path, PIPE_LOCK)
+            if os.path.exists(pipe_lock):
+                # This participant set runs once at a time, the manager holding it is dead
+                os.remove(pipe_lock)
+        else:
+            shutil.rmtree(path)
+    try:
+        os.makedirs(path)
+    except OSError:
+        if not os.path.isdir(path):
+            held.close()
+            raise
+    return held
+
+
+def collect_garbage(folder_out, max_age=MAX_AGE, keep=()):
+    """
+    Remove the working folders of folder_out without activity for max_age days
+
+    :param keep: working folders never removed, like the one of the current run
+    :return: the list of removed folders
+    """
+    root = os.path.join(folder_out, WORK_DIR)
+    try:
+        names = os.listdir(root)
+    except OSError:
+        return []
+    keep = set(os.path.abspath(k) for k in keep)
+    removed = []
+    now = time.time()
+    for name in names:
+        path = os.path.abspath(os.path.join(root, name))
+        if path in keep or not os.path.isdir(path):
+            continue
+        if now - last_activity(path) > max_age * 24 * 3600:
+            try:
+                held = lock(path)
+            except FolderInUse:
+                # A long job that did not write in the logs for a while
+                continue
+            try:
+                log.info("Removing the stale working folder {0}".format(path))
+                shutil.rmtree(path, ignore_errors=True)
+                os.remove(held.name)
+            finally:
+                held.close()
+            removed.append(path)
+    return removed
@@ -0,0 +1,292 @@
+"""
+Start and babysit the psom_worker.py processes of a pipeline.
+
+The workers are started as soon as the pipeline manager creates
+logs/tmp in the pipeline folder, crashed workers are restarted and
+all workers are stopped with the pipeline.
+"""
+
+import ctypes
+import ctypes.util
+import errno
+import logging
+import multiprocessing
+import os
+import select
+import struct
+import subprocess
+import threading
+import time
+
+try:
+    import psutil
+    psutil_loaded = True
+except ImportError:
+    psutil_loaded = False
+
+
+log = logging.getLogger(__file__)
+
+PSOM_WORKER = "psom_worker.py"
+# Memory (in bytes) booked for each worker when sizing the pool
+WORKER_MEMORY = 2 * 1024 ** 3
+# Number of times a crashed worker is restarted
+MAX_RESTART = 3
+# Period (s) at which worker processes are checked
+MONITOR_PERIOD = 1
+# Longest time (s) wait_for_path takes to notice its stop event
+STOP_PERIOD = 0.5
+
+# From sys/inotify.h
+IN_CREATE = 0x00000100
+IN_MOVED_TO = 0x00000080
+IN_DELETE_SELF = 0x00000400
+IN_NONBLOCK = 0x00000800
+INOTIFY_EVENT = struct.Struct("iIII")
+
+
+def _libc_inotify():
+    """
+    :return: libc if it exposes inotify, None otherwise
+    """
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        libc.inotify_init1
+        libc.inotify_add_watch
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+
+def _deepest_existing(path):
+    path = os.path.abspath(path)
+    while not os.path.isdir(path):
+        path = os.path.dirname(path)
+    return path
+
+
+def wait_for_path(path, timeout=None, stop=None):
+    """
+    Block until path exists. Uses inotify events on the deepest existing parent
+    of path when available, and falls back on a short polling otherwise.
+
+    :param path: a file or directory that will be created by another process
+    :param timeout: give up after that many seconds, None waits forever
+    :param stop: a threading.Event, give up once it is set
+    :return: True if path exists, False on timeout or stop
+    """
+    start = time.time()
+    if stop is None:
+        stop = threading.Event()
+
+    def remaining():
+        if timeout is None:
+            return None
+        return max(0, timeout - (time.time() - start))
+
+    libc = _libc_inotify()
+    if libc is None:
+        delay = 0.05
+        while not os.path.exists(path):
+            if stop.is_set() or (timeout is not None and not remaining()):
+                return False
+            stop.wait(delay if timeout is None else min(delay, remaining()))
+            delay = min(2 * delay, 1)
+        return True
+
+    fd = libc.inotify_init1(IN_NONBLOCK)
+    if fd < 0:
+        raise OSError(ctypes.get_errno(), os.strerror(ctypes.get_errno()))
+    try:
+        watched = set()
+        while not os.path.exists(path):
+            parent = _deepest_existing(os.path.dirname(os.path.abspath(path)))
+            if parent not in watched:
+                libc.inotify_add_watch(fd, parent.encode(), IN_CREATE | IN_MOVED_TO | IN_DELETE_SELF)
+                watched.add(parent)
+                # The parent might have been populated before the watch was set
+                continue
+            if stop.is_set() or (timeout is not None and not remaining()):
+                return False
+            # The timeout of select protects against missed events, and bounds the time to see stop
+            ready, _, _ = select.select([fd], [], [], STOP_PERIOD if timeout is None
+                                        else min(STOP_PERIOD, remaining()))
+            if ready:
+                try:
+                    os.read(fd, 64 * INOTIFY_EVENT.size)
+                except OSError as e:
+                    if e.errno != errno.EAGAIN:
+                        raise
+        return True
+    finally:
+        os.close(fd)
+
+
+def pool_size(n_thread=None, worker_memory=WORKER_MEMORY):
+    """
+    :param n_thread: requested number of workers, None or 0 to use the whole node
+    :param worker_memory: memory in bytes needed by one worker
+    :return: the number of workers that the node can accommodate
+    """
+    if psutil_loaded:
+        n_cpu = psutil.cpu_count() or 1
+        n_mem = max(1, int(psutil.virtual_memory().available // worker_memory))
+    else:
+        n_cpu = multiprocessing.cpu_count()
+        n_mem = n_cpu
+    size = min(n_cpu, n_mem)
+    if n_thread:
+        size = min(int(n_thread), size)
+    return max(1, size)
+
+
+def kill_tree(p):
+    """
+    Kill a process and all its children
+    """
+    if psutil_loaded:
+        try:
+            parent = psutil.Process(p.pid)
+            try:
+                children = parent.children(recursive=True)
+            except AttributeError:
+                children = parent.get_children(recursive=True)
+            for child in children:
+                child.kill()
+        except psutil.NoSuchProcess:
+            pass
+    try:
+        p.kill()
+    except OSError:
+        pass
+
+
+class WorkerPool(object):
+    """
+    A pool of psom_worker.py processes serving one pipeline folder
+    """
+
+    def __init__(self, folder_out, n_workers=None, max_restart=MAX_RESTART, worker_memory=WORKER_MEMORY):
+        """
+        :param folder_out: the pipeline output folder, the one with the logs directory
+        :param n_workers: number of workers, None or 0 to size the pool from the node resources
+        :param max_restart: how many times a crashed worker is restarted
+        :param worker_memory: memory in bytes booked for each worker when sizing the pool
+        """
+        self.folder_out = folder_out
+        self.n_workers = pool_size(n_workers, worker_memory)
+        self.max_restart = max_restart
+        self.workers = {}
+        self.restarts = {}
+        self._stop = threading.Event()
+        # Held while self.workers is modified, the monitor does not start workers once stop() holds it
+        self._lock = threading.Lock()
+        self._monitor = None
+
+    def _start_worker(self, num):
+        cmd = [PSOM_WORKER, '-d', self.folder_out, '-w', str(num)]
+        log.debug(" ".join(cmd))
+        self.workers[num] = subprocess.Popen(cmd)
+
+    def start(self, timeout=None):
+        """
+        Wait for the pipeline manager to be ready and start the workers in the background
+
+        :param timeout: give up after that many seconds, None waits forever
+        """
+        self._monitor = threading.Thread(target=self._run, args=(timeout,))
+        self._monitor.daemon = True
+        self._monitor.start()
+
+    def _run(self, timeout):
+        if not wait_for_path(os.path.join(self.folder_out, "logs", "tmp"), timeout=timeout, stop=self._stop):
+            if not self._stop.is_set():
+                log.error("The pipeline manager did not start in {0}".format(self.folder_out))
+            return
+        with self._lock:
+            if self._stop.is_set():
+                return
+            log.info("Starting {0} psom workers".format(self.n_workers))
+            for num in range(1, self.n_workers + 1):
+                self._start_worker(num)
+                self.restarts[num] = 0
+
+        while not self._stop.wait(MONITOR_PERIOD):
+            with self._lock:
+                if self._stop.is_set() or not self.workers:
+                    return
+                self._check_workers()
+
+    def _check_workers(self):
+        """
+        Forget the workers that are done and restart the ones that crashed, with self._lock held
+        """
+        for num, p in list(self.workers.items()):
+            returncode = p.poll()
+            if returncode is None:
+                continue
+            if returncode == 0:
+                # The worker is done with the pipeline
+                del self.workers[num]
+                continue
+            if self.restarts[num] < self.max_restart:
+                self.restarts[num] += 1
+                log.warning("psom worker {0} exited with status {1}, restart {2}/{3}"
+                            .format(num, returncode, self.restarts[num], self.max_restart))
+                self._start_worker(num)
+            else:
+                log.error("psom worker {0} exited with status {1}, giving up".format(num, returncode))
+                del self.workers[num]
+
+    def join(self):
+        """
+        Block until all workers are done
+        """
+        while self._monitor is not None and self._monitor.is_alive():
+            self._monitor.join(MONITOR_PERIOD)
+
+    def stop(self, grace=10):
+        """
+        Stop the monitoring and the workers, first with SIGTERM then SIGKILL
+        after grace seconds
+        """
+        self._stop.set()
+        if self._monitor is not None:
+            # The monitor returns within STOP_PERIOD if it still waits for the pipeline manager
+            self._monitor.join(grace)
+        # Even if the join timed out, the monitor leaves the workers alone from now on
+        with self._lock:
+            running = list(self.workers.values())
+            self.workers = {}
+        for p in running:
+            if p.poll() is None:
+                try:
+                    p.terminate()
+                except OSError:
+                    pass
+        deadline = time.time() + grace
+        for p in running:
+            while p.poll() is None and time.time() < deadline:
+                time.sleep(0.1)
+            if p.poll() is None:
+                kill_tree(p)
+                p.wait()
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description="Start psom workers on a pipeline folder")
+    parser.add_argument("-d", "--folder_out", required=True, help="The pipeline output folder")
+    parser.add_argument("-n", "--n_workers", type=int, default=0,
+                        help="Number of workers, 0 uses all the cores the memory allows")
+    parsed = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    pool = WorkerPool(parsed.folder_out, n_workers=parsed.n_workers)
+    pool.start()
+    try:
+        pool.join()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        pool.stop()
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The pyniak package lives in util, next to the tests
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
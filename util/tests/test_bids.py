@@ -0,0 +1,133 @@
+import os
+
+from pyniak import bids
+from pyniak import bids_cache
+from pyniak import shards
+
+BIDS_APP = os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "bin", "bids_app.py")
+
+
+def load_bids_app():
+    import importlib.machinery
+    import importlib.util
+    loader = importlib.machinery.SourceFileLoader("bids_app", BIDS_APP)
+    module = importlib.util.module_from_spec(importlib.util.spec_from_loader("bids_app", loader))
+    loader.exec_module(module)
+    return module
+
+
+def touch(root, *names):
+    for name in names:
+        path = os.path.join(str(root), name)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        open(path, "w").close()
+
+
+def fake_dataset(root):
+    touch(root, "dataset_description.json",
+          # No session, two runs and two anatomical scans
+          "sub-01/anat/sub-01_T1w.nii.gz",
+          "sub-01/anat/sub-01_acq-mprage_T2w.nii.gz",
+          "sub-01/func/sub-01_task-rest_run-1_bold.nii.gz",
+          "sub-01/func/sub-01_task-rest_run-2_bold.nii.gz",
+          "sub-01/func/sub-01_task-motor_bold.nii.gz",
+          # Two sessions
+          "sub-02/ses-1/anat/sub-02_ses-1_T1w.nii.gz",
+          "sub-02/ses-1/func/sub-02_ses-1_task-rest_bold.nii.gz",
+          "sub-02/ses-2/anat/sub-02_ses-2_T1w.nii.gz",
+          "sub-02/ses-2/func/sub-02_ses-2_task-rest_run-1_bold.nii.gz",
+          # No anat
+          "sub-03/func/sub-03_task-rest_bold.nii.gz")
+    return str(root)
+
+
+def test_func_hint(tmpdir):
+    path = fake_dataset(tmpdir)
+    files = bids.grab_bids(path, func_hint="rest")
+    assert list(files["sub01"]["fmri"]["sess1"]) == ["taskrestrun1", "taskrestrun2"]
+    assert files["sub01"]["fmri"]["sess1"]["taskrestrun2"] == \
+        os.path.join(path, "sub-01", "func", "sub-01_task-rest_run-2_bold.nii.gz")
+
+    files = bids.grab_bids(path, func_hint="motor")
+    assert list(files) == ["sub01"]
+    assert list(files["sub01"]["fmri"]["sess1"]) == ["taskrest"]
+
+
+def test_anat_hint(tmpdir):
+    path = fake_dataset(tmpdir)
+    assert bids.grab_bids(path)["sub01"]["anat"].endswith("sub-01_T1w.nii.gz")
+    files = bids.grab_bids(path, anat_hint="T2w")
+    assert files["sub01"]["anat"].endswith("sub-01_acq-mprage_T2w.nii.gz")
+    # sub-02 has no T2w scan
+    assert list(files) == ["sub01"]
+
+
+def test_sessions(tmpdir):
+    path = fake_dataset(tmpdir)
+    fmri = bids.grab_bids(path)["sub02"]["fmri"]
+    assert list(fmri) == ["sess1", "sess2"]
+    assert list(fmri["sess1"]) == ["taskrest"]
+    assert list(fmri["sess2"]) == ["taskrestrun1"]
+    # As in niak_grab_bids, the anat of the last session is kept
+    assert bids.grab_bids(path)["sub02"]["anat"] == \
+        os.path.join(path, "sub-02", "ses-2", "anat", "sub-02_ses-2_T1w.nii.gz")
+
+
+def test_missing_anat(tmpdir):
+    path = fake_dataset(tmpdir)
+    assert list(bids.grab_bids(path)) == ["sub01", "sub02"]
+    assert bids.grab_bids(path, subjects=[3]) == {}
+
+
+def test_subjects(tmpdir):
+    path = fake_dataset(tmpdir)
+    assert list(bids.grab_bids(path, subjects=[2])) == ["sub02"]
+
+
+def test_shard_hints(tmpdir):
+    path = fake_dataset(tmpdir)
+    assert [labels for labels, _ in shards.dataset_shards(path, 2)] == [["01"], ["02"]]
+    # Only sub-01 has a motor run, and only one
+    assert shards.dataset_shards(path, 2, func_hint="motor") == [(["01"], 1), ([], 0)]
+    assert [labels for labels, _ in shards.dataset_shards(path, 2, anat_hint="T2w")] == [["01"], []]
+
+
+def test_saved_shards(tmpdir):
+    path = fake_dataset(tmpdir.mkdir("bids"))
+    shard_file = shards.shard_file(str(tmpdir.join("out")))
+    key = shards.shard_key(path, 2)
+    assert shards.load_shards(shard_file, key) is None
+    all_shards = shards.dataset_shards(path, 2)
+    shards.save_shards(shard_file, key, all_shards)
+    assert shards.load_shards(shard_file, key) == all_shards
+    # Shards saved for another split are not reused
+    assert shards.load_shards(shard_file, shards.shard_key(path, 3)) is None
+    assert shards.load_shards(shard_file, shards.shard_key(path, 2, func_hint="motor")) is None
+
+
+def test_shard_command():
+    bids_app = load_bids_app()
+    cmd = bids_app.shard_command(["--emit_array", "4", "/data", "/out", "participant", "--n_thread", "2"],
+                                 ["01", "02"]).split()
+    assert cmd[1:] == ["/data", "/out", "participant", "--n_thread", "2", "--participant_label", "01", "02"]
+    cmd = bids_app.shard_command(["/data", "/out", "participant", "--participant_label", "1", "2",
+                                  "--emit_array=4", "--n_thread", "2"], ["01"], 2).split()
+    assert cmd[1:] == ["/data", "/out", "participant", "--n_thread", "2", "--participant_label", "01"]
+
+
+def test_cache(tmpdir):
+    path = fake_dataset(tmpdir.mkdir("bids"))
+    cache = bids_cache.LayoutCache(str(tmpdir.join("layout.sqlite")))
+    try:
+        first = bids.grab_bids(path, cache=cache)
+        second = bids.grab_bids(path, cache=cache)
+    finally:
+        cache.close()
+    assert first == second == bids.grab_bids(path)
+    assert cache.hit > 0
+
+
+def test_to_octave():
+    cmd = bids.to_octave({"sub01": {"anat": "/data/it's.nii"}})
+    assert cmd == ["files_in = struct()", "files_in.sub01.anat = '/data/it''s.nii'"]
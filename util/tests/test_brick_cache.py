@@ -0,0 +1,59 @@
+import os
+import time
+
+from pyniak import brick_cache
+
+
+def add_entry(path_cache, key, size, age, complete=True):
+    """
+    A cache entry of size bytes, last used age seconds ago
+    """
+    path = os.path.join(path_cache, key[:2], key)
+    os.makedirs(path)
+    with open(os.path.join(path, "out.mnc"), "wb") as fp:
+        fp.write(b"\x00" * size)
+    if complete:
+        open(os.path.join(path, brick_cache.MANIFEST), "w").close()
+    used = time.time() - age
+    os.utime(path, (used, used))
+    return path
+
+
+def test_evict_least_recent(tmpdir):
+    path_cache = str(tmpdir)
+    old = add_entry(path_cache, "aa01", 1000, 300)
+    mid = add_entry(path_cache, "ab02", 1000, 200)
+    new = add_entry(path_cache, "aa03", 1000, 100)
+    assert [path for _, _, path in brick_cache.entries(path_cache)] == [old, mid, new]
+    assert brick_cache.evict(path_cache, 2500) == 1000
+    assert not os.path.exists(old)
+    assert os.path.exists(mid) and os.path.exists(new)
+    # Under the limit, nothing is removed
+    assert brick_cache.evict(path_cache, 2500) == 0
+    assert brick_cache.evict(path_cache, 0) == 2000
+    assert brick_cache.entries(path_cache) == []
+
+
+def test_partial_entries(tmpdir):
+    path_cache = str(tmpdir)
+    running = add_entry(path_cache, "aa01.tmp123", 1000, 60, complete=False)
+    dead = add_entry(path_cache, "aa02.tmp456", 1000, brick_cache.STALE_TMP + 60, complete=False)
+    no_manifest = add_entry(path_cache, "aa03", 1000, 60, complete=False)
+    assert brick_cache.entries(path_cache) == []
+    assert brick_cache.evict(path_cache, 0) == 0
+    assert os.path.exists(running) and os.path.exists(no_manifest)
+    assert not os.path.exists(dead)
+
+
+def test_old_digests(tmpdir):
+    digests = tmpdir.mkdir(brick_cache.DIGESTS).mkdir("ab")
+    old = digests.join("old.mat")
+    old.write("")
+    recent = digests.join("recent.mat")
+    recent.write("")
+    used = time.time() - brick_cache.DIGEST_AGE - 60
+    os.utime(str(old), (used, used))
+    add_entry(str(tmpdir), "aa01", 10, 0)
+    # The digests are not entries, and do not count in the size of the cache
+    assert brick_cache.evict(str(tmpdir), 10) == 0
+    assert not old.exists() and recent.exists()
@@ -0,0 +1,116 @@
+import gzip
+import os
+import subprocess
+
+import numpy as np
+import pytest
+import scipy.io
+
+from pyniak import volume
+
+h5py = pytest.importorskip("h5py")
+from pyniak import connectome
+
+try:
+    from distutils.spawn import find_executable
+except ImportError:
+    from shutil import which as find_executable
+
+NIAK = os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "..")
+
+
+def write_nifti(file_name, vol):
+    """
+    A float32 nifti-1 file with an identity voxel to world transformation
+    """
+    details = np.zeros(1, dtype=volume.NIFTI_HEADER)[0]
+    details["sizeof_hdr"] = volume.NIFTI_HEADER_SIZE
+    details["dim"][:vol.ndim + 1] = (vol.ndim,) + vol.shape
+    details["datatype"] = 16
+    details["bitpix"] = 32
+    details["pixdim"][:5] = 1
+    details["vox_offset"] = 352
+    details["scl_slope"] = 1
+    details["sform_code"] = 1
+    details["srow_x"] = [1, 0, 0, 0]
+    details["srow_y"] = [0, 1, 0, 0]
+    details["srow_z"] = [0, 0, 1, 0]
+    details["magic"] = b"n+1"
+    with open(file_name, "wb") as fp:
+        fp.write(details.tobytes())
+        fp.write(b"\x00" * 4)
+        fp.write(np.asarray(vol, dtype=np.float32).tobytes(order="F"))
+
+
+def one_subject(tmpdir):
+    """
+    A run of 20 volumes, the last 5 scrubbed, and a parcellation of 3 regions
+    """
+    rng = np.random.RandomState(0)
+    file_fmri = str(tmpdir.join("fmri_sub01.nii"))
+    file_mask = str(tmpdir.join("mask.nii"))
+    write_nifti(file_fmri, rng.randn(4, 4, 2, 20))
+    mask_scrubbing = np.zeros((20, 1), dtype=bool)
+    mask_scrubbing[15:] = True
+    scipy.io.savemat(str(tmpdir.join("fmri_sub01_extra.mat")), {"mask_scrubbing": mask_scrubbing})
+    mask = np.zeros((4, 4, 2))
+    mask[:2, :, 0] = 1
+    mask[2:, :, 0] = 2
+    mask[:, :2, 1] = 5
+    write_nifti(file_mask, mask)
+    return file_fmri, file_mask
+
+
+def test_scrubbing(tmpdir):
+    file_fmri, file_mask = one_subject(tmpdir)
+    parcellation = connectome.Parcellation(file_mask)
+    assert connectome.read_run(parcellation, file_fmri).shape == (len(parcellation.voxels), 15)
+    _, vol = volume.read_vol(file_fmri)
+    conn = connectome.subject_connectome(parcellation, [file_fmri], "R")
+    labels = np.rint(volume.read_vol(file_mask)[1]).astype(int)
+    tseries = np.column_stack([vol[labels == l][:, :15].mean(axis=0) for l in (1, 2, 5)])
+    corr = np.corrcoef(tseries.T)
+    assert np.allclose(conn, [corr[1, 0], corr[2, 0], corr[2, 1]], atol=1e-5)
+
+
+@pytest.mark.skipif(find_executable("octave") is None, reason="octave is not installed")
+@pytest.mark.parametrize("conn_type", connectome.TYPES)
+def test_same_as_brick(tmpdir, conn_type):
+    file_fmri, file_mask = one_subject(tmpdir)
+    file_brick = str(tmpdir.join("brick.mat"))
+    file_batch = str(tmpdir.join("batch.h5"))
+    subprocess.check_call(["octave", "--eval",
+                           "addpath(genpath('{0}')); niak_brick_connectome(struct('fmri', '{1}', 'mask', '{2}'), "
+                           "'{3}', struct('type', '{4}', 'flag_verbose', false))"
+                           .format(NIAK, file_fmri, file_mask, file_brick, conn_type)])
+    connectome.batch({"sub01": [file_fmri]}, file_mask, file_batch, conn_type=conn_type, n_threads=1)
+    brick = scipy.io.loadmat(file_brick)
+    with h5py.File(file_batch, "r") as h5:
+        assert np.array_equal(h5["ind_roi"][()], brick["ind_roi"].ravel())
+        assert np.allclose(h5["conn"][0], brick["conn"].ravel(), rtol=1e-4, atol=1e-5)
+
+
+def test_minc1_rejected(tmpdir):
+    file_fmri, file_mask = one_subject(tmpdir)
+    file_minc1 = str(tmpdir.join("fmri_sub02.mnc.gz"))
+    with gzip.open(file_minc1, "wb") as fz:
+        fz.write(b"CDF\x01")
+    file_batch = str(tmpdir.join("batch.h5"))
+    with pytest.raises(volume.UnsupportedFormat):
+        connectome.batch({"sub01": [file_fmri], "sub02": [file_minc1]}, file_mask, file_batch, n_threads=1)
+    assert not os.path.exists(file_batch)
+
+
+@pytest.mark.skipif(find_executable("octave") is None, reason="octave is not installed")
+def test_batch_brick(tmpdir):
+    file_fmri, file_mask = one_subject(tmpdir)
+    file_batch = str(tmpdir.join("batch.h5"))
+    subprocess.check_call(["octave", "--eval",
+                           "addpath(genpath('{0}')); niak_brick_connectome_batch(struct('fmri', "
+                           "struct('sub01', struct('sess1', struct('rest', '{1}'))), 'mask', '{2}'), "
+                           "'{3}', struct('type', 'R', 'nb_threads', 1, 'flag_verbose', false))"
+                           .format(NIAK, file_fmri, file_mask, file_batch)])
+    parcellation = connectome.Parcellation(file_mask)
+    with h5py.File(file_batch, "r") as h5:
+        assert h5["subjects"][()].tolist() == [b"sub01"]
+        assert np.allclose(h5["conn"][0], connectome.subject_connectome(parcellation, [file_fmri], "R"))
@@ -0,0 +1,43 @@
+import os
+
+from pyniak import octave_path
+
+
+def niak_tree(root, version="v1.1.2"):
+    """
+    A niak root with octave code in some of its folders
+    """
+    files = ["commands/misc/niak_gb_vars.m", "commands/read_write/niak_read_vol.m",
+             "commands/read_write/private/sub.m", "bricks/@class/method.m", "extensions/lib/f.mexa64",
+             "reports/fmri/niak_report.m", "reports/fmri/templates/index.m", "template/mask.m",
+             "util/pyniak/x.m", "demos/niak_demo.m", "html/style.css"]
+    for name in files:
+        path = root.join(*name.split("/"))
+        path.ensure()
+    root.join("commands", "misc", "niak_gb_vars.m").write("GB_NIAK.version = '{0}';\n".format(version))
+
+
+def test_search_path(tmpdir):
+    niak_tree(tmpdir)
+    path = [os.path.relpath(p, str(tmpdir)) for p in octave_path.search_path(str(tmpdir))]
+    assert path == ["commands/misc", "commands/read_write", "extensions/lib", "reports/fmri"]
+
+
+def test_path_file(tmpdir):
+    niak_tree(tmpdir)
+    p_file = octave_path.path_file(str(tmpdir))
+    lines = open(p_file).read().splitlines()
+    assert lines[0] == octave_path.HEADER.format("v1.1.2")
+    assert lines[1].startswith("addpath('") and len(lines[1].split(os.pathsep)) == 4
+
+    # Kept while the niak version does not change
+    open(p_file, "a").write("% kept\n")
+    octave_path.path_file(str(tmpdir))
+    assert open(p_file).read().endswith("% kept\n")
+    niak_tree(tmpdir, version="v1.1.3")
+    octave_path.path_file(str(tmpdir))
+    assert open(p_file).readline().strip() == octave_path.HEADER.format("v1.1.3")
+
+
+def test_unknown_version(tmpdir):
+    assert octave_path.niak_version(str(tmpdir)) == "unknown"
@@ -0,0 +1,56 @@
+import os
+
+import pytest
+
+from pyniak import octave_pool
+
+try:
+    from distutils.spawn import find_executable
+except ImportError:
+    from shutil import which as find_executable
+
+NIAK_OCTAVE = os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "bin", "niak_octave")
+
+
+def load_niak_octave():
+    import importlib.machinery
+    import importlib.util
+    loader = importlib.machinery.SourceFileLoader("niak_octave", NIAK_OCTAVE)
+    module = importlib.util.module_from_spec(importlib.util.spec_from_loader("niak_octave", loader))
+    loader.exec_module(module)
+    return module
+
+
+def test_strip_exit():
+    # The way psom ends the --eval string of its jobs
+    assert octave_pool.strip_exit("psom_run_job('/tmp/job.mat'),exit") == "psom_run_job('/tmp/job.mat')"
+    assert octave_pool.strip_exit("a = 1; quit;\n") == "a = 1"
+    assert octave_pool.strip_exit("a = 1; exit(0)") == "a = 1"
+    assert octave_pool.strip_exit("a = 1; exit()") == "a = 1"
+    # A failure status, or a variable named like exit, is not a trailing exit
+    assert octave_pool.strip_exit("a = 1; exit(1)") == "a = 1; exit(1)"
+    assert octave_pool.strip_exit("my_exit") == "my_exit"
+
+
+@pytest.mark.skipif(find_executable("octave") is None, reason="octave is not installed")
+def test_same_interpreter(tmpdir, monkeypatch, capsys):
+    socket_path = str(tmpdir.join("pool.sock"))
+    server = octave_pool.OctavePoolServer(socket_path, octave_pool.OctavePool(size=1))
+    server.start()
+    try:
+        monkeypatch.setenv("NIAK_OCTAVE_POOL", socket_path)
+        monkeypatch.chdir(str(tmpdir))
+        niak_octave = load_niak_octave()
+        cmd = "global g; g = 1; fprintf('%d %s\\n', getpid(), pwd()), exit"
+        pids = []
+        for _ in range(2):
+            assert niak_octave.main(["--eval", cmd]) == 0
+            pid, cwd = capsys.readouterr().out.split()
+            pids.append(pid)
+            assert os.path.realpath(cwd) == os.path.realpath(str(tmpdir))
+        # The exit was not forwarded, both jobs ran in the same octave
+        assert pids[0] == pids[1]
+        assert niak_octave.main(["--eval", "global g; fprintf('%d\\n', isempty(g))"]) == 0
+        assert capsys.readouterr().out.split() == ["1"]
+    finally:
+        server.stop()
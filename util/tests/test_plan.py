@@ -0,0 +1,93 @@
+import json
+import os
+import shutil
+import subprocess
+
+import pytest
+import scipy.io
+
+from pyniak import plan
+from pyniak import psom_status
+
+try:
+    from distutils.spawn import find_executable
+except ImportError:
+    from shutil import which as find_executable
+
+NIAK = os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "..")
+
+
+def participant_run(root, name="sub01"):
+    """
+    The working folder of a participant run with one finished job, which
+    wrote 1000 bytes
+    """
+    src = os.path.join(str(root), name)
+    os.makedirs(os.path.join(src, "logs"))
+    os.makedirs(os.path.join(src, "anat"))
+    files_out = os.path.join(src, "anat", "t1_sub01.mnc")
+    with open(files_out, "wb") as fp:
+        fp.write(b"0" * 1000)
+    scipy.io.savemat(os.path.join(src, "logs", psom_status.STATUS_FILE), {"t1_preprocess_sub01": "finished"})
+    scipy.io.savemat(os.path.join(src, "logs", psom_status.JOBS_FILE),
+                     {"t1_preprocess_sub01": {"command": "", "files_out": files_out}})
+    scipy.io.savemat(os.path.join(src, "logs", psom_status.PROFILE_FILE),
+                     {"t1_preprocess_sub01": {"elapsed_time": 120.}})
+    return src
+
+
+def test_shard_profile(tmpdir):
+    dest = str(tmpdir.join("final"))
+    psom_status.write_shard(participant_run(tmpdir), dest)
+    pairs = psom_status.shards(dest)
+    assert len(pairs) == 1
+    assert psom_status.profile_shard(pairs[0][0]) is not None
+    assert psom_status.compact(dest) == 1
+    assert os.listdir(os.path.join(dest, "logs", psom_status.SHARD_DIR)) == []
+    profile = psom_status.load(os.path.join(dest, "logs", psom_status.PROFILE_FILE))
+    assert profile["t1_preprocess_sub01"]["elapsed_time"].flat[0] == 120.
+
+
+def ship(src, dest):
+    """
+    Move the outputs of src to dest, as rsync --remove-source-files does
+    """
+    os.makedirs(os.path.join(dest, "anat"))
+    os.rename(os.path.join(src, "anat", "t1_sub01.mnc"), os.path.join(dest, "anat", "t1_sub01.mnc"))
+
+
+def test_shard_sizes(tmpdir):
+    dest = str(tmpdir.join("final"))
+    src = participant_run(tmpdir)
+    ship(src, dest)
+    psom_status.write_shard(src, dest)
+    # The working folder is removed once the outputs are shipped
+    shutil.rmtree(src)
+    assert psom_status.compact(dest) == 1
+    sizes = psom_status.load(os.path.join(dest, "logs", psom_status.SIZES_FILE))
+    assert sizes["t1_preprocess_sub01"].flat[0] == 1000
+    assert os.listdir(os.path.join(dest, "logs", psom_status.SHARD_DIR)) == []
+    history = [{"name": "t1_preprocess_sub01", "bytes_out": 1000,
+                "files_out": os.path.join(src, "anat", "t1_sub01.mnc")}]
+    assert plan.stage_history(history)["t1_preprocess"]["bytes"] == 1000
+
+
+@pytest.mark.skipif(find_executable("octave") is None, reason="octave is not installed")
+def test_plan_with_shard(tmpdir):
+    dest = str(tmpdir.join("final"))
+    src = participant_run(tmpdir)
+    ship(src, dest)
+    psom_status.write_shard(src, dest)
+    shutil.rmtree(src)
+    file_plan = str(tmpdir.join("plan.json"))
+    pipeline = "struct('t1_preprocess_sub02', struct('command', '', 'files_out', 'a.mnc'))"
+    subprocess.check_call(["octave", "--eval", "addpath(genpath({0})); niak_plan_pipeline({1}, {2}, {3})".format(
+        plan.octave_string(NIAK), pipeline, plan.octave_string(file_plan), plan.octave_string(dest))])
+    with open(file_plan) as fp:
+        history = plan.as_list(json.load(fp)["history"])
+    assert [job["name"] for job in history] == ["t1_preprocess_sub01"]
+    assert history[0]["elapsed_time"] == 120
+    assert history[0]["bytes_out"] == 1000
+    summary = plan.summarize({"jobs": [{"name": "t1_preprocess_sub02"}], "history": history})["summary"]
+    assert summary["cpu_time"] == 120
+    assert summary["bytes"] == 1000
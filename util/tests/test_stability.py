@@ -0,0 +1,57 @@
+import os
+import subprocess
+
+import numpy as np
+import pytest
+import scipy.io
+
+from pyniak import stability
+
+try:
+    from distutils.spawn import find_executable
+except ImportError:
+    from shutil import which as find_executable
+
+NIAK = os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "..")
+
+# The stability of niak_stability_tseries for three_networks, at 1 and 3 clusters,
+# in the order of niak_mat2vec: only the pairs (2,1), (4,3) and (6,5) are together at 3 clusters
+EXPECTED = np.column_stack([np.ones(15), [1, 0, 0, 0, 0, 0, 0, 0, 0, 1, 0, 0, 0, 0, 1]])
+
+
+def three_networks():
+    """
+    40 time points of 6 regions, two noisy copies of each of 3 independent signals
+    """
+    rng = np.random.RandomState(0)
+    signals = rng.randn(40, 3)
+    return np.repeat(signals, 2, axis=1) + 0.05 * rng.randn(40, 6)
+
+
+@pytest.mark.parametrize("sampling", stability.SAMPLING)
+def test_fixed_stability(sampling):
+    stab = stability.stability(three_networks(), [1, 3], n_samps=20, sampling=sampling, seed=1)
+    assert np.array_equal(stab, EXPECTED)
+
+
+def test_seed_not_workers():
+    tseries = np.random.RandomState(2).randn(30, 8)
+    stab = stability.stability(tseries, [2, 3], n_samps=25, seed=3)
+    assert np.array_equal(stab, stability.stability(tseries, [2, 3], n_samps=25, seed=3, n_workers=2))
+    assert stab.shape == (28, 2)
+    assert np.allclose(stab * 25, np.rint(stab * 25))
+
+
+@pytest.mark.skipif(find_executable("octave") is None, reason="octave is not installed")
+@pytest.mark.parametrize("engine", ("octave", "python"))
+def test_same_as_octave(tmpdir, engine):
+    file_in = str(tmpdir.join("tseries.mat"))
+    file_out = str(tmpdir.join("stab.mat"))
+    scipy.io.savemat(file_in, {"tseries": three_networks()})
+    subprocess.check_call(["octave", "--eval",
+                           "addpath(genpath('{0}')); load('{1}'); "
+                           "stab = niak_stability_tseries(tseries, struct('nb_classes', [1 3], 'nb_samps', 5, "
+                           "'sampling', struct('type', 'jacknife', 'opt', struct('perc', 100)), "
+                           "'engine', '{2}', 'flag_verbose', false)); save('-mat7-binary', '{3}', 'stab')"
+                           .format(NIAK, file_in, engine, file_out)])
+    assert np.allclose(scipy.io.loadmat(file_out)["stab"], EXPECTED)
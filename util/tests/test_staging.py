@@ -0,0 +1,71 @@
+import os
+
+from pyniak import staging
+
+
+def dataset(tmpdir):
+    data = tmpdir.mkdir("data")
+    data.join("sub-01", "anat", "T1w.nii.gz").write("t1", ensure=True)
+    data.join("sub-01", "func", "bold.nii.gz").write("bold", ensure=True)
+    files_in = {"sub01": {"fmri": {"sess1": {"rest": str(data.join("sub-01", "func", "bold.nii.gz"))}},
+                          "anat": str(data.join("sub-01", "anat", "T1w.nii.gz"))}}
+    return str(data), files_in
+
+
+def test_stage(tmpdir):
+    path_data, files_in = dataset(tmpdir)
+    dest = str(tmpdir.join("scratch"))
+    prefetch = staging.Prefetch(path_data, dest)
+    staged = prefetch.stage(files_in)
+    assert staged["sub01"]["anat"] == os.path.join(dest, "sub-01", "anat", "T1w.nii.gz")
+    # The anatomical scans are copied first
+    assert list(prefetch.staged)[0] == files_in["sub01"]["anat"]
+
+    prefetch.start()
+    prefetch.join()
+    for source, target in prefetch.staged.items():
+        assert not os.path.islink(target)
+        assert open(target).read() == open(source).read()
+    prefetch.cleanup()
+    assert not os.path.exists(dest)
+
+
+def test_outside_dataset(tmpdir):
+    path_data, _ = dataset(tmpdir)
+    prefetch = staging.Prefetch(path_data, str(tmpdir.join("scratch")))
+    source = str(tmpdir.join("mask.nii"))
+    assert prefetch.local_path(source) == os.path.join(str(tmpdir.join("scratch")), source.lstrip(os.sep))
+
+
+def test_failed_copy(tmpdir):
+    path_data, files_in = dataset(tmpdir)
+    prefetch = staging.Prefetch(path_data, str(tmpdir.join("scratch")))
+    staged = prefetch.stage(files_in)
+    os.remove(files_in["sub01"]["anat"])
+    prefetch.start()
+    prefetch.join()
+    # The input stays a link to the shared file system
+    assert os.path.islink(staged["sub01"]["anat"])
+    assert not os.path.exists(staged["sub01"]["anat"] + ".staging")
+    assert open(staged["sub01"]["fmri"]["sess1"]["rest"]).read() == "bold"
+
+
+def test_resume(tmpdir):
+    path_data, files_in = dataset(tmpdir)
+    dest = str(tmpdir.join("scratch"))
+    prefetch = staging.Prefetch(path_data, dest)
+    staged = prefetch.stage(files_in)
+    prefetch.start()
+    prefetch.join()
+    prefetch.cleanup(keep=True)
+    local = staged["sub01"]["anat"]
+    assert os.path.exists(local) and not os.path.islink(local)
+
+    # The next launch keeps the copies of the previous one
+    with open(local, "w") as fp:
+        fp.write("local")
+    prefetch = staging.Prefetch(path_data, dest)
+    prefetch.stage(files_in)
+    prefetch.start()
+    prefetch.join()
+    assert open(local).read() == "local"
@@ -0,0 +1,71 @@
+import os
+
+import scipy.io
+
+from pyniak import sync
+
+
+def write(path, content="x"):
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    with open(path, "w") as fp:
+        fp.write(content)
+
+
+def fake_pipeline(src):
+    logs = os.path.join(src, "logs")
+    os.makedirs(logs)
+    write(os.path.join(src, "anat", "a.nii.gz"))
+    write(os.path.join(src, "fmri", "b.nii.gz"))
+    write(os.path.join(src, "fmri", "c.nii.gz"))
+    scipy.io.savemat(os.path.join(logs, "PIPE_status.mat"),
+                     {"anat": "finished", "fmri": "running"})
+    scipy.io.savemat(os.path.join(logs, "PIPE_jobs.mat"), {
+        "anat": {"command": "", "files_out": {"t1": os.path.join(src, "anat", "a.nii.gz")}},
+        "fmri": {"command": "", "files_out": [os.path.join(src, "fmri", "b.nii.gz")]}})
+
+
+def test_ship_finished_jobs(tmpdir):
+    src = str(tmpdir.join("work"))
+    dest = str(tmpdir.join("final"))
+    fake_pipeline(src)
+    streaming = sync.StreamingSync(src, dest, n_threads=2)
+    for result in streaming.scan():
+        result.wait()
+    # Only the outputs of the finished job are shipped during the run
+    assert os.path.exists(os.path.join(dest, "anat", "a.nii.gz"))
+    assert not os.path.exists(os.path.join(dest, "fmri", "b.nii.gz"))
+    # The logs did not change, they are not read again
+    assert streaming.scan() == []
+    streaming.finish()
+    for f in ("anat/a.nii.gz", "fmri/b.nii.gz", "fmri/c.nii.gz"):
+        assert os.path.exists(os.path.join(dest, f))
+        assert not os.path.exists(os.path.join(src, f))
+    assert not os.path.exists(os.path.join(dest, "logs"))
+
+
+def test_same_content(tmpdir):
+    src = str(tmpdir.join("a"))
+    dest = str(tmpdir.join("b"))
+    write(src, "abc")
+    assert not sync.same_content(src, dest)
+    assert sync.copy_file(src, dest)
+    assert sync.same_content(src, dest)
+    assert not sync.copy_file(src, dest)
+    # Same size, other mtime and content
+    write(src, "abd")
+    os.utime(src, (0, 0))
+    assert not sync.same_content(src, dest)
+
+
+def test_failed_copies(tmpdir):
+    src = str(tmpdir.join("work"))
+    dest = str(tmpdir.join("final"))
+    fake_pipeline(src)
+    # The folder of the outputs can not be created
+    write(os.path.join(dest, "fmri"))
+    streaming = sync.StreamingSync(src, dest, n_threads=2)
+    assert streaming.finish() == [os.path.join("fmri", "b.nii.gz"), os.path.join("fmri", "c.nii.gz")]
+    # Only the files that were shipped are removed
+    assert not os.path.exists(os.path.join(src, "anat", "a.nii.gz"))
+    assert os.path.exists(os.path.join(src, "fmri", "b.nii.gz"))
@@ -0,0 +1,63 @@
+import gzip
+
+import numpy as np
+import pytest
+
+from pyniak import volume
+
+h5py = pytest.importorskip("h5py")
+
+
+def write_minc2(file_name, vol, steps=(2., 3., 4.), starts=(-10., -20., -30.), cosines=None):
+    """
+    A small MINC2 file, vol is indexed (x, y, z) and stored z first, like mincreshape does
+    """
+    with h5py.File(file_name, 'w') as h5:
+        image = h5.create_dataset("minc-2.0/image/0/image", data=vol.transpose().astype(np.float32))
+        image.attrs["dimorder"] = np.bytes_("zspace,yspace,xspace")
+        for num, name in enumerate(("xspace", "yspace", "zspace")):
+            dim = h5.create_dataset("minc-2.0/dimensions/{0}".format(name), data=0)
+            dim.attrs["step"] = steps[num]
+            dim.attrs["start"] = starts[num]
+            if cosines is not None:
+                dim.attrs["direction_cosines"] = cosines[num]
+
+
+def test_read_minc2(tmpdir):
+    file_name = str(tmpdir.join("vol.mnc"))
+    vol = np.arange(24, dtype=np.float32).reshape((2, 3, 4))
+    write_minc2(file_name, vol)
+    hdr, read = volume.read_vol(file_name)
+    assert np.array_equal(read, vol)
+    assert hdr["info"]["dimensions"] == [2, 3, 4]
+    assert hdr["info"]["voxel_size"] == [2., 3., 4.]
+    # Without direction_cosines, each dimension follows its own axis
+    assert np.array_equal(hdr["info"]["mat"], [[2, 0, 0, -10], [0, 3, 0, -20], [0, 0, 4, -30], [0, 0, 0, 1]])
+
+
+def test_minc2_cosines(tmpdir):
+    file_name = str(tmpdir.join("vol.mnc"))
+    write_minc2(file_name, np.zeros((2, 3, 4)), cosines=([0, 1, 0], [1, 0, 0], [0, 0, 1]))
+    hdr, _ = volume.read_vol(file_name, read_data=False)
+    assert np.array_equal(hdr["info"]["mat"][:3, :3], [[0, 3, 0], [2, 0, 0], [0, 0, 4]])
+
+
+def test_read_minc2_gz(tmpdir):
+    file_name = str(tmpdir.join("vol.mnc"))
+    vol = np.arange(24, dtype=np.float32).reshape((2, 3, 4))
+    write_minc2(file_name, vol)
+    with open(file_name, 'rb') as fp, gzip.open(file_name + ".gz", 'wb') as fz:
+        fz.write(fp.read())
+    tmpdir.join("vol_extra.mat").write("")
+    hdr, read = volume.read_vol(file_name + ".gz")
+    assert np.array_equal(read, vol)
+    assert hdr["info"]["voxel_size"] == [2., 3., 4.]
+    assert hdr["file_extra"] == str(tmpdir.join("vol_extra.mat"))
+
+
+def test_read_minc1(tmpdir):
+    file_name = str(tmpdir.join("vol.mnc.gz"))
+    with gzip.open(file_name, 'wb') as fz:
+        fz.write(b"CDF\x01")
+    with pytest.raises(volume.UnsupportedFormat):
+        volume.read_vol(file_name)
@@ -0,0 +1,38 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from pyniak import workdir
+
+UTIL = os.path.join(os.path.dirname(os.path.realpath(__file__)), "..")
+
+
+def hold_lock(path):
+    """
+    Lock path from another process, fcntl locks do not conflict within a process
+    """
+    script = ("import sys; sys.path.insert(0, {0!r}); from pyniak import workdir; "
+              "l = workdir.lock({1!r}); print('locked'); sys.stdout.flush(); sys.stdin.read()".format(UTIL, path))
+    holder = subprocess.Popen([sys.executable, "-c", script], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    assert holder.stdout.readline().strip() == b"locked"
+    return holder
+
+
+def test_prepare_in_use(tmpdir):
+    path = workdir.work_dir(str(tmpdir), [1, 2])
+    workdir.prepare(path).close()
+    open(os.path.join(path, "result.nii"), "w").close()
+    holder = hold_lock(path)
+    try:
+        with pytest.raises(workdir.FolderInUse):
+            workdir.prepare(path)
+        # The folder of a live run is not garbage collected
+        os.utime(path, (0, 0))
+        assert workdir.collect_garbage(str(tmpdir), max_age=1) == []
+    finally:
+        holder.communicate()
+    assert os.path.exists(os.path.join(path, "result.nii"))
+    workdir.prepare(path).close()
+    assert os.listdir(path) == []
@@ -0,0 +1,57 @@
+import os
+import threading
+import time
+
+import pytest
+
+from pyniak import workers
+
+
+@pytest.fixture(params=["inotify", "polling"])
+def inotify(request, monkeypatch):
+    if request.param == "polling":
+        monkeypatch.setattr(workers, "_libc_inotify", lambda: None)
+    elif workers._libc_inotify() is None:
+        pytest.skip("inotify is not available")
+    return request.param
+
+
+def later(delay, action):
+    timer = threading.Timer(delay, action)
+    timer.start()
+    return timer
+
+
+def test_wait_for_path(tmpdir, inotify):
+    path = str(tmpdir.join("logs", "tmp"))
+    timer = later(0.2, lambda: os.makedirs(path))
+    assert workers.wait_for_path(path, timeout=5)
+    timer.join()
+    assert not workers.wait_for_path(str(tmpdir.join("missing")), timeout=0.2)
+
+
+def test_wait_for_path_stop(tmpdir, inotify):
+    stop = threading.Event()
+    later(0.2, stop.set)
+    start = time.time()
+    assert not workers.wait_for_path(str(tmpdir.join("logs", "tmp")), stop=stop)
+    assert time.time() - start < 0.2 + workers.STOP_PERIOD + 0.5
+
+
+def test_pool_size():
+    assert workers.pool_size(1) == 1
+    assert 1 <= workers.pool_size(10 ** 6) <= workers.pool_size()
+    # The memory of the node caps the pool
+    assert workers.pool_size(worker_memory=10 ** 18) == 1
+
+
+def test_stop_before_manager(tmpdir):
+    pool = workers.WorkerPool(str(tmpdir), n_workers=2)
+    pool.start()
+    time.sleep(0.1)
+    start = time.time()
+    pool.stop(grace=10)
+    # The monitor left wait_for_path without waiting for the grace period, and started nothing
+    assert time.time() - start < workers.STOP_PERIOD + 0.5
+    assert not pool._monitor.is_alive()
+    assert pool.workers == {}